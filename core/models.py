@@ -13,13 +13,18 @@ class Customer(models.Model):
 
     class Meta:
         db_table = 'customers'
+        indexes = [
+            # Distinct customer cities feed DimLocation
+            models.Index(fields=['city'], name='customers_city_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 class Restaurant(models.Model):
     restaurant_id = models.AutoField(primary_key=True)
-    restaurant_name = models.CharField(max_length=255, null=True, blank=True)
+    # Natural key used by ETLService._get_or_create_restaurant
+    restaurant_name = models.CharField(max_length=255, unique=True, null=True, blank=True)
     cuisine_type = models.CharField(max_length=100, null=True, blank=True)
     address = models.CharField(max_length=255, null=True, blank=True)
     city = models.CharField(max_length=100, null=True, blank=True)
@@ -39,7 +44,7 @@ class Restaurant(models.Model):
 
 class Day(models.Model):
     day_id = models.AutoField(primary_key=True)
-    day_name = models.CharField(max_length=50, null=True, blank=True)
+    day_name = models.CharField(max_length=50, unique=True, null=True, blank=True)
     is_weekend = models.BooleanField(null=True, blank=True)
     is_holiday = models.BooleanField(null=True, blank=True)
 
@@ -74,7 +79,8 @@ class DeliveryPerson(models.Model):
         return f"{self.first_name} {self.last_name}"
 
 class Order(models.Model):
-    order_id = models.IntegerField()
+    # Natural key of the source data; unique so concurrent get_or_create calls cannot duplicate it
+    order_id = models.IntegerField(unique=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, db_column='customer_id')
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, db_column='restaurant_id')
     day = models.ForeignKey(Day, on_delete=models.CASCADE, db_column='day_id')
@@ -102,6 +108,9 @@ class DimCustomer(models.Model):
     class Meta:
         db_table = 'dim_customer'
         app_label = 'core'
+        indexes = [
+            models.Index(fields=['segment', 'customer_id'], name='dim_customer_segment_idx'),
+        ]
 
     def __str__(self):
         return self.customer_name
@@ -116,6 +125,9 @@ class DimRestaurant(models.Model):
     class Meta:
         db_table = 'dim_restaurant'
         app_label = 'core'
+        indexes = [
+            models.Index(fields=['cuisine_type', 'restaurant_id'], name='dim_restaurant_cuisine_idx'),
+        ]
 
     def __str__(self):
         return self.restaurant_name
@@ -147,6 +159,9 @@ class DimLocation(models.Model):
     class Meta:
         db_table = 'dim_location'
         app_label = 'core'
+        indexes = [
+            models.Index(fields=['city', 'location_id'], name='dim_location_city_idx'),
+        ]
 
     def __str__(self):
         return f"{self.neighborhood}, {self.city}"
@@ -181,6 +196,8 @@ class DimDeliveryPerson(models.Model):
 
 
 class FactOrders(models.Model):
+    # When fact_orders is RANGE partitioned by date_id (partition_fact_orders),
+    # the physical primary key is (order_id, date_id) and it has no foreign keys
     order_id = models.IntegerField(primary_key=True)
     customer = models.ForeignKey(DimCustomer, on_delete=models.CASCADE, db_column='customer_id')
     restaurant = models.ForeignKey(DimRestaurant, on_delete=models.CASCADE, db_column='restaurant_id')
@@ -195,10 +212,113 @@ class FactOrders(models.Model):
     food_preparation_time = models.IntegerField(null=True, blank=True)
     delivery_time = models.IntegerField(null=True, blank=True)
     total_time = models.IntegerField(null=True, blank=True)
+    # Change tracking for incremental (delta) exports
+    etl_version = models.IntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         db_table = 'fact_orders'
         app_label = 'core'
+        indexes = [
+            # Keyset pagination by date within a customer or restaurant
+            models.Index(fields=['customer', 'date', 'order_id'], name='fact_orders_cust_date_idx'),
+            models.Index(fields=['restaurant', 'date', 'order_id'], name='fact_orders_rest_date_idx'),
+            # Covering indexes for date-range filters / monthly revenue and
+            # per-restaurant revenue and rating aggregates
+            models.Index(fields=['order_date', 'order_cost'], name='fact_orders_date_cost_idx'),
+            models.Index(fields=['restaurant', 'order_cost', 'rating'], name='fact_orders_rest_cost_idx'),
+        ]
 
     def __str__(self):
         return f"Fact Order {self.order_id}"
+
+
+class WarehouseRun(models.Model):
+    """
+    One warehouse ETL run. The auto-increment primary key is the etl_version
+    the run stamps on the fact rows it writes, so overlapping runs never share
+    a version. Delta exports only go up to versions whose runs have finished.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('committed', 'Committed'),
+        ('failed', 'Failed'),
+    ]
+
+    version = models.AutoField(primary_key=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'warehouse_runs'
+        app_label = 'core'
+        indexes = [
+            models.Index(fields=['status', 'started_at'], name='warehouse_runs_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Warehouse Run {self.version} ({self.status})"
+
+
+class FactOrdersArchive(models.Model):
+    """
+    Cold tier of fact_orders: rows older than ETL_ARCHIVE_AFTER_MONTHS are
+    moved here by archive_fact_orders. Dimension keys are kept without
+    constraints or per-key indexes to keep the (compressed) table compact.
+    """
+    order_id = models.IntegerField(primary_key=True)
+    customer = models.ForeignKey(DimCustomer, on_delete=models.DO_NOTHING, db_column='customer_id',
+                                 db_constraint=False, db_index=False, related_name='+')
+    restaurant = models.ForeignKey(DimRestaurant, on_delete=models.DO_NOTHING, db_column='restaurant_id',
+                                   db_constraint=False, db_index=False, related_name='+')
+    delivery_person = models.ForeignKey(DimDeliveryPerson, on_delete=models.DO_NOTHING, db_column='delivery_person_id',
+                                        db_constraint=False, db_index=False, related_name='+')
+    date = models.ForeignKey(DimDate, on_delete=models.DO_NOTHING, db_column='date_id',
+                             db_constraint=False, db_index=False, related_name='+')
+    location = models.ForeignKey(DimLocation, on_delete=models.DO_NOTHING, db_column='location_id',
+                                 db_constraint=False, db_index=False, related_name='+')
+    time_slot = models.ForeignKey(DimTimeslot, on_delete=models.DO_NOTHING, db_column='time_slot_id',
+                                  db_constraint=False, db_index=False, related_name='+')
+    order_date = models.DateField(null=True, blank=True)
+    order_time = models.TimeField(null=True, blank=True)
+    order_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    rating = models.IntegerField(null=True, blank=True)
+    food_preparation_time = models.IntegerField(null=True, blank=True)
+    delivery_time = models.IntegerField(null=True, blank=True)
+    total_time = models.IntegerField(null=True, blank=True)
+    etl_version = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'fact_orders_archive'
+        app_label = 'core'
+        indexes = [
+            models.Index(fields=['date', 'restaurant'], name='fact_archive_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived Fact Order {self.order_id}"
+
+
+class FactOrderSketch(models.Model):
+    """Mergeable quantile and distinct-count sketches per restaurant and day."""
+    restaurant = models.ForeignKey(DimRestaurant, on_delete=models.CASCADE, db_column='restaurant_id')
+    date = models.ForeignKey(DimDate, on_delete=models.CASCADE, db_column='date_id')
+    order_count = models.IntegerField(default=0)
+    delivery_time_digest = models.TextField(null=True, blank=True)
+    preparation_time_digest = models.TextField(null=True, blank=True)
+    customer_hll = models.TextField(null=True, blank=True)
+    etl_version = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'fact_order_sketches'
+        app_label = 'core'
+        unique_together = [('restaurant', 'date')]
+        indexes = [
+            models.Index(fields=['date', 'restaurant'], name='fact_sketch_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order Sketch {self.restaurant_id}/{self.date_id}"
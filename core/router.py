@@ -1,34 +1,141 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+from core.sharding import get_shard_aliases
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a measured replica lag is reused before the replica is asked again
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+_lag_checks = {}
+_lag_checks_lock = threading.Lock()
+
+
+def get_replica_lag(alias: str) -> Optional[float]:
+    """
+    Measure how far a replica is behind its primary.
+
+    Args:
+        alias: Database alias of the replica
+
+    Returns:
+        Replication lag in seconds, or None if replication is not running.
+        Backends without replication status (e.g. SQLite) report no lag.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'mysql':
+        return 0.0
+
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except Exception:
+            # MySQL before 8.0.22 / MariaDB
+            cursor.execute('SHOW SLAVE STATUS')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        status = dict(zip([column[0] for column in cursor.description], row))
+
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return None if lag is None else float(lag)
+
+
+def read_replica_for(alias: str) -> str:
+    """
+    Pick the alias to run a read-only query for `alias` on.
+
+    Returns the replica configured in DATABASE_REPLICAS when its replication
+    lag is within DATABASE_REPLICA_MAX_LAG_SECONDS, and the primary alias
+    otherwise (no replica, replication stopped or lagging, replica down).
+    Only use it for reads that tolerate slightly stale data; reads that must
+    see the caller's own writes stay on the primary.
+
+    Args:
+        alias: Primary database alias ('default' or 'olapdb')
+
+    Returns:
+        Database alias to read from
+    """
+    replica = getattr(settings, 'DATABASE_REPLICAS', {}).get(alias)
+    if not replica or replica not in settings.DATABASES:
+        return alias
+
+    max_lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG_SECONDS', 30)
+    now = time.monotonic()
+    with _lag_checks_lock:
+        checked = _lag_checks.get(replica)
+    if checked is not None and now - checked[0] < REPLICA_LAG_CHECK_INTERVAL:
+        return replica if checked[1] else alias
+
+    try:
+        lag = get_replica_lag(replica)
+    except Exception as e:
+        logger.warning(f"Error checking replication lag of {replica}: {str(e)}")
+        lag = None
+
+    healthy = lag is not None and lag <= max_lag
+    if not healthy:
+        logger.warning(f"Replica {replica} is unavailable or lagging ({lag}s), reading {alias} from the primary")
+    with _lag_checks_lock:
+        _lag_checks[replica] = (now, healthy)
+    return replica if healthy else alias
+
+
 class DatabaseRouter:
     """
-    A router to control all database operations on models
+    A router to control all database operations on models.
+    
+    Reads and writes go to the primary aliases; callers that tolerate
+    replication lag opt into replicas with read_replica_for().
     """
     
     # Models that should use the olapdb (data warehouse)
     olap_models = {
         'DimCustomer', 'DimRestaurant', 'DimDate', 'DimLocation', 
-        'DimTimeslot', 'DimDeliveryPerson', 'FactOrders'
+        'DimTimeslot', 'DimDeliveryPerson', 'FactOrders', 'FactOrderSketch',
+        'FactOrdersArchive', 'WarehouseRun'
     }
     
     # ETL models that should also use olapdb
     etl_models = {
-        'ETLJob', 'DataUpload'
+        'ETLJob', 'DataUpload', 'ExportJob'
     }
     
     def db_for_read(self, model, **hints):
         """Suggest the database to read from."""
         if model._meta.object_name in self.olap_models or model._meta.object_name in self.etl_models:
             return 'olapdb'
-        return 'default'
+        return self._oltp_db(hints)
     
     def db_for_write(self, model, **hints):
         """Suggest the database to write to."""
         if model._meta.object_name in self.olap_models or model._meta.object_name in self.etl_models:
             return 'olapdb'
+        return self._oltp_db(hints)
+    
+    def _oltp_db(self, hints):
+        """
+        OLTP rows related to an instance are on the instance's database (its
+        order shard or a replica), since every shard carries the reference tables.
+        """
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
         return 'default'
     
     def allow_relation(self, obj1, obj2, **hints):
         """Allow relations if models are in the same database."""
         db_set = {'default', 'olapdb'}
+        db_set.update(get_shard_aliases())
+        db_set.update(getattr(settings, 'DATABASE_REPLICAS', {}).values())
         if obj1._state.db in db_set and obj2._state.db in db_set:
             return True
         return None
@@ -39,14 +146,14 @@ class DatabaseRouter:
             # Allow data warehouse models and ETL models in olapdb
             return model_name and model_name.lower() in [
                 'dimcustomer', 'dimrestaurant', 'dimdate', 'dimlocation',
-                'dimtimeslot', 'dimdeliveryperson', 'factorders',
-                'etljob', 'dataupload'
+                'dimtimeslot', 'dimdeliveryperson', 'factorders', 'factordersketch', 'factordersarchive',
+                'warehouserun', 'etljob', 'dataupload', 'exportjob'
             ]
-        elif db == 'default':
-            # Only allow OLTP models in default database (exclude warehouse and ETL models)
+        elif db == 'default' or db in get_shard_aliases():
+            # Only allow OLTP models in default database and the order shards (exclude warehouse and ETL models)
             return model_name and model_name.lower() not in [
                 'dimcustomer', 'dimrestaurant', 'dimdate', 'dimlocation',
-                'dimtimeslot', 'dimdeliveryperson', 'factorders',
-                'etljob', 'dataupload'
+                'dimtimeslot', 'dimdeliveryperson', 'factorders', 'factordersketch', 'factordersarchive',
+                'warehouserun', 'etljob', 'dataupload', 'exportjob'
             ]
         return False
@@ -0,0 +1,53 @@
+"""
+Horizontal sharding of the OLTP orders database by customer_id.
+
+ORDER_SHARDS lists the database aliases holding orders, the first of which
+is 'default'. A customer and all of their orders live on one shard,
+chosen by customer_id modulo the number of shards. The reference tables
+(restaurants, days and delivery persons) are replicated to every shard with
+identical primary keys, so orders can reference them locally; the first
+shard holds the authoritative copy.
+
+Changing the number of shards moves customers between shards, so adding a
+shard requires redistributing existing customers and orders.
+"""
+
+from typing import List
+
+from django.conf import settings
+
+
+# Models whose rows are partitioned across shards by customer_id
+SHARDED_MODELS = {'Customer', 'Order'}
+
+# Models copied in full to every shard
+REFERENCE_MODELS = {'Restaurant', 'Day', 'DeliveryPerson'}
+
+
+def get_shard_aliases() -> List[str]:
+    """Database aliases of the order shards, in shard order."""
+    return list(getattr(settings, 'ORDER_SHARDS', None) or ['default'])
+
+
+def is_sharded() -> bool:
+    """Whether orders are spread over more than one database."""
+    return len(get_shard_aliases()) > 1
+
+
+def reference_alias() -> str:
+    """Alias holding the authoritative copy of the reference tables."""
+    return get_shard_aliases()[0]
+
+
+def shard_for_customer(customer_id: int) -> str:
+    """
+    Database alias holding a customer and their orders.
+
+    Args:
+        customer_id: Natural key of the customer
+
+    Returns:
+        Alias of the customer's shard
+    """
+    aliases = get_shard_aliases()
+    return aliases[int(customer_id) % len(aliases)]
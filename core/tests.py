@@ -1,3 +1,43 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
 
-# Create your tests here.
+from core.router import DatabaseRouter
+from core.sharding import get_shard_aliases, is_sharded, reference_alias, shard_for_customer
+
+
+# Run with: python manage.py test --settings=dataWarehouse.settings_test
+
+@override_settings(ORDER_SHARDS=['default', 'orders_shard_1'])
+class ShardingTests(SimpleTestCase):
+
+    def test_customers_are_placed_by_customer_id_modulo_shard_count(self):
+        self.assertEqual(shard_for_customer(10), 'default')
+        self.assertEqual(shard_for_customer(11), 'orders_shard_1')
+        self.assertEqual(shard_for_customer('11'), 'orders_shard_1')
+
+    def test_first_shard_holds_the_reference_tables(self):
+        self.assertTrue(is_sharded())
+        self.assertEqual(reference_alias(), 'default')
+
+    @override_settings(ORDER_SHARDS=None)
+    def test_unsharded_default(self):
+        self.assertEqual(get_shard_aliases(), ['default'])
+        self.assertFalse(is_sharded())
+
+
+@override_settings(ORDER_SHARDS=['default', 'orders_shard_1'])
+class RouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = DatabaseRouter()
+
+    def test_oltp_tables_are_migrated_on_every_shard(self):
+        for alias in ('default', 'orders_shard_1'):
+            self.assertTrue(self.router.allow_migrate(alias, 'core', model_name='order'))
+            self.assertFalse(self.router.allow_migrate(alias, 'core', model_name='factorders'))
+            self.assertFalse(self.router.allow_migrate(alias, 'etl', model_name='etljob'))
+
+    def test_warehouse_and_etl_tables_are_migrated_on_olapdb(self):
+        self.assertTrue(self.router.allow_migrate('olapdb', 'core', model_name='factorders'))
+        self.assertTrue(self.router.allow_migrate('olapdb', 'core', model_name='warehouserun'))
+        self.assertTrue(self.router.allow_migrate('olapdb', 'etl', model_name='etljob'))
+        self.assertFalse(self.router.allow_migrate('olapdb', 'core', model_name='order'))
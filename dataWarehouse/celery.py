@@ -4,6 +4,7 @@ Celery configuration for dataWarehouse project.
 
 import os
 from celery import Celery
+from kombu import Queue
 
 # Set the default Django settings module for the 'celery' program.
 # Use Docker settings if we're in a Docker environment
@@ -28,10 +29,52 @@ app.conf.beat_schedule = {
         'schedule': 60.0 * 60.0 * 24.0,  # Run every 24 hours
         # 'schedule': crontab(hour=0, minute=0),  # Run at midnight
     },
+    'dispatch-pending-etl-jobs': {
+        'task': 'etl.tasks.scheduled_etl_processing',
+        'schedule': 60.0,  # Queue pending jobs and jobs whose queued lease expired
+    },
+    'archive-old-facts-weekly': {
+        'task': 'etl.tasks.archive_old_facts',
+        'schedule': 60.0 * 60.0 * 24.0 * 7,  # Run every week
+    },
 }
 
 app.conf.timezone = 'UTC'
 
+# Task queues, one per workload, so a long warehouse run never holds up an
+# upload. Each queue is served by its own workers (see docker-compose.yml),
+# whose --concurrency caps the workload.
+app.conf.task_queues = [
+    Queue('ingest'),       # Uploaded files: split, chunk ingest and merge
+    Queue('warehouse'),    # Warehouse ETL runs and rebuilds
+    Queue('export'),       # Data exports
+    Queue('maintenance'),  # Periodic housekeeping
+]
+app.conf.task_default_queue = 'ingest'
+
+# Priorities order tasks within a queue; with Redis, 0 is the highest priority.
+# Finishing a file comes before starting the next one, and a nightly run or
+# rebuild waits for the warehouse refreshes that follow uploads.
+app.conf.task_routes = {
+    'etl.tasks.process_etl_file_async': {'queue': 'ingest', 'priority': 6},
+    'etl.tasks.ingest_etl_chunk': {'queue': 'ingest', 'priority': 3},
+    'etl.tasks.merge_etl_chunks': {'queue': 'ingest', 'priority': 0},
+    'etl.tasks.run_warehouse_etl_async': {'queue': 'warehouse', 'priority': 3},
+    'etl.tasks.run_nightly_etl': {'queue': 'warehouse', 'priority': 6},
+    'etl.tasks.rebuild_warehouse_async': {'queue': 'warehouse', 'priority': 9},
+    'etl.tasks.export_data_async': {'queue': 'export', 'priority': 3},
+    'etl.tasks.scheduled_etl_processing': {'queue': 'maintenance', 'priority': 6},
+    'etl.tasks.archive_old_facts': {'queue': 'maintenance', 'priority': 9},
+}
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
+
+# Reserve one task at a time, so priorities apply and a long task does not
+# keep other tasks waiting behind it on a busy worker
+app.conf.worker_prefetch_multiplier = 1
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
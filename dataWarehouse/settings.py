@@ -84,7 +84,13 @@ DATABASES = {
         'PORT': '3307',
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            # Concurrent ingest workers must see each other's committed natural keys
+            'isolation_level': 'read committed',
         },
+        # Persistent connections, pinged before reuse, so ETL pool threads and
+        # Celery workers do not reconnect for every task
+        'CONN_MAX_AGE': 300,
+        'CONN_HEALTH_CHECKS': True,
     },
     'olapdb': {
         'ENGINE': 'django.db.backends.mysql',
@@ -96,9 +102,23 @@ DATABASES = {
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        'CONN_MAX_AGE': 300,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Order shards, keyed by customer_id modulo the shard count (see core.sharding).
+# The first shard must be 'default'; every shard is a database alias with the OLTP
+# schema (python manage.py migrate --database=<alias>), e.g. ['default', 'orders_shard_1']
+ORDER_SHARDS = ['default']
+
+# Optional read replicas, keyed by primary alias (see core.router.read_replica_for), e.g.
+# DATABASES['default_replica'] = {**DATABASES['default'], 'HOST': '127.0.0.1', 'PORT': '3308',
+#                                 'TEST': {'MIRROR': 'default'}}
+# DATABASE_REPLICAS = {'default': 'default_replica'}
+DATABASE_REPLICAS = {}
+DATABASE_REPLICA_MAX_LAG_SECONDS = 30  # Replicas further behind are bypassed for the primary
+
 # Database routers
 DATABASE_ROUTERS = ['core.router.DatabaseRouter']
 
@@ -153,6 +173,43 @@ LOGOUT_REDIRECT_URL = '/etl/login/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ETL Configuration
+ETL_EXPORT_CHUNK_SIZE = 50000  # Rows per parallel export chunk
+ETL_INGEST_CHUNK_SIZE = 5000  # Rows per Celery ingest task of an uploaded file
+ETL_INGEST_CHUNK_DIR = MEDIA_ROOT / 'etl_chunks'  # Chunk files, on storage shared by all workers
+ETL_EXPORT_MAX_WORKERS = 4
+ETL_EXPORT_DIR = BASE_DIR / 'exports'  # Export files; not under MEDIA_ROOT, they are served by the export_download view
+ETL_RUN_TIMEOUT_SECONDS = 21600  # A warehouse run still open after this long is treated as dead and stops holding back the export watermark
+ETL_COLUMNAR_SNAPSHOT_ENABLED = False  # Serve analytics from memory-mapped NumPy snapshots
+ETL_COLUMNAR_SNAPSHOT_DIR = BASE_DIR / 'snapshots'
+ETL_DUCKDB_MIRROR_PATH = None  # e.g. BASE_DIR / 'mirror' / 'warehouse.duckdb' to enable the DuckDB mirror
+ETL_FACT_PARTITION_MONTHS_AHEAD = 3  # Monthly fact_orders partitions kept ahead of the data
+ETL_ARCHIVE_AFTER_MONTHS = 12  # Fact orders older than this move to fact_orders_archive
+ETL_SKETCH_WINDOW_DAYS = 30  # Days of sketches merged for percentiles when no start_date is given
+ETL_REBUILD_RATE_LIMIT = '2/h'  # Celery rate limit of full fact_orders rebuilds per warehouse worker
+ETL_JOB_LEASE_SECONDS = 900  # A queued job not started by a worker within this time is queued again
+ETL_JOB_RUNNING_LEASE_SECONDS = 1800  # A running job whose lease is not renewed (its process died) is claimed again
+ETL_JOB_HEARTBEAT_SECONDS = 60  # How often a running job renews its lease
+ETL_SCHEDULER_BATCH_SIZE = 100  # Pending jobs claimed per scheduled_etl_processing run
+ETL_LOCAL_EXECUTOR_WORKERS = 2  # Background threads of a web process processing files when Celery is unavailable
+ETL_LOCAL_EXECUTOR_BACKLOG = 20  # Jobs a web process runs or holds in memory; further jobs stay pending
+ETL_DB_POOL_SIZE = 6  # Worker threads (and connections per database) of the ETL connection pool
+ETL_FACT_PIPELINE_ENABLED = False  # Load facts with overlapping extract/transform/load stages
+ETL_PIPELINE_CHUNK_SIZE = 1000  # Orders per pipeline chunk
+ETL_PIPELINE_QUEUE_SIZE = 4  # Chunks buffered between pipeline stages
+ETL_QUERY_PROFILING_ENABLED = False  # Record per-stage SQL profiles of Celery and auto-triggered ETL runs
+ETL_PROFILE_DIR = BASE_DIR / 'profiles'  # CPU and memory reports of --profile-cpu / --profile-mem runs
+ETL_METRICS_PUBLISH_INTERVAL = 10  # Seconds between publications of a process's metrics to the cache
+ETL_METRICS_PROCESS_TTL = 86400  # Metrics of processes that stopped publishing expire after this many seconds
+ETL_METRICS_TOKEN = None  # Bearer token required by /metrics; without one it is only served when DEBUG is on
+ETL_PROGRESS_PUBLISH_INTERVAL = 1.0  # Seconds between publications of a running job's progress to the cache
+ETL_PROGRESS_TTL = 3600  # Progress of a job expires this many seconds after its last update
+ETL_PROGRESS_STREAM_SECONDS = 60  # Length of one progress event stream before the browser reconnects
+ETL_TRACING_ENABLED = True  # Export trace spans of uploads and ETL runs
+ETL_TRACE_FILE = BASE_DIR / 'traces.jsonl'  # OTLP JSON-lines file the spans are appended to
+ETL_TRACE_FILE_MAX_BYTES = 50 * 1024 * 1024  # The trace file is rotated to ETL_TRACE_FILE.1 past this size
+ETL_TRACE_FILE_BACKUPS = 5  # Rotated trace files kept; the job trace view reads at most these plus the live file
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -68,7 +68,13 @@ DATABASES = {
         'PORT': os.environ.get('DB_PORT', '3306'),
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            # Concurrent ingest workers must see each other's committed natural keys
+            'isolation_level': 'read committed',
         },
+        # Persistent connections, pinged before reuse, so ETL pool threads and
+        # Celery workers do not reconnect for every task
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '300')),
+        'CONN_HEALTH_CHECKS': True,
     },
     'olapdb': {
         'ENGINE': 'django.db.backends.mysql',
@@ -80,9 +86,32 @@ DATABASES = {
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '300')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Order shards, keyed by customer_id modulo the shard count (see core.sharding).
+# ORDERSDB_SHARD_HOSTS lists the extra shards as host:port pairs, e.g. "shard1:3306,shard2:3306"
+ORDER_SHARDS = ['default']
+for _index, _host in enumerate(filter(None, os.environ.get('ORDERSDB_SHARD_HOSTS', '').split(',')), 1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'orders_shard_{_index}'] = {**DATABASES['default'], 'HOST': _host, 'PORT': _port or '3306'}
+    ORDER_SHARDS.append(f'orders_shard_{_index}')
+
+# Optional read replicas, keyed by primary alias (see core.router.read_replica_for)
+DATABASE_REPLICAS = {}
+for _alias, _env_prefix in (('default', 'ORDERSDB'), ('olapdb', 'OLAPDB')):
+    if os.environ.get(f'{_env_prefix}_REPLICA_HOST'):
+        DATABASES[f'{_alias}_replica'] = {
+            **DATABASES[_alias],
+            'HOST': os.environ[f'{_env_prefix}_REPLICA_HOST'],
+            'PORT': os.environ.get(f'{_env_prefix}_REPLICA_PORT', DATABASES[_alias]['PORT']),
+            'TEST': {'MIRROR': _alias},
+        }
+        DATABASE_REPLICAS[_alias] = f'{_alias}_replica'
+DATABASE_REPLICA_MAX_LAG_SECONDS = int(os.environ.get('DATABASE_REPLICA_MAX_LAG_SECONDS', '30'))  # Replicas further behind are bypassed for the primary
+
 # Database routers
 DATABASE_ROUTERS = ['core.router.DatabaseRouter']
 
@@ -124,6 +153,43 @@ LOGIN_URL = '/etl/login/'
 LOGIN_REDIRECT_URL = '/etl/'
 LOGOUT_REDIRECT_URL = '/etl/login/'
 
+# ETL Configuration
+ETL_EXPORT_CHUNK_SIZE = int(os.environ.get('ETL_EXPORT_CHUNK_SIZE', '50000'))  # Rows per parallel export chunk
+ETL_INGEST_CHUNK_SIZE = int(os.environ.get('ETL_INGEST_CHUNK_SIZE', '5000'))  # Rows per Celery ingest task of an uploaded file
+ETL_INGEST_CHUNK_DIR = os.environ.get('ETL_INGEST_CHUNK_DIR', str(MEDIA_ROOT / 'etl_chunks'))  # Chunk files, on the media volume shared by the workers
+ETL_EXPORT_MAX_WORKERS = int(os.environ.get('ETL_EXPORT_MAX_WORKERS', '4'))
+ETL_EXPORT_DIR = os.environ.get('ETL_EXPORT_DIR', str(BASE_DIR / 'exports'))  # Export files; not under MEDIA_ROOT, they are served by the export_download view
+ETL_RUN_TIMEOUT_SECONDS = int(os.environ.get('ETL_RUN_TIMEOUT_SECONDS', '21600'))  # A warehouse run still open after this long is treated as dead and stops holding back the export watermark
+ETL_COLUMNAR_SNAPSHOT_ENABLED = bool(int(os.environ.get('ETL_COLUMNAR_SNAPSHOT_ENABLED', '0')))  # Serve analytics from memory-mapped NumPy snapshots
+ETL_COLUMNAR_SNAPSHOT_DIR = os.environ.get('ETL_COLUMNAR_SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+ETL_DUCKDB_MIRROR_PATH = os.environ.get('ETL_DUCKDB_MIRROR_PATH') or None  # e.g. /app/mirror/warehouse.duckdb to enable the DuckDB mirror
+ETL_FACT_PARTITION_MONTHS_AHEAD = int(os.environ.get('ETL_FACT_PARTITION_MONTHS_AHEAD', '3'))  # Monthly fact_orders partitions kept ahead of the data
+ETL_ARCHIVE_AFTER_MONTHS = int(os.environ.get('ETL_ARCHIVE_AFTER_MONTHS', '12'))  # Fact orders older than this move to fact_orders_archive
+ETL_SKETCH_WINDOW_DAYS = int(os.environ.get('ETL_SKETCH_WINDOW_DAYS', '30'))  # Days of sketches merged for percentiles when no start_date is given
+ETL_REBUILD_RATE_LIMIT = os.environ.get('ETL_REBUILD_RATE_LIMIT', '2/h')  # Celery rate limit of full fact_orders rebuilds per warehouse worker
+ETL_JOB_LEASE_SECONDS = int(os.environ.get('ETL_JOB_LEASE_SECONDS', '900'))  # A queued job not started by a worker within this time is queued again
+ETL_JOB_RUNNING_LEASE_SECONDS = int(os.environ.get('ETL_JOB_RUNNING_LEASE_SECONDS', '1800'))  # A running job whose lease is not renewed (its process died) is claimed again
+ETL_JOB_HEARTBEAT_SECONDS = int(os.environ.get('ETL_JOB_HEARTBEAT_SECONDS', '60'))  # How often a running job renews its lease
+ETL_SCHEDULER_BATCH_SIZE = int(os.environ.get('ETL_SCHEDULER_BATCH_SIZE', '100'))  # Pending jobs claimed per scheduled_etl_processing run
+ETL_LOCAL_EXECUTOR_WORKERS = int(os.environ.get('ETL_LOCAL_EXECUTOR_WORKERS', '2'))  # Background threads of a web process processing files when Celery is unavailable
+ETL_LOCAL_EXECUTOR_BACKLOG = int(os.environ.get('ETL_LOCAL_EXECUTOR_BACKLOG', '20'))  # Jobs a web process runs or holds in memory; further jobs stay pending
+ETL_DB_POOL_SIZE = int(os.environ.get('ETL_DB_POOL_SIZE', '6'))  # Worker threads (and connections per database) of the ETL connection pool
+ETL_FACT_PIPELINE_ENABLED = bool(int(os.environ.get('ETL_FACT_PIPELINE_ENABLED', '0')))  # Load facts with overlapping extract/transform/load stages
+ETL_PIPELINE_CHUNK_SIZE = int(os.environ.get('ETL_PIPELINE_CHUNK_SIZE', '1000'))  # Orders per pipeline chunk
+ETL_PIPELINE_QUEUE_SIZE = int(os.environ.get('ETL_PIPELINE_QUEUE_SIZE', '4'))  # Chunks buffered between pipeline stages
+ETL_QUERY_PROFILING_ENABLED = bool(int(os.environ.get('ETL_QUERY_PROFILING_ENABLED', '0')))  # Record per-stage SQL profiles of Celery and auto-triggered ETL runs
+ETL_PROFILE_DIR = os.environ.get('ETL_PROFILE_DIR', str(BASE_DIR / 'profiles'))  # CPU and memory reports of --profile-cpu / --profile-mem runs
+ETL_METRICS_PUBLISH_INTERVAL = int(os.environ.get('ETL_METRICS_PUBLISH_INTERVAL', '10'))  # Seconds between publications of a process's metrics to the cache
+ETL_METRICS_PROCESS_TTL = int(os.environ.get('ETL_METRICS_PROCESS_TTL', '86400'))  # Metrics of processes that stopped publishing expire after this many seconds
+ETL_METRICS_TOKEN = os.environ.get('ETL_METRICS_TOKEN') or None  # Bearer token required by /metrics; without one it is only served when DEBUG is on
+ETL_PROGRESS_PUBLISH_INTERVAL = float(os.environ.get('ETL_PROGRESS_PUBLISH_INTERVAL', '1.0'))  # Seconds between publications of a running job's progress to the cache
+ETL_PROGRESS_TTL = int(os.environ.get('ETL_PROGRESS_TTL', '3600'))  # Progress of a job expires this many seconds after its last update
+ETL_PROGRESS_STREAM_SECONDS = int(os.environ.get('ETL_PROGRESS_STREAM_SECONDS', '60'))  # Length of one progress event stream before the browser reconnects; below the nginx proxy_read_timeout
+ETL_TRACING_ENABLED = bool(int(os.environ.get('ETL_TRACING_ENABLED', '1')))  # Export trace spans of uploads and ETL runs
+ETL_TRACE_FILE = os.environ.get('ETL_TRACE_FILE', str(BASE_DIR / 'logs' / 'traces.jsonl'))  # Shared by the web and worker containers
+ETL_TRACE_FILE_MAX_BYTES = int(os.environ.get('ETL_TRACE_FILE_MAX_BYTES', str(50 * 1024 * 1024)))  # The trace file is rotated to ETL_TRACE_FILE.1 past this size
+ETL_TRACE_FILE_BACKUPS = int(os.environ.get('ETL_TRACE_FILE_BACKUPS', '5'))  # Rotated trace files kept; the job trace view reads at most these plus the live file
+
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
@@ -0,0 +1,50 @@
+"""
+Test settings for dataWarehouse project.
+
+Runs the test suite on SQLite, with the orders split over two shards:
+
+    python manage.py test --settings=dataWarehouse.settings_test
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_ordersdb.sqlite3',
+    },
+    'orders_shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_orders_shard_1.sqlite3',
+    },
+    'olapdb': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_olapdb.sqlite3',
+    },
+}
+
+ORDER_SHARDS = ['default', 'orders_shard_1']
+DATABASE_REPLICAS = {}
+
+# No migration files are committed; the test databases are created from the models
+MIGRATION_MODULES = {'core': None, 'etl': None}
+
+ETL_TRACING_ENABLED = False
+ETL_COLUMNAR_SNAPSHOT_ENABLED = False
+ETL_DUCKDB_MIRROR_PATH = None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'etl': {
+            'handlers': ['null'],
+            'propagate': False,
+        },
+    },
+}
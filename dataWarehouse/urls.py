@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
+from etl import views as etl_views
 
 def redirect_to_etl(request):
     """Redirect root URL to ETL dashboard."""
@@ -26,4 +27,5 @@ urlpatterns = [
     path('', redirect_to_etl, name='home'),
     path('admin/', admin.site.urls),
     path('etl/', include('etl.urls')),
+    path('metrics', etl_views.metrics, name='metrics'),
 ]
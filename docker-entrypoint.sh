@@ -31,9 +31,15 @@ fi
 
 # Run migrations for web service
 if [ "$1" = "web" ]; then
+    # The repo commits no migration files: generate them from the models first,
+    # then apply them to the OLTP database, the warehouse and every order shard
     echo "Running migrations..."
+    python manage.py makemigrations core etl --noinput
     python manage.py migrate --noinput
     python manage.py migrate --database=olapdb --noinput
+    for shard in $(python manage.py shell -v 0 -c "from django.conf import settings; print(' '.join(settings.ORDER_SHARDS[1:]))"); do
+        python manage.py migrate --database=$shard --noinput
+    done
     
     echo "Collecting static files..."
     python manage.py collectstatic --noinput --clear
@@ -0,0 +1,224 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+from django.conf import settings
+from django.db.models import Count, Sum, Max
+from django.db.models.functions import TruncMonth
+
+from core.models import FactOrders, FactOrdersArchive, FactOrderSketch, DimCustomer
+from core.router import read_replica_for
+from etl import archival, columnar, duckdb_mirror
+from etl.sketches import TDigest, HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def get_dashboard_summary() -> Dict[str, Any]:
+    """
+    Compute the analytics dashboard aggregates.
+
+    Reads the DuckDB mirror or the memory-mapped columnar snapshot when they
+    are enabled, and falls back to querying the warehouse otherwise.
+
+    Returns:
+        Dictionary with the dashboard summary statistics and breakdowns
+    """
+    if duckdb_mirror.is_enabled():
+        try:
+            return duckdb_mirror.dashboard_summary()
+        except Exception as e:
+            logger.error(f"Error reading DuckDB mirror, falling back: {str(e)}")
+
+    if columnar.is_enabled():
+        try:
+            snapshot = columnar.load_snapshot()
+            if snapshot is not None:
+                return snapshot.dashboard_summary()
+        except Exception as e:
+            logger.error(f"Error reading columnar snapshot, falling back to the warehouse: {str(e)}")
+
+    return get_warehouse_dashboard_summary()
+
+
+def get_warehouse_dashboard_summary() -> Dict[str, Any]:
+    """
+    Compute the analytics dashboard aggregates from the warehouse tables.
+
+    The dashboard covers all history, so archived fact rows are aggregated as
+    well and merged with the hot table's results.
+    """
+    using = read_replica_for('olapdb')
+    models = [FactOrders]
+    if archival.needs_archive(using=using):
+        models.append(FactOrdersArchive)
+    
+    totals = {'count': 0, 'revenue': 0, 'costed': 0, 'delivery': 0, 'delivered': 0}
+    by_month, by_restaurant, by_cuisine = {}, {}, {}
+    
+    for model in models:
+        facts = model.objects.using(using)
+        
+        # Get summary statistics
+        summary = facts.aggregate(
+            count=Count('order_id'),
+            revenue=Sum('order_cost'),
+            costed=Count('order_cost'),
+            delivery=Sum('delivery_time'),
+            delivered=Count('delivery_time')
+        )
+        for key in totals:
+            totals[key] += summary[key] or 0
+        
+        # Orders by month
+        orders_by_month = facts.annotate(
+            month=TruncMonth('order_date')
+        ).values('month').annotate(
+            count=Count('order_id'),
+            revenue=Sum('order_cost')
+        ).order_by('month')
+        _merge_counts(by_month, orders_by_month, 'month')
+        
+        # Revenue by restaurant
+        restaurants = facts.values(
+            'restaurant__restaurant_name'
+        ).annotate(
+            revenue=Sum('order_cost'),
+            order_count=Count('order_id')
+        )
+        _merge_counts(by_restaurant, restaurants, 'restaurant__restaurant_name')
+        
+        # Orders by cuisine type
+        cuisines = facts.values(
+            'restaurant__cuisine_type'
+        ).annotate(
+            count=Count('order_id'),
+            revenue=Sum('order_cost')
+        )
+        _merge_counts(by_cuisine, cuisines, 'restaurant__cuisine_type')
+    
+    # Top restaurants by revenue, first 12 months and top 10 cuisines
+    top_restaurants = sorted(by_restaurant.values(), key=lambda row: row['revenue'] or 0, reverse=True)[:10]
+    orders_by_month = sorted(by_month.values(), key=lambda row: (row['month'] is not None, row['month']))[:12]
+    cuisine_stats = sorted(by_cuisine.values(), key=lambda row: row['count'], reverse=True)[:10]
+    
+    # Customer segments
+    customer_segments = DimCustomer.objects.using(using).values(
+        'segment'
+    ).annotate(
+        count=Count('customer_id')
+    ).order_by('-count')
+    
+    return {
+        'total_orders': totals['count'],
+        'total_revenue': float(totals['revenue']),
+        'avg_order_value': float(totals['revenue'] / totals['costed']) if totals['costed'] else 0.0,
+        'avg_delivery_time': float(totals['delivery'] / totals['delivered']) if totals['delivered'] else 0.0,
+        'orders_by_month': orders_by_month,
+        'top_restaurants': top_restaurants,
+        'cuisine_stats': cuisine_stats,
+        'customer_segments': list(customer_segments),
+    }
+
+
+def _merge_counts(merged: Dict[Any, Dict[str, Any]], rows, key: str) -> None:
+    """Add grouped count/revenue rows into merged, keyed on one column."""
+    for row in rows:
+        entry = merged.get(row[key])
+        if entry is None:
+            merged[row[key]] = dict(row)
+            continue
+        for field, value in row.items():
+            if field != key and value is not None:
+                entry[field] = (entry[field] or 0) + value
+
+
+def _date_id(value: date) -> int:
+    """Convert a date into a DimDate key (YYYYMMDD)."""
+    return int(value.strftime('%Y%m%d'))
+
+
+def _summarize(count: int, delivery: TDigest, preparation: TDigest, customers: HyperLogLog) -> Dict[str, Any]:
+    summary = {'order_count': count, 'distinct_customers': customers.cardinality() if count else 0}
+    for q in PERCENTILES:
+        label = f"p{int(q * 100)}"
+        summary[f'delivery_{label}'] = delivery.quantile(q)
+        summary[f'preparation_{label}'] = preparation.quantile(q)
+    return summary
+
+
+def get_order_sketch_summary(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                             restaurant_id: Optional[int] = None, top: int = 10,
+                             days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Merge per restaurant/day sketches into delivery and preparation percentiles
+    and distinct customer counts, without touching the fact table.
+
+    Every restaurant/day cell is merged in Python, so the cost grows with the
+    number of cells in the range; keep ranges bounded.
+
+    Args:
+        start_date: First day included (inclusive)
+        end_date: Last day included (inclusive)
+        restaurant_id: Restrict to one restaurant
+        top: Number of restaurants (by order count) in the per-restaurant breakdown
+        days: Without start_date, merge only the last `days` sketched days up
+            to end_date (defaults to ETL_SKETCH_WINDOW_DAYS)
+
+    Returns:
+        Dictionary with the overall summary, a per-restaurant breakdown and
+        the merged date range
+    """
+    sketches = FactOrderSketch.objects.using(read_replica_for('olapdb'))
+    if end_date:
+        sketches = sketches.filter(date_id__lte=_date_id(end_date))
+    if start_date is None:
+        # Window ending on the latest sketched day, so older data stays visible
+        days = days or getattr(settings, 'ETL_SKETCH_WINDOW_DAYS', 30)
+        latest = sketches.aggregate(latest=Max('date_id'))['latest']
+        if latest is not None:
+            end_date = end_date or datetime.strptime(str(latest), '%Y%m%d').date()
+            start_date = datetime.strptime(str(latest), '%Y%m%d').date() - timedelta(days=days - 1)
+    if start_date:
+        sketches = sketches.filter(date_id__gte=_date_id(start_date))
+    if restaurant_id:
+        sketches = sketches.filter(restaurant_id=restaurant_id)
+
+    overall = {'count': 0, 'delivery': TDigest(), 'preparation': TDigest(), 'customers': HyperLogLog()}
+    by_restaurant = {}
+
+    rows = sketches.values_list(
+        'restaurant_id', 'restaurant__restaurant_name', 'order_count',
+        'delivery_time_digest', 'preparation_time_digest', 'customer_hll'
+    )
+    for restaurant, name, count, delivery_data, preparation_data, customers_data in rows.iterator():
+        delivery = TDigest.from_json(delivery_data)
+        preparation = TDigest.from_json(preparation_data)
+        customers = HyperLogLog.from_json(customers_data)
+
+        entry = by_restaurant.setdefault(restaurant, {
+            'name': name, 'count': 0,
+            'delivery': TDigest(), 'preparation': TDigest(), 'customers': HyperLogLog()
+        })
+        for target in (overall, entry):
+            target['count'] += count
+            target['delivery'].merge(delivery)
+            target['preparation'].merge(preparation)
+            target['customers'].merge(customers)
+
+    restaurants: List[Dict[str, Any]] = []
+    ranked = sorted(by_restaurant.items(), key=lambda item: item[1]['count'], reverse=True)[:top]
+    for restaurant, entry in ranked:
+        summary = _summarize(entry['count'], entry['delivery'], entry['preparation'], entry['customers'])
+        summary.update({'restaurant_id': restaurant, 'restaurant_name': entry['name']})
+        restaurants.append(summary)
+
+    return {
+        'overall': _summarize(overall['count'], overall['delivery'], overall['preparation'], overall['customers']),
+        'restaurants': restaurants,
+        'start_date': start_date.isoformat() if start_date else None,
+        'end_date': end_date.isoformat() if end_date else None,
+    }
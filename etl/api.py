@@ -0,0 +1,258 @@
+import base64
+import json
+import logging
+from typing import Dict, List, Any, Tuple
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from core.models import (
+    DimCustomer, DimRestaurant, DimDate, DimLocation,
+    DimTimeslot, DimDeliveryPerson, FactOrders
+)
+from etl.metrics import observe_latency
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Browsable warehouse resources.
+#
+# Every ordering is a tuple of integer columns ending in the primary key so that
+# it is unique and can be used as a keyset cursor. Filters only map to columns
+# that lead an index, optionally followed by the ordering columns. Pages of an
+# equality filter plus its ordering, or of a date range with order=date, are
+# index range scans whatever their depth; a date range with order=order_id
+# walks the primary key and skips rows outside the range.
+API_RESOURCES = {
+    'fact-orders': {
+        'model': FactOrders,
+        'orderings': {
+            'order_id': ('order_id',),
+            'date': ('date_id', 'order_id'),
+        },
+        'default_ordering': 'order_id',
+        'filters': {
+            'customer': 'customer_id',
+            'restaurant': 'restaurant_id',
+            'delivery_person': 'delivery_person_id',
+            'location': 'location_id',
+            'time_slot': 'time_slot_id',
+            'date': 'date_id',
+            'date_from': 'date_id__gte',
+            'date_to': 'date_id__lte',
+        },
+    },
+    'customers': {
+        'model': DimCustomer,
+        'orderings': {'customer_id': ('customer_id',)},
+        'default_ordering': 'customer_id',
+        'filters': {'segment': 'segment'},
+    },
+    'restaurants': {
+        'model': DimRestaurant,
+        'orderings': {'restaurant_id': ('restaurant_id',)},
+        'default_ordering': 'restaurant_id',
+        'filters': {'cuisine': 'cuisine_type'},
+    },
+    'dates': {
+        'model': DimDate,
+        'orderings': {'date_id': ('date_id',)},
+        'default_ordering': 'date_id',
+        'filters': {
+            'date_from': 'date_id__gte',
+            'date_to': 'date_id__lte',
+        },
+    },
+    'locations': {
+        'model': DimLocation,
+        'orderings': {'location_id': ('location_id',)},
+        'default_ordering': 'location_id',
+        'filters': {'city': 'city'},
+    },
+    'timeslots': {
+        'model': DimTimeslot,
+        'orderings': {'time_slot_id': ('time_slot_id',)},
+        'default_ordering': 'time_slot_id',
+        'filters': {},
+    },
+    'delivery-persons': {
+        'model': DimDeliveryPerson,
+        'orderings': {'delivery_person_id': ('delivery_person_id',)},
+        'default_ordering': 'delivery_person_id',
+        'filters': {},
+    },
+}
+
+
+class APIError(Exception):
+    """Raised for invalid API requests; rendered as a 400 response."""
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode the keyset values of the last row into an opaque cursor."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[int]:
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise APIError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, int) for v in values):
+        raise APIError('Invalid cursor')
+    return values
+
+
+def keyset_condition(keys: Tuple[str, ...], values: List[int], descending: bool = False) -> Q:
+    """
+    Build the keyset predicate "after (v1, v2, ...)" as a Q object.
+
+    Django has no public row-value comparison, so (k1, k2) > (v1, v2) is
+    expanded to k1 > v1 OR (k1 = v1 AND k2 > v2), ANDed with the redundant
+    k1 >= v1 that gives the optimizer a range on the leading ordering column.
+
+    Args:
+        keys: Ordering columns
+        values: Values of the ordering columns on the last row of the previous page
+        descending: Whether the page walks the ordering backwards
+
+    Returns:
+        Q object selecting the rows after the cursor
+    """
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for index, key in enumerate(keys):
+        term = Q(**{f'{key}__{lookup}': values[index]})
+        for prior_key, prior_value in zip(keys[:index], values[:index]):
+            term &= Q(**{prior_key: prior_value})
+        condition |= term
+    bound = 'lte' if descending else 'gte'
+    return Q(**{f'{keys[0]}__{bound}': values[0]}) & condition
+
+
+def _parse_fields(model, fields_param: str, ordering_keys: Tuple[str, ...]) -> List[str]:
+    """Validate the requested field list against the model's concrete columns."""
+    available = [field.attname for field in model._meta.concrete_fields]
+    if not fields_param:
+        return available
+
+    fields = [name.strip() for name in fields_param.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise APIError(f"Unknown fields: {', '.join(unknown)}")
+
+    # The cursor is built from the ordering columns, so they are always returned
+    for key in ordering_keys:
+        if key not in fields:
+            fields.append(key)
+    return fields
+
+
+def _parse_filters(model, resource: Dict[str, Any], params) -> Dict[str, Any]:
+    """Convert supported query parameters into validated ORM lookups."""
+    lookups = {}
+    for param, lookup in resource['filters'].items():
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        field = model._meta.get_field(lookup.split('__')[0])
+        try:
+            lookups[lookup] = field.to_python(value)
+        except ValidationError:
+            raise APIError(f"Invalid value for {param}: {value}")
+    return lookups
+
+
+@login_required
+@require_http_methods(["GET"])
+def api_index(request):
+    """List browsable warehouse resources."""
+    return JsonResponse({
+        'resources': {
+            name: {
+                'url': reverse('etl:warehouse_api', args=[name]),
+                'orderings': list(resource['orderings']),
+                'filters': list(resource['filters']),
+                'fields': [field.attname for field in resource['model']._meta.concrete_fields],
+            }
+            for name, resource in API_RESOURCES.items()
+        }
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+@observe_latency('warehouse_api')
+def warehouse_resource(request, resource_name):
+    """
+    Keyset-paginated JSON listing of a warehouse table.
+
+    Query parameters:
+        order: Ordering name (prefix with '-' for descending)
+        cursor: Opaque cursor returned as next_cursor by the previous page
+        limit: Page size (default 100, max 1000)
+        fields: Comma separated list of columns to return
+        <filter>: Any filter listed by the resource
+    """
+    resource = API_RESOURCES.get(resource_name)
+    if resource is None:
+        return JsonResponse({'error': f'Unknown resource: {resource_name}'}, status=404)
+
+    model = resource['model']
+
+    try:
+        order_param = request.GET.get('order', resource['default_ordering'])
+        descending = order_param.startswith('-')
+        ordering_name = order_param.lstrip('-')
+        if ordering_name not in resource['orderings']:
+            raise APIError(f"Unsupported order: {order_param}")
+        ordering_keys = resource['orderings'][ordering_name]
+
+        try:
+            limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise APIError('limit must be an integer')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        fields = _parse_fields(model, request.GET.get('fields', ''), ordering_keys)
+        queryset = model.objects.using('olapdb').filter(**_parse_filters(model, resource, request.GET))
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            values = decode_cursor(cursor, len(ordering_keys))
+            queryset = queryset.filter(keyset_condition(ordering_keys, values, descending))
+
+        order_by = [f'-{key}' if descending else key for key in ordering_keys]
+        # One extra row tells whether another page exists without a COUNT(*)
+        rows = list(queryset.order_by(*order_by).values(*fields)[:limit + 1])
+
+    except APIError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.exception(f"Error browsing {resource_name}: {str(e)}")
+        return JsonResponse({'error': 'Query failed'}, status=500)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor([rows[-1][key] for key in ordering_keys])
+
+    return JsonResponse({
+        'resource': resource_name,
+        'order': order_param,
+        'count': len(rows),
+        'has_more': has_more,
+        'next_cursor': next_cursor,
+        'results': rows,
+    })
@@ -0,0 +1,226 @@
+"""
+Cold-storage tiering of fact_orders.
+
+Fact rows older than ETL_ARCHIVE_AFTER_MONTHS months are moved into
+fact_orders_archive, an InnoDB table stored with ROW_FORMAT=COMPRESSED on
+MySQL, which keeps the hot table and its indexes small enough to stay in the
+buffer pool. When fact_orders is partitioned by month, the archived months
+are swapped out with EXCHANGE PARTITION and dropped instead of row deletes.
+
+Readers that need history (exports, dashboard aggregates, read models) use
+needs_archive() to decide whether a date range reaches into the archive and
+then read both tables. Per restaurant/day sketches are kept for archived days,
+so percentile queries are unaffected.
+"""
+
+import logging
+from datetime import date
+from typing import Dict, List, Any, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.models import FactOrders, FactOrdersArchive
+from etl import partitioning
+
+logger = logging.getLogger(__name__)
+
+
+def get_archive_after_months() -> int:
+    return getattr(settings, 'ETL_ARCHIVE_AFTER_MONTHS', 12)
+
+
+def archive_cutoff(months: int, today: Optional[date] = None) -> int:
+    """
+    First date_id kept in the hot table: the first day of the month that is
+    `months` months before the current month.
+    """
+    today = today or date.today()
+    index = today.year * 12 + (today.month - 1) - months
+    return (index // 12) * 10000 + (index % 12 + 1) * 100 + 1
+
+
+def archive_boundary(using: str = 'olapdb') -> Optional[int]:
+    """Latest date_id present in the archive, or None if it is empty."""
+    return FactOrdersArchive.objects.using(using).aggregate(latest=Max('date_id'))['latest']
+
+
+def needs_archive(start_date: Optional[Any] = None, using: str = 'olapdb') -> bool:
+    """
+    Whether a query starting at start_date (None for all history) has to read
+    archived rows.
+
+    Args:
+        start_date: First day of the queried range, as a date or YYYY-MM-DD string
+        using: Database alias of the warehouse
+
+    Returns:
+        True if the archive holds rows on or after start_date
+    """
+    boundary = archive_boundary(using)
+    if boundary is None:
+        return False
+    if start_date is None:
+        return True
+    if isinstance(start_date, str):
+        start_date_id = int(start_date.replace('-', ''))
+    else:
+        start_date_id = int(start_date.strftime('%Y%m%d'))
+    return start_date_id <= boundary
+
+
+def ensure_archive_compressed(using: str = 'olapdb') -> None:
+    """Store the archive table compressed (MySQL InnoDB only)."""
+    connection = connections[using]
+    if connection.vendor != 'mysql':
+        return
+
+    table = FactOrdersArchive._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT ROW_FORMAT FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, [table])
+        row = cursor.fetchone()
+        if row and row[0] != 'Compressed':
+            logger.info(f"Compressing {table}")
+            cursor.execute(f'ALTER TABLE {table} ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8')
+
+
+def _archive_row(fact_order: FactOrders) -> FactOrdersArchive:
+    return FactOrdersArchive(**{
+        field.attname: getattr(fact_order, field.attname)
+        for field in FactOrders._meta.concrete_fields
+    })
+
+
+STAGING_TABLE_PREFIX = f'{FactOrders._meta.db_table}_archiving_'
+
+
+def _staging_tables(using: str) -> List[str]:
+    """Tables holding detached partitions that are not copied into the archive yet."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("""
+            SELECT TABLE_NAME FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s
+            ORDER BY TABLE_NAME
+        """, [STAGING_TABLE_PREFIX.replace('_', '\\_') + '%'])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _copy_staging_table(staging: str, batch_size: int, using: str) -> int:
+    """Copy a detached partition into the archive in order_id batches, then drop it."""
+    columns = ', '.join(field.column for field in FactOrders._meta.concrete_fields)
+    archive = FactOrdersArchive._meta.db_table
+    connection = connections[using]
+
+    copied = 0
+    last_id = None
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            after = '' if last_id is None else 'WHERE order_id > %s'
+            cursor.execute(f"""
+                SELECT MIN(order_id), MAX(order_id), COUNT(*) FROM (
+                    SELECT order_id FROM {staging} {after} ORDER BY order_id LIMIT %s
+                ) batch
+            """, ([] if last_id is None else [last_id]) + [batch_size])
+            first_id, batch_last_id, count = cursor.fetchone()
+            if not count:
+                break
+            # Re-archiving an order replaces its previous archived copy
+            cursor.execute(f"""
+                REPLACE INTO {archive} ({columns}, archived_at)
+                SELECT {columns}, %s FROM {staging} WHERE order_id BETWEEN %s AND %s
+            """, [timezone.now(), first_id, batch_last_id])
+        copied += count
+        last_id = batch_last_id
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {staging}')
+    return copied
+
+
+def _archive_partitions(cutoff: int, batch_size: int, using: str) -> Tuple[int, List[str]]:
+    """
+    Move the monthly partitions before cutoff into the archive.
+
+    Each partition is detached into a staging table (EXCHANGE and DROP
+    PARTITION under a table lock, see partitioning.detach_partition), so no
+    upsert is lost between copying and dropping it. The staging table is then
+    copied into the archive and dropped. Staging tables left by an
+    interrupted run are copied first.
+    """
+    archived = 0
+    for staging in _staging_tables(using):
+        logger.info(f"Resuming archival of {staging}")
+        archived += _copy_staging_table(staging, batch_size, using)
+
+    dropped = []
+    for name in partitioning.partitions_before(cutoff, using):
+        staging = f'{STAGING_TABLE_PREFIX}{name}'
+        partitioning.detach_partition(name, staging, using=using)
+        dropped.append(name)
+        archived += _copy_staging_table(staging, batch_size, using)
+    return archived, dropped
+
+
+def _archive_rows(cutoff: int, batch_size: int, using: str) -> int:
+    """Move rows before cutoff into the archive, deleting each batch in the transaction that copies it."""
+    archived = 0
+    last_id = None
+    while True:
+        with transaction.atomic(using=using):
+            # Locked until the batch is deleted, so a concurrent upsert waits instead of being lost
+            batch = FactOrders.objects.using(using).select_for_update().filter(date_id__lt=cutoff).order_by('order_id')
+            if last_id is not None:
+                batch = batch.filter(order_id__gt=last_id)
+            fact_orders = list(batch[:batch_size])
+            if not fact_orders:
+                break
+
+            order_ids = [fact_order.order_id for fact_order in fact_orders]
+            # Re-archiving an order replaces its previous archived copy
+            FactOrdersArchive.objects.using(using).filter(order_id__in=order_ids).delete()
+            FactOrdersArchive.objects.using(using).bulk_create(
+                [_archive_row(fact_order) for fact_order in fact_orders]
+            )
+            FactOrders.objects.using(using).filter(order_id__in=order_ids).delete()
+
+        archived += len(order_ids)
+        last_id = order_ids[-1]
+    return archived
+
+
+def archive_facts(months: Optional[int] = None, batch_size: int = 5000,
+                  using: str = 'olapdb') -> Dict[str, Any]:
+    """
+    Move fact rows older than `months` months into the archive.
+
+    On a partitioned table the monthly partitions before the cutoff are
+    detached whole (see _archive_partitions). Remaining rows before the cutoff
+    (all of them on an unpartitioned table, or rows written for a month after
+    its partition was dropped) are moved in order_id batches, each copied and
+    deleted in one transaction.
+
+    Args:
+        months: Age in months after which rows are archived
+        batch_size: Rows moved per transaction
+        using: Database alias of the warehouse
+
+    Returns:
+        Dictionary with the cutoff date_id, archived row count and dropped partitions
+    """
+    months = get_archive_after_months() if months is None else months
+    cutoff = archive_cutoff(months)
+
+    ensure_archive_compressed(using)
+
+    archived, dropped = 0, []
+    if partitioning.is_partitioned(using):
+        archived, dropped = _archive_partitions(cutoff, batch_size, using)
+    archived += _archive_rows(cutoff, batch_size, using)
+
+    logger.info(f"Archived {archived} fact orders before {cutoff}")
+    return {'cutoff': cutoff, 'archived': archived, 'partitions_dropped': dropped}
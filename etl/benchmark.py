@@ -0,0 +1,432 @@
+"""
+Synthetic order data and an end-to-end ETL benchmark.
+
+generate_orders_csv() writes denormalized order CSVs in the upload format at
+any size. Rows are drawn from a seeded generator, so the same arguments
+always produce the same file:
+
+- restaurant and customer popularity follow Zipf-like distributions, so a
+  few restaurants and regular customers account for most orders
+- order cost is log-normal ($4.47 to $35.41), about 39% of ratings are
+  "Not given", and weekday deliveries are slower than weekend ones
+- customer, restaurant and courier attributes are derived from their ids,
+  so an entity looks the same in every row it appears in
+
+run_benchmark() loads such a file with ETLService and then runs each
+DataWarehouseETL stage one after another. For every stage it records the
+wall time, rows per second, peak RSS and the number of SQL queries per
+database alias. The results are plain JSON and compare_results() diffs two
+runs.
+"""
+
+import csv
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.backends import utils as backend_utils
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+CSV_HEADER = [
+    'order_id', 'customer_id', 'restaurant_name', 'cuisine_type', 'cost_of_the_order', 'day_of_the_week',
+    'rating', 'food_preparation_time', 'delivery_time', 'cust_first_name', 'cust_last_name', 'cust_email',
+    'cust_phone', 'cust_address', 'cust_city', 'cust_registration_date', 'rest_address', 'rest_city',
+    'rest_phone', 'rest_website', 'rest_price_range', 'rest_rating_avg', 'rest_opening_hour',
+    'rest_closing_hour', 'rest_established_date', 'is_weekend', 'is_holiday', 'del_first_name',
+    'del_last_name', 'del_phone', 'del_email', 'del_vehicle', 'del_hire_date', 'del_rating',
+    'delivery_person_id', 'tip_amount',
+]
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+    'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Sandra', 'Mark', 'Ashley', 'Wei', 'Priya',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Clark', 'Lewis', 'Robinson', 'Walker', 'Chen',
+]
+CITIES = [
+    'New York', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island', 'Jersey City', 'Hoboken', 'Newark',
+    'Yonkers', 'White Plains', 'New Rochelle', 'Long Island City', 'Astoria', 'Flushing', 'Harlem',
+]
+STREETS = ['Main', 'Oak', 'Maple', 'Cedar', 'Park', 'Elm', 'Washington', 'Lake', 'Hill', 'Broadway']
+CUISINES = [
+    ('American', 0.30), ('Japanese', 0.25), ('Italian', 0.16), ('Chinese', 0.11), ('Mexican', 0.04),
+    ('Indian', 0.04), ('Middle Eastern', 0.025), ('Mediterranean', 0.025), ('Thai', 0.01), ('French', 0.01),
+    ('Southern', 0.01), ('Korean', 0.007), ('Spanish', 0.006), ('Vietnamese', 0.004),
+]
+RESTAURANT_WORDS = ['Blue', 'Golden', 'Little', 'Royal', 'Happy', 'Green', 'Corner', 'Urban', 'Lucky', 'Old']
+RESTAURANT_NOUNS = ['Kitchen', 'Garden', 'House', 'Table', 'Bistro', 'Grill', 'Cafe', 'Spoon', 'Bowl', 'Oven']
+VEHICLES = [('bike', 0.45), ('scooter', 0.35), ('car', 0.20)]
+RATINGS = [('Not given', 0.39), ('5', 0.31), ('4', 0.20), ('3', 0.10)]
+
+# First day of synthetic registration and hire dates, and their spread in days
+DATE_BASE = date(2018, 1, 1)
+DATE_SPAN = 7 * 365
+
+
+def _zipf_cdf(count: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def _pick(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    """Draw 0-based indexes from a cumulative distribution."""
+    return np.minimum(np.searchsorted(cdf, rng.random(size)), len(cdf) - 1)
+
+
+def _choice(rng: np.random.Generator, options, size: int) -> List[str]:
+    values, weights = zip(*options)
+    weights = np.array(weights) / sum(weights)
+    return [values[index] for index in rng.choice(len(values), size=size, p=weights)]
+
+
+def _date(offset: int) -> str:
+    return (DATE_BASE + timedelta(days=int(offset))).isoformat()
+
+
+class _Entities:
+    """Per-entity attributes, derived from ids so they are stable across rows."""
+
+    def __init__(self, customers: int, restaurants: int, couriers: int, seed: int):
+        rng = np.random.default_rng(seed + 1)
+        self.customer_city = _pick(rng, _zipf_cdf(len(CITIES), 0.8), customers)
+        self.customer_registered = rng.integers(0, DATE_SPAN, customers)
+
+        cuisines = _choice(rng, CUISINES, restaurants)
+        self.restaurants = []
+        for index in range(restaurants):
+            name = f"{RESTAURANT_WORDS[index % 10]} {RESTAURANT_NOUNS[index // 10 % 10]} {cuisines[index]} {index + 1}"
+            opening = int(rng.integers(7, 12))
+            self.restaurants.append([
+                name, cuisines[index], f"{int(rng.integers(1, 999))} {STREETS[index % 10]} Ave",
+                CITIES[int(rng.integers(0, len(CITIES)))], f"555-{index % 10000:04d}",
+                f"www.{name.lower().replace(' ', '')}.com", ['$', '$$', '$$$'][int(rng.integers(0, 3))],
+                f"{rng.uniform(3.0, 5.0):.2f}", f"{opening}:00", f"{opening + int(rng.integers(10, 14))}:00",
+                _date(rng.integers(-3650, 0)),
+            ])
+
+        vehicles = _choice(rng, VEHICLES, couriers)
+        self.couriers = []
+        for index in range(couriers):
+            first, last = FIRST_NAMES[index * 7 % 30], LAST_NAMES[index * 11 % 30]
+            self.couriers.append([
+                first, last, f"555-{index % 10000:04d}", f"{first.lower()}.{last.lower()}{index + 1}@courier.example.com",
+                vehicles[index], _date(rng.integers(DATE_SPAN // 2, DATE_SPAN)), f"{rng.uniform(3.5, 5.0):.2f}",
+            ])
+
+    def customer(self, customer_id: int) -> List[str]:
+        first, last = FIRST_NAMES[customer_id * 7919 % 30], LAST_NAMES[customer_id * 104729 % 30]
+        index = customer_id - 1
+        return [
+            first, last, f"{first.lower()}.{last.lower()}{customer_id}@example.com",
+            f"555-{customer_id % 10000000:07d}", f"{customer_id % 9000 + 1} {STREETS[customer_id % 10]} St",
+            CITIES[self.customer_city[index]], _date(self.customer_registered[index]),
+        ]
+
+
+def generate_orders_csv(path: str, rows: int, customers: int = 100000, restaurants: int = 500,
+                        couriers: int = 2000, seed: int = 42, chunk_size: int = 100000,
+                        first_order_id: int = 1000000) -> Dict[str, Any]:
+    """
+    Write a synthetic denormalized orders CSV.
+
+    Args:
+        path: Output file
+        rows: Number of orders
+        customers: Number of distinct customers
+        restaurants: Number of distinct restaurants
+        couriers: Number of distinct delivery persons
+        seed: Random seed; equal arguments give identical files
+        chunk_size: Rows generated per batch
+        first_order_id: order_id of the first row (ids are consecutive)
+
+    Returns:
+        Dictionary with the path, row count, cardinalities and elapsed seconds
+    """
+    start_time = time.monotonic()
+    rng = np.random.default_rng(seed)
+    entities = _Entities(customers, restaurants, couriers, seed)
+    restaurant_cdf = _zipf_cdf(restaurants, 1.1)
+    customer_cdf = _zipf_cdf(customers, 0.6)
+
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_HEADER)
+
+        written = 0
+        while written < rows:
+            size = min(chunk_size, rows - written)
+            customer_ids = _pick(rng, customer_cdf, size) + 1
+            restaurant_index = _pick(rng, restaurant_cdf, size)
+            courier_index = rng.integers(0, couriers, size)
+            weekend = rng.random(size) < 0.71
+            costs = np.clip(np.round(rng.lognormal(np.log(14.5), 0.45, size), 2), 4.47, 35.41)
+            preparation = rng.integers(20, 36, size)
+            delivery = np.where(weekend, rng.integers(15, 30, size), rng.integers(24, 34, size))
+            tips = np.round(costs * rng.uniform(0, 0.15, size), 2)
+            holiday = rng.random(size) < 0.03
+            ratings = _choice(rng, RATINGS, size)
+
+            batch = []
+            for index in range(size):
+                customer_id = int(customer_ids[index])
+                batch.append(
+                    [first_order_id + written + index, customer_id]
+                    + entities.restaurants[restaurant_index[index]][:2]
+                    + [f"{costs[index]:.2f}", 'Weekend' if weekend[index] else 'Weekday', ratings[index],
+                       preparation[index], delivery[index]]
+                    + entities.customer(customer_id)
+                    + entities.restaurants[restaurant_index[index]][2:]
+                    + [bool(weekend[index]), bool(holiday[index])]
+                    + entities.couriers[courier_index[index]]
+                    + [int(courier_index[index]) + 1, f"{tips[index]:.2f}"]
+                )
+            writer.writerows(batch)
+            written += size
+
+    elapsed = time.monotonic() - start_time
+    logger.info(f"Generated {rows} orders into {path} in {elapsed:.2f} seconds")
+    return {
+        'path': path, 'rows': rows, 'customers': customers, 'restaurants': restaurants,
+        'couriers': couriers, 'seed': seed, 'seconds': round(elapsed, 3),
+    }
+
+
+class QueryCounter:
+    """Counts SQL statements per database alias, across all threads."""
+
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, alias: str, statements: int = 1):
+        with self._lock:
+            self.counts[alias] = self.counts.get(alias, 0) + statements
+
+    @contextmanager
+    def counting(self):
+        """Count every statement executed through Django cursors while active."""
+        original = backend_utils.CursorWrapper._execute_with_wrappers
+        counter = self
+
+        def _execute_with_wrappers(cursor, sql, params, many, executor):
+            counter.add(cursor.db.alias)
+            return original(cursor, sql, params, many, executor)
+
+        backend_utils.CursorWrapper._execute_with_wrappers = _execute_with_wrappers
+        try:
+            yield self
+        finally:
+            backend_utils.CursorWrapper._execute_with_wrappers = original
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter (Linux); False where unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+def _measure(name: str, fn, rows_of) -> Dict[str, Any]:
+    """Run one stage and collect its timing, memory and query figures."""
+    per_stage_rss = _reset_peak_rss()
+    counter = QueryCounter()
+    start_time = time.monotonic()
+    with counter.counting():
+        result = fn()
+    elapsed = time.monotonic() - start_time
+
+    rows = rows_of(result)
+    stage = {
+        'seconds': round(elapsed, 3),
+        'rows': rows,
+        'rows_per_second': round(rows / elapsed, 1) if rows is not None and elapsed else None,
+        'peak_rss_mb': _peak_rss_mb(),
+        'peak_rss_scope': 'stage' if per_stage_rss else 'process',
+        'queries': dict(sorted(counter.counts.items())),
+    }
+    logger.info(f"Benchmark stage {name}: {stage}")
+    return stage
+
+
+# DataWarehouseETL stages in run_full_etl order, with the stats key counting their rows
+WAREHOUSE_STAGES = [
+    ('dim_customer', 'extract_dim_customer', 'dim_customer'),
+    ('dim_restaurant', 'extract_dim_restaurant', 'dim_restaurant'),
+    ('dim_date', 'extract_dim_date', 'dim_date'),
+    ('dim_location', 'extract_dim_location', 'dim_location'),
+    ('dim_timeslot', 'extract_dim_timeslot', 'dim_timeslot'),
+    ('dim_deliveryperson', 'extract_dim_deliveryperson', 'dim_deliveryperson'),
+    ('fact_partitions', 'prepare_fact_partitions', None),
+    ('fact_orders', 'extract_fact_orders', 'fact_orders'),
+    ('order_sketches', 'build_order_sketches', 'fact_order_sketches'),
+    ('columnar_snapshot', 'publish_columnar_snapshot', None),
+    ('duckdb_mirror', 'refresh_duckdb_mirror', None),
+]
+
+
+def flush_benchmark_data() -> None:
+    """Delete every OLTP row on all order shards and every warehouse row."""
+    from core.models import (
+        Customer, Restaurant, Day, DeliveryPerson, Order,
+        DimCustomer, DimRestaurant, DimDate, DimLocation, DimTimeslot, DimDeliveryPerson,
+        FactOrders, FactOrdersArchive, FactOrderSketch
+    )
+    from core.sharding import get_shard_aliases
+
+    tables = [(alias, model) for alias in get_shard_aliases()
+              for model in (Order, Customer, Restaurant, Day, DeliveryPerson)]
+    tables += [('olapdb', model) for model in (
+        FactOrders, FactOrdersArchive, FactOrderSketch, DimCustomer, DimRestaurant, DimDate,
+        DimLocation, DimTimeslot, DimDeliveryPerson
+    )]
+    for alias, model in tables:
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def run_benchmark(csv_path: str, pipelined: bool = False, skip_ingest: bool = False) -> Dict[str, Any]:
+    """
+    Time the ingest of a CSV and every warehouse ETL stage.
+
+    Stages run one after another (dimensions are not parallelized), so each
+    stage's figures are its own.
+
+    Args:
+        csv_path: Orders CSV, e.g. from generate_orders_csv()
+        pipelined: Load facts with the pipelined fact load
+        skip_ingest: Only run the warehouse stages on the data already loaded
+
+    Returns:
+        Dictionary with run metadata and per-stage results
+    """
+    from etl.services import ETLService
+    from etl.warehouse_etl import DataWarehouseETL
+
+    with open(csv_path, encoding='utf-8') as csv_file:
+        csv_rows = sum(1 for _ in csv_file) - 1
+
+    results = {
+        'meta': {
+            'started_at': timezone.now().isoformat(),
+            'csv': os.path.abspath(csv_path),
+            'csv_rows': csv_rows,
+            'pipelined': pipelined,
+            'databases': {
+                alias: connections[alias].vendor for alias in settings.DATABASES
+            },
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'stages': {},
+    }
+    stages = results['stages']
+
+    if not skip_ingest:
+        stages['ingest'] = _measure(
+            'ingest', lambda: ETLService().process_csv_file(csv_path), lambda stats: stats['processed']
+        )
+
+    etl = DataWarehouseETL()
+    etl.etl_version = etl._next_etl_version()
+    warehouse_start = time.monotonic()
+    try:
+        for name, method, stats_key in WAREHOUSE_STAGES:
+            if name == 'fact_orders' and pipelined:
+                method = 'extract_fact_orders_pipelined'
+            stages[name] = _measure(
+                name, getattr(etl, method),
+                lambda _, key=stats_key: etl.stats[key]['processed'] if key else None
+            )
+            if name == 'fact_orders' and etl.pipeline_stats:
+                stages[name]['pipeline'] = etl.pipeline_stats
+    except Exception:
+        etl._finish_etl_version('failed')
+        raise
+    etl._finish_etl_version('committed')
+
+    warehouse_seconds = time.monotonic() - warehouse_start
+    stages['warehouse_total'] = {
+        'seconds': round(warehouse_seconds, 3),
+        'rows': csv_rows,
+        'rows_per_second': round(csv_rows / warehouse_seconds, 1) if warehouse_seconds else None,
+    }
+    results['meta']['warehouse_stats'] = etl.stats
+    return results
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Compare two benchmark results stage by stage.
+
+    Returns:
+        One entry per stage present in both runs with both timings and the
+        relative change of seconds, rows/s and query count (None if undefined)
+    """
+    def change(old, new) -> Optional[float]:
+        if old in (None, 0) or new is None:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    comparison = []
+    for name, stage in current['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is None:
+            continue
+        comparison.append({
+            'stage': name,
+            'baseline_seconds': previous['seconds'],
+            'seconds': stage['seconds'],
+            'seconds_change_pct': change(previous['seconds'], stage['seconds']),
+            'rows_per_second_change_pct': change(previous.get('rows_per_second'), stage.get('rows_per_second')),
+            'queries_change_pct': change(
+                sum(previous.get('queries', {}).values()) if 'queries' in previous else None,
+                sum(stage['queries'].values()) if 'queries' in stage else None
+            ),
+        })
+    return comparison
+
+
+def write_results(results: Dict[str, Any], path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2, default=str)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
@@ -0,0 +1,173 @@
+"""
+Claiming of ETL jobs, so that every job is processed once.
+
+A file job moves from pending to queued to running:
+
+- A dispatcher (scheduled_etl_processing) claims pending jobs with
+  SELECT ... FOR UPDATE SKIP LOCKED and marks them queued with a lease of
+  ETL_JOB_LEASE_SECONDS. Concurrent dispatchers skip each other's rows instead
+  of waiting for them, so they never claim the same job.
+- A worker starts a job only if a conditional UPDATE moves it from pending or
+  queued to running. A task delivered twice therefore runs once.
+- A queued job whose lease expired before a worker started it (its message
+  was lost) is claimed again by the next dispatcher.
+- A running job holds a lease of ETL_JOB_RUNNING_LEASE_SECONDS, renewed every
+  ETL_JOB_HEARTBEAT_SECONDS by the process working on it (running_lease).
+  If that process dies, e.g. a web process whose executor was shut down, the
+  lease expires: the next dispatcher claims a file job again and marks any
+  other job failed, so no job stays running forever.
+- A file job handed to a Celery chord is held without a lease (hold_job):
+  its chunks may wait in the queue for longer than any lease, and the chord
+  finishes or fails the job itself. Chord tasks check that their attempt
+  still owns the job (owns_job), so the chord of an attempt that was
+  reclaimed cannot touch the job again.
+"""
+
+import logging
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .connection_pool import release_connections
+from .models import ETLJob
+
+logger = logging.getLogger(__name__)
+
+
+def owner_id() -> str:
+    """Identifies the process claiming a job, as host:pid."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def queued_lease(owner: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fields of a job created already queued, for callers that queue its task
+    themselves; the dispatcher leaves it alone until the lease expires.
+    """
+    return {
+        'status': 'queued',
+        'claimed_by': owner or owner_id(),
+        'lease_expires_at': timezone.now() + timedelta(seconds=settings.ETL_JOB_LEASE_SECONDS),
+    }
+
+
+def _running_lease_expiry():
+    return timezone.now() + timedelta(seconds=settings.ETL_JOB_RUNNING_LEASE_SECONDS)
+
+
+def claim_pending_jobs(limit: int, owner: Optional[str] = None) -> List[int]:
+    """
+    Claim up to limit file jobs that are pending, whose queued lease expired,
+    or whose running lease expired (the process running them died). Jobs
+    without a file whose running lease expired are marked failed.
+
+    Args:
+        limit: Maximum number of jobs to claim
+        owner: Claiming process (defaults to this process)
+
+    Returns:
+        Ids of the claimed jobs, oldest first
+    """
+    now = timezone.now()
+    abandoned = Q(status='running', lease_expires_at__lt=now)
+    ETLJob.objects.filter(abandoned).filter(Q(file_path__isnull=True) | Q(file_path='')).update(
+        status='failed', completed_at=now, lease_expires_at=None,
+        error_message='The process running the job stopped before finishing it'
+    )
+    
+    claimable = Q(status='pending') | Q(status='queued', lease_expires_at__lt=now) | abandoned
+    with transaction.atomic(using=router.db_for_write(ETLJob)):
+        job_ids = list(
+            ETLJob.objects.select_for_update(skip_locked=True)
+            .filter(claimable, file_path__isnull=False)
+            .exclude(file_path='')
+            .order_by('created_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if job_ids:
+            ETLJob.objects.filter(id__in=job_ids).update(**queued_lease(owner))
+    return job_ids
+
+
+def start_job(job_id: int, owner: Optional[str] = None) -> bool:
+    """
+    Move a pending or queued job to running, with a running lease the caller
+    keeps renewing through running_lease().
+
+    Returns:
+        True if this call started the job, False if it was already started
+        or finished (e.g. a duplicate task)
+    """
+    started = ETLJob.objects.filter(id=job_id, status__in=['pending', 'queued']).update(
+        status='running',
+        started_at=timezone.now(),
+        claimed_by=owner or owner_id(),
+        lease_expires_at=_running_lease_expiry(),
+    )
+    return started == 1
+
+
+def renew_lease(job_id: int) -> bool:
+    """
+    Extend the running lease of a job.
+
+    Returns:
+        True if the job is still running
+    """
+    return ETLJob.objects.filter(id=job_id, status='running').update(
+        lease_expires_at=_running_lease_expiry()
+    ) == 1
+
+
+def owns_job(job_id: int, owner: str) -> bool:
+    """True if the job is still running for owner, i.e. no other attempt claimed it since."""
+    return ETLJob.objects.filter(id=job_id, status='running', claimed_by=owner).exists()
+
+
+def hold_job(job_id: int, owner: str) -> bool:
+    """
+    Clear the running lease of a job whose remaining work was handed to a
+    Celery chord, so the dispatcher does not reclaim it while the chord runs.
+
+    Returns:
+        True if owner still held the job
+    """
+    return ETLJob.objects.filter(id=job_id, status='running', claimed_by=owner).update(
+        lease_expires_at=None
+    ) == 1
+
+
+@contextmanager
+def running_lease(job_id: int):
+    """
+    Renew the running lease of a job every ETL_JOB_HEARTBEAT_SECONDS while the
+    enclosed work runs, from a daemon thread that dies with the process.
+    """
+    renew_lease(job_id)
+    stopped = threading.Event()
+
+    def heartbeat():
+        try:
+            while not stopped.wait(settings.ETL_JOB_HEARTBEAT_SECONDS):
+                try:
+                    renew_lease(job_id)
+                except Exception as e:
+                    logger.warning(f"Could not renew the lease of ETL job {job_id}: {str(e)}")
+        finally:
+            release_connections()
+
+    thread = threading.Thread(target=heartbeat, name=f'etl-lease-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
@@ -0,0 +1,275 @@
+"""
+Read-only columnar snapshots of the fact table for in-process analytics.
+
+After each warehouse ETL run the fact table, joined with the dimension
+attributes the dashboards group by, is written as one NumPy array per column.
+Readers open the arrays with mmap, so every gunicorn worker on the host shares
+the same page-cache pages, and aggregate them with vectorized operations.
+
+Layout of ETL_COLUMNAR_SNAPSHOT_DIR:
+
+    CURRENT                  name of the active snapshot directory
+    snapshot-<version>-<ts>/ one .npy file per column plus meta.json
+
+A new snapshot is fully written under a temporary name, renamed into place
+and then published by atomically replacing CURRENT, so readers never see a
+partially written snapshot.
+"""
+
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from datetime import date
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+from django.db.models import Count
+
+from core.models import DimCustomer, FactOrders, FactOrdersArchive
+from etl import archival
+
+logger = logging.getLogger(__name__)
+
+
+EPOCH = date(1970, 1, 1)
+POINTER_FILE = 'CURRENT'
+KEEP_SNAPSHOTS = 2
+
+# Column name -> (array typecode, NumPy dtype)
+COLUMNS = {
+    'order_id': ('q', 'int64'),
+    'order_day': ('i', 'int32'),          # days since 1970-01-01, -1 when unknown
+    'order_cost': ('d', 'float64'),       # NaN when unknown
+    'delivery_time': ('d', 'float64'),
+    'food_preparation_time': ('d', 'float64'),
+    'rating': ('d', 'float64'),
+    'restaurant_code': ('i', 'int32'),    # index into meta['restaurants']
+    'cuisine_code': ('i', 'int32'),       # index into meta['cuisines']
+    'customer_id': ('q', 'int64'),
+}
+
+
+def is_enabled() -> bool:
+    """Whether columnar snapshots are enabled."""
+    return getattr(settings, 'ETL_COLUMNAR_SNAPSHOT_ENABLED', False)
+
+
+def get_snapshot_root() -> str:
+    """Directory holding the snapshots."""
+    return str(getattr(settings, 'ETL_COLUMNAR_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'snapshots')))
+
+
+def _nan(value) -> float:
+    return float('nan') if value is None else float(value)
+
+
+def export_snapshot(version: Optional[int] = None, using: str = 'olapdb', chunk_size: int = 5000) -> str:
+    """
+    Export the fact table and its joined dimension attributes as a new snapshot.
+
+    Args:
+        version: ETL version the snapshot reflects
+        using: Database alias to read from
+        chunk_size: Rows fetched per round trip
+
+    Returns:
+        Path of the published snapshot directory
+    """
+    import numpy as np
+
+    root = get_snapshot_root()
+    os.makedirs(root, exist_ok=True)
+
+    buffers = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+    restaurants, restaurant_codes = [], {}
+    cuisines, cuisine_codes = [], {}
+
+    # Snapshots cover all history: hot rows plus archived rows
+    models = [FactOrders, FactOrdersArchive] if archival.needs_archive(using=using) else [FactOrders]
+    rows = itertools.chain.from_iterable(
+        model.objects.using(using).order_by().values_list(
+            'order_id', 'order_date', 'order_cost', 'delivery_time', 'food_preparation_time',
+            'rating', 'restaurant_id', 'restaurant__restaurant_name', 'restaurant__cuisine_type',
+            'customer_id'
+        ).iterator(chunk_size=chunk_size)
+        for model in models
+    )
+
+    for (order_id, order_date, order_cost, delivery_time, preparation_time,
+         rating, restaurant_id, restaurant_name, cuisine_type, customer_id) in rows:
+        if restaurant_id not in restaurant_codes:
+            restaurant_codes[restaurant_id] = len(restaurants)
+            restaurants.append(restaurant_name)
+        if cuisine_type not in cuisine_codes:
+            cuisine_codes[cuisine_type] = len(cuisines)
+            cuisines.append(cuisine_type)
+
+        buffers['order_id'].append(order_id)
+        buffers['order_day'].append((order_date - EPOCH).days if order_date else -1)
+        buffers['order_cost'].append(_nan(order_cost))
+        buffers['delivery_time'].append(_nan(delivery_time))
+        buffers['food_preparation_time'].append(_nan(preparation_time))
+        buffers['rating'].append(_nan(rating))
+        buffers['restaurant_code'].append(restaurant_codes[restaurant_id])
+        buffers['cuisine_code'].append(cuisine_codes[cuisine_type])
+        buffers['customer_id'].append(customer_id)
+
+    customer_segments = list(
+        DimCustomer.objects.using(using).values('segment').annotate(
+            count=Count('customer_id')
+        ).order_by('-count')
+    )
+
+    name = f"snapshot-{version or 0}-{time.time_ns()}"
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=root)
+    try:
+        for column, (_, dtype) in COLUMNS.items():
+            np.save(os.path.join(staging_dir, f'{column}.npy'), np.frombuffer(buffers[column], dtype=dtype))
+
+        with open(os.path.join(staging_dir, 'meta.json'), 'w') as meta_file:
+            json.dump({
+                'version': version,
+                'rows': len(buffers['order_id']),
+                'restaurants': restaurants,
+                'cuisines': cuisines,
+                'customer_segments': customer_segments,
+            }, meta_file)
+
+        final_dir = os.path.join(root, name)
+        os.rename(staging_dir, final_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # Publish: os.replace is atomic, readers see either the old or the new name
+    pointer_tmp = os.path.join(root, f'.{POINTER_FILE}.{os.getpid()}')
+    with open(pointer_tmp, 'w') as pointer_file:
+        pointer_file.write(name)
+    os.replace(pointer_tmp, os.path.join(root, POINTER_FILE))
+
+    _prune_snapshots(root, keep=name)
+    logger.info(f"Columnar snapshot {name} published with {len(buffers['order_id'])} rows")
+    return final_dir
+
+
+def _prune_snapshots(root: str, keep: str) -> None:
+    """Remove old snapshots. Open mmaps of removed files stay valid until closed."""
+    snapshots = sorted(
+        (entry for entry in os.listdir(root) if entry.startswith('snapshot-') and entry != keep),
+        key=lambda entry: os.path.getmtime(os.path.join(root, entry)),
+        reverse=True
+    )
+    for entry in snapshots[KEEP_SNAPSHOTS - 1:]:
+        shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+class ColumnarSnapshot:
+    """A memory-mapped snapshot with vectorized dashboard aggregations."""
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        self.columns = {
+            column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')
+            for column in COLUMNS
+        }
+
+    def dashboard_summary(self) -> Dict[str, Any]:
+        """Compute the analytics dashboard aggregates, shaped like the ORM results."""
+        import numpy as np
+
+        cost = np.asarray(self.columns['order_cost'])
+        delivery = np.asarray(self.columns['delivery_time'])
+        cost_known = ~np.isnan(cost)
+        cost_filled = np.where(cost_known, cost, 0.0)
+        total_orders = int(cost.shape[0])
+
+        summary = {
+            'total_orders': total_orders,
+            'total_revenue': float(cost_filled.sum()),
+            'avg_order_value': float(cost[cost_known].mean()) if cost_known.any() else 0,
+            'avg_delivery_time': float(np.nanmean(delivery)) if (~np.isnan(delivery)).any() else 0,
+            'customer_segments': self.meta['customer_segments'],
+        }
+
+        # Orders by month
+        days = np.asarray(self.columns['order_day'])
+        dated = days >= 0
+        months = days[dated].astype('datetime64[D]').astype('datetime64[M]')
+        month_values, month_codes = np.unique(months, return_inverse=True)
+        month_counts = np.bincount(month_codes, minlength=len(month_values))
+        month_revenue = np.bincount(month_codes, weights=cost_filled[dated], minlength=len(month_values))
+        summary['orders_by_month'] = [
+            {
+                'month': month.astype('datetime64[D]').item(),
+                'count': int(month_counts[index]),
+                'revenue': float(month_revenue[index]),
+            }
+            for index, month in enumerate(month_values[:12])
+        ]
+
+        # Top restaurants by revenue
+        restaurant_codes = np.asarray(self.columns['restaurant_code'])
+        restaurants = self.meta['restaurants']
+        restaurant_revenue = np.bincount(restaurant_codes, weights=cost_filled, minlength=len(restaurants))
+        restaurant_counts = np.bincount(restaurant_codes, minlength=len(restaurants))
+        top = np.argsort(-restaurant_revenue, kind='stable')[:10]
+        summary['top_restaurants'] = [
+            {
+                'restaurant__restaurant_name': restaurants[code],
+                'revenue': float(restaurant_revenue[code]),
+                'order_count': int(restaurant_counts[code]),
+            }
+            for code in top
+        ]
+
+        # Orders by cuisine type
+        cuisine_codes = np.asarray(self.columns['cuisine_code'])
+        cuisines = self.meta['cuisines']
+        cuisine_counts = np.bincount(cuisine_codes, minlength=len(cuisines))
+        cuisine_revenue = np.bincount(cuisine_codes, weights=cost_filled, minlength=len(cuisines))
+        top = np.argsort(-cuisine_counts, kind='stable')[:10]
+        summary['cuisine_stats'] = [
+            {
+                'restaurant__cuisine_type': cuisines[code],
+                'count': int(cuisine_counts[code]),
+                'revenue': float(cuisine_revenue[code]),
+            }
+            for code in top
+        ]
+
+        return summary
+
+
+_cache_lock = threading.Lock()
+_cached = {'name': None, 'snapshot': None}
+
+
+def load_snapshot() -> Optional[ColumnarSnapshot]:
+    """
+    Get the current snapshot, reloading it when a new one has been published.
+
+    Returns:
+        The active ColumnarSnapshot, or None if no snapshot exists
+    """
+    root = get_snapshot_root()
+    try:
+        with open(os.path.join(root, POINTER_FILE)) as pointer_file:
+            name = pointer_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+    with _cache_lock:
+        if _cached['name'] != name:
+            _cached['snapshot'] = ColumnarSnapshot(os.path.join(root, name))
+            _cached['name'] = name
+        return _cached['snapshot']
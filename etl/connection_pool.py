@@ -0,0 +1,138 @@
+"""
+Bounded pool of ETL worker threads with reusable database connections.
+
+Django opens one connection per thread and alias. Short-lived worker threads
+therefore open fresh connections on every run and leave them to be closed
+by garbage collection. ETLConnectionPool keeps a fixed number of long-lived
+worker threads instead, so each thread's connections are reused across
+tasks and runs:
+
+- at most ETL_DB_POOL_SIZE threads, hence at most that many connections per
+  alias, however many tasks are submitted
+- before each task, connections past CONN_MAX_AGE are closed and, with
+  CONN_HEALTH_CHECKS, reused connections are pinged before the first query
+- a connection a task left unusable is closed instead of being handed to
+  the next task
+- when a worker exits (shutdown() or process exit) it closes its connections
+"""
+
+import atexit
+import concurrent.futures
+import logging
+import queue
+import threading
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+
+def release_connections() -> None:
+    """Close every database connection opened by the current thread."""
+    connections.close_all()
+
+
+class ETLConnectionPool:
+    """
+    Fixed-size pool of worker threads running ETL tasks. Workers are started
+    on first use and idle workers hold no connections until they run a task.
+
+    Tasks submitted from one of the pool's own workers run inline, so nested
+    fan-outs cannot deadlock a saturated pool.
+
+    Args:
+        size: Number of worker threads (and connections per database alias)
+        name: Thread name prefix
+    """
+
+    def __init__(self, size: int, name: str = 'etl-db'):
+        self.size = size
+        self.name = name
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule fn(*args, **kwargs) on a pooled worker.
+
+        Returns:
+            Future resolving to the task's result
+        """
+        future = concurrent.futures.Future()
+        if threading.current_thread() in self._threads:
+            self._run(future, fn, args, kwargs)
+            return future
+
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('ETL connection pool has been shut down')
+            while len(self._threads) < self.size:
+                thread = threading.Thread(
+                    target=self._worker, name=f'{self.name}-{len(self._threads)}', daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def map(self, fn: Callable, *iterables) -> list:
+        """Run fn over the iterables on the pool and return the results in order."""
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers once queued tasks are done and close their connections."""
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+            for _ in threads:
+                self._tasks.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _worker(self):
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                future, fn, args, kwargs = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # Drop connections past CONN_MAX_AGE and schedule the pre-ping
+                close_old_connections()
+                try:
+                    self._run(future, fn, args, kwargs)
+                finally:
+                    # Close connections the task left unusable
+                    close_old_connections()
+        finally:
+            release_connections()
+
+    def _run(self, future: concurrent.futures.Future, fn: Callable, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+
+_pool: Optional[ETLConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ETLConnectionPool:
+    """Process-wide ETL worker pool, sized by ETL_DB_POOL_SIZE."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ETLConnectionPool(getattr(settings, 'ETL_DB_POOL_SIZE', 6))
+            atexit.register(_pool.shutdown)
+        return _pool
+
@@ -0,0 +1,436 @@
+"""
+Optional DuckDB file mirror of the warehouse (fact_orders plus dimensions).
+
+Scan-heavy analytics, exports and ad-hoc SQL run on the mirror with DuckDB's
+columnar vectorized engine instead of on the MySQL instance that also serves
+OLTP ingest.
+
+The mirror is refreshed after every warehouse ETL run. Dimensions are small and
+reloaded in full; fact rows are copied incrementally using the etl_version
+change watermark. Its fact_orders table also holds the archived facts, which are
+copied when the mirror is (re)built.
+
+Refreshes hold an exclusive file lock ({path}.lock), so overlapping warehouse
+runs apply them one after the other. An incremental refresh updates the file in
+place in one transaction. A DuckDB writer blocks readers in other processes, so
+while it runs mirror reads fail and callers fall back to the warehouse. A full
+refresh builds a new file next to the live one and atomically replaces it.
+Readers open a short-lived read-only connection per query.
+"""
+
+import fcntl
+import logging
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, List, Any, Optional, Tuple
+
+from django.conf import settings
+from django.db import models
+
+from core.models import (
+    DimCustomer, DimRestaurant, DimDate, DimLocation,
+    DimTimeslot, DimDeliveryPerson, FactOrders, FactOrdersArchive
+)
+from etl.exports import current_watermark
+
+logger = logging.getLogger(__name__)
+
+
+DIMENSION_MODELS = [
+    DimCustomer, DimRestaurant, DimDate, DimLocation, DimTimeslot, DimDeliveryPerson
+]
+
+STATE_TABLE = 'mirror_state'
+
+READ_ONLY_STATEMENT = re.compile(r'^\s*(select|with|describe|show|summarize|explain|pragma\s+table_info)\b', re.IGNORECASE)
+
+
+class ReadOnlyQueryError(Exception):
+    """Raised when a console query is not a single read-only statement."""
+
+
+def is_enabled() -> bool:
+    """Whether the DuckDB mirror is configured."""
+    return bool(getattr(settings, 'ETL_DUCKDB_MIRROR_PATH', None))
+
+
+def get_mirror_path() -> str:
+    return str(settings.ETL_DUCKDB_MIRROR_PATH)
+
+
+def connect(path: Optional[str] = None, read_only: bool = True):
+    """
+    Open a DuckDB connection to the mirror.
+
+    Read-only connections also disable access to external files and lock the
+    configuration, so console queries cannot reach the filesystem.
+    """
+    import duckdb
+
+    config = {'enable_external_access': False, 'lock_configuration': True} if read_only else {}
+    return duckdb.connect(path or get_mirror_path(), read_only=read_only, config=config)
+
+
+def _column_type(field) -> str:
+    """Map a Django model field to a DuckDB column type."""
+    if isinstance(field, models.ForeignKey):
+        return 'BIGINT'
+    if isinstance(field, models.DecimalField):
+        return f'DECIMAL({field.max_digits}, {field.decimal_places})'
+    if isinstance(field, models.BooleanField):
+        return 'BOOLEAN'
+    if isinstance(field, models.DateTimeField):
+        return 'TIMESTAMP'
+    if isinstance(field, models.DateField):
+        return 'DATE'
+    if isinstance(field, models.TimeField):
+        return 'TIME'
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return 'BIGINT'
+    return 'VARCHAR'
+
+
+def _columns(model) -> List[str]:
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def _create_table(con, model) -> None:
+    columns = ', '.join(
+        f'{field.column} {_column_type(field)}' for field in model._meta.concrete_fields
+    )
+    pk = model._meta.pk.column
+    con.execute(f'CREATE TABLE IF NOT EXISTS {model._meta.db_table} ({columns}, PRIMARY KEY ({pk}))')
+
+
+def _normalize(value):
+    """Convert values pandas cannot hand to DuckDB unambiguously."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        # Stored as naive UTC, like the warehouse itself
+        return value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _load_rows(con, model, rows: List[Tuple], replace_keys: bool) -> None:
+    """Insert a batch of rows, replacing existing rows with the same primary key."""
+    if not rows:
+        return
+    import pandas as pd
+
+    columns = _columns(model)
+    frame = pd.DataFrame.from_records(
+        [[_normalize(value) for value in row] for row in rows], columns=columns
+    )
+    con.register('mirror_batch', frame)
+    try:
+        table = model._meta.db_table
+        pk = model._meta.pk.column
+        if replace_keys:
+            con.execute(f'DELETE FROM {table} WHERE {pk} IN (SELECT {pk} FROM mirror_batch)')
+        column_list = ', '.join(columns)
+        con.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM mirror_batch')
+    finally:
+        con.unregister('mirror_batch')
+
+
+def _values(queryset, model):
+    return queryset.values_list(*[field.attname for field in model._meta.concrete_fields])
+
+
+def refresh_mirror(using: str = 'olapdb', full: bool = False, chunk_size: int = 10000) -> Dict[str, int]:
+    """
+    Bring the mirror up to date with the warehouse.
+
+    Args:
+        using: Database alias to read the warehouse from
+        full: Rebuild the fact table instead of copying changed rows only
+        chunk_size: Fact rows copied per batch
+
+    Returns:
+        Dictionary with the number of rows copied per table
+    """
+    path = get_mirror_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with open(f'{path}.lock', 'w') as lock_file:
+        # One refresh at a time; a second warehouse run waits for the first
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if full or not os.path.exists(path):
+                return _rebuild_mirror(path, using, chunk_size)
+            return _update_mirror(path, using, chunk_size)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _rebuild_mirror(path: str, using: str, chunk_size: int) -> Dict[str, int]:
+    """Build a new mirror file and atomically replace the live one with it."""
+    next_path = f'{path}.next'
+    if os.path.exists(next_path):
+        os.remove(next_path)
+
+    con = connect(next_path, read_only=False)
+    try:
+        stats = _copy_warehouse(con, using, chunk_size)
+        con.execute('CHECKPOINT')
+    except Exception:
+        con.close()
+        if os.path.exists(next_path):
+            os.remove(next_path)
+        raise
+    con.close()
+
+    os.replace(next_path, path)
+    logger.info(f"DuckDB mirror rebuilt at {path}: {stats}")
+    return stats
+
+
+def _update_mirror(path: str, using: str, chunk_size: int) -> Dict[str, int]:
+    """Copy the changes since the mirror's watermark into the live file, in one transaction."""
+    con = connect(path, read_only=False)
+    try:
+        con.begin()
+        try:
+            stats = _copy_warehouse(con, using, chunk_size)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        con.execute('CHECKPOINT')
+    finally:
+        con.close()
+
+    logger.info(f"DuckDB mirror refreshed at {path}: {stats}")
+    return stats
+
+
+def _copy_warehouse(con, using: str, chunk_size: int) -> Dict[str, int]:
+    """Reload the dimensions and copy the fact rows changed since the mirror's watermark."""
+    stats = {}
+    con.execute(f'CREATE TABLE IF NOT EXISTS {STATE_TABLE} (table_name VARCHAR PRIMARY KEY, watermark BIGINT)')
+
+    # Dimensions are small: reload them in full
+    for model in DIMENSION_MODELS:
+        _create_table(con, model)
+        con.execute(f'DELETE FROM {model._meta.db_table}')
+        rows = list(_values(model.objects.using(using).order_by(), model))
+        _load_rows(con, model, rows, replace_keys=False)
+        stats[model._meta.db_table] = len(rows)
+
+    # Facts: copy rows changed since the last refresh, in primary key order
+    _create_table(con, FactOrders)
+    table = FactOrders._meta.db_table
+    state = con.execute(f'SELECT watermark FROM {STATE_TABLE} WHERE table_name = ?', [table]).fetchone()
+    watermark = state[0] if state else 0
+
+    # Only versions whose runs finished writing, like delta exports
+    new_watermark = max(watermark, current_watermark(using))
+    queryset = FactOrders.objects.using(using).filter(etl_version__gt=watermark, etl_version__lte=new_watermark)
+
+    sources = [queryset]
+    if state is None:
+        # New mirror: archived rows never change, so they are copied once here
+        sources.append(FactOrdersArchive.objects.using(using).all())
+
+    copied = 0
+    for source in sources:
+        last_id = None
+        while True:
+            batch = source.order_by('order_id')
+            if last_id is not None:
+                batch = batch.filter(order_id__gt=last_id)
+            rows = list(_values(batch, FactOrders)[:chunk_size])
+            if not rows:
+                break
+            _load_rows(con, FactOrders, rows, replace_keys=True)
+            copied += len(rows)
+            last_id = rows[-1][0]
+
+    con.execute(f'DELETE FROM {STATE_TABLE} WHERE table_name = ?', [table])
+    con.execute(f'INSERT INTO {STATE_TABLE} VALUES (?, ?)', [table, new_watermark])
+    stats[table] = copied
+    return stats
+
+
+def execute_read_only(sql: str, params: Optional[List[Any]] = None, max_rows: int = 1000) -> Dict[str, Any]:
+    """
+    Run a single read-only statement on the mirror.
+
+    Args:
+        sql: SQL statement (SELECT, WITH, DESCRIBE, SHOW, SUMMARIZE or EXPLAIN)
+        params: Positional parameters
+        max_rows: Maximum number of rows returned
+
+    Returns:
+        Dictionary with columns, rows and whether the result was truncated
+    """
+    statement = sql.strip().rstrip(';').strip()
+    if not statement or ';' in statement or not READ_ONLY_STATEMENT.match(statement):
+        raise ReadOnlyQueryError('Only a single SELECT, WITH, DESCRIBE, SHOW, SUMMARIZE or EXPLAIN statement is allowed')
+
+    con = connect(read_only=True)
+    try:
+        cursor = con.execute(statement, params or [])
+        columns = [column[0] for column in cursor.description] if cursor.description else []
+        rows = cursor.fetchmany(max_rows + 1)
+    finally:
+        con.close()
+
+    return {
+        'columns': columns,
+        'rows': [list(row) for row in rows[:max_rows]],
+        'truncated': len(rows) > max_rows,
+    }
+
+
+def _filter_clause(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate export filters into a WHERE clause over fact_orders f / dim_restaurant r."""
+    from etl.exports import parse_watermark
+
+    conditions, params = [], []
+    if filters.get('start_date'):
+        conditions.append('f.order_date >= CAST(? AS DATE)')
+        params.append(filters['start_date'])
+    if filters.get('end_date'):
+        conditions.append('f.order_date <= CAST(? AS DATE)')
+        params.append(filters['end_date'])
+    if filters.get('restaurant'):
+        conditions.append('f.restaurant_id = ?')
+        params.append(filters['restaurant'])
+    if filters.get('cuisine'):
+        conditions.append('r.cuisine_type = ?')
+        params.append(filters['cuisine'])
+    if filters.get('since'):
+        kind, watermark = parse_watermark(filters['since'])
+        if kind == 'version':
+            conditions.append('f.etl_version > ?')
+            params.append(watermark)
+        else:
+            conditions.append('f.updated_at > ?')
+            params.append(_normalize(watermark))
+    if filters.get('until_version') is not None:
+        conditions.append('f.etl_version <= ?')
+        params.append(filters['until_version'])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return where, params
+
+
+def mirror_watermark() -> int:
+    """Latest ETL version copied into the mirror."""
+    con = connect(read_only=True)
+    try:
+        row = con.execute(f"SELECT watermark FROM {STATE_TABLE} WHERE table_name = 'fact_orders'").fetchone()
+    finally:
+        con.close()
+    return row[0] if row else 0
+
+
+def order_export_rows(filters: Dict[str, Any], limit: Optional[int] = None) -> List[List[Any]]:
+    """Rows of the orders export, read from the mirror."""
+    where, params = _filter_clause(filters)
+    sql = f"""
+        SELECT f.order_id, c.customer_name, r.restaurant_name, f.order_date,
+               f.order_cost, f.rating, f.delivery_time, f.total_time
+        FROM fact_orders f
+        JOIN dim_customer c ON c.customer_id = f.customer_id
+        JOIN dim_restaurant r ON r.restaurant_id = f.restaurant_id
+        {where}
+        ORDER BY f.order_id
+    """
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+    con = connect(read_only=True)
+    try:
+        return [list(row) for row in con.execute(sql, params).fetchall()]
+    finally:
+        con.close()
+
+
+def restaurant_export_rows(filters: Dict[str, Any]) -> List[List[Any]]:
+    """Rows of the restaurant performance export, read from the mirror."""
+    where, params = _filter_clause(filters)
+    sql = f"""
+        SELECT r.restaurant_name, r.cuisine_type, COUNT(f.order_id),
+               SUM(f.order_cost), AVG(f.rating)
+        FROM fact_orders f
+        JOIN dim_restaurant r ON r.restaurant_id = f.restaurant_id
+        {where}
+        GROUP BY r.restaurant_name, r.cuisine_type
+    """
+    con = connect(read_only=True)
+    try:
+        return [list(row) for row in con.execute(sql, params).fetchall()]
+    finally:
+        con.close()
+
+
+def dashboard_summary() -> Dict[str, Any]:
+    """Compute the analytics dashboard aggregates on the mirror, shaped like the ORM results."""
+    con = connect(read_only=True)
+    try:
+        total_orders, total_revenue, avg_order_value, avg_delivery_time = con.execute("""
+            SELECT COUNT(*), COALESCE(SUM(order_cost), 0), COALESCE(AVG(order_cost), 0),
+                   COALESCE(AVG(delivery_time), 0)
+            FROM fact_orders
+        """).fetchone()
+
+        orders_by_month = con.execute("""
+            SELECT CAST(date_trunc('month', order_date) AS DATE) AS month, COUNT(*), SUM(order_cost)
+            FROM fact_orders
+            GROUP BY month
+            ORDER BY month
+            LIMIT 12
+        """).fetchall()
+
+        top_restaurants = con.execute("""
+            SELECT r.restaurant_name, SUM(f.order_cost) AS revenue, COUNT(*)
+            FROM fact_orders f
+            JOIN dim_restaurant r ON r.restaurant_id = f.restaurant_id
+            GROUP BY r.restaurant_id, r.restaurant_name
+            ORDER BY revenue DESC NULLS LAST
+            LIMIT 10
+        """).fetchall()
+
+        cuisine_stats = con.execute("""
+            SELECT r.cuisine_type, COUNT(*) AS orders, SUM(f.order_cost)
+            FROM fact_orders f
+            JOIN dim_restaurant r ON r.restaurant_id = f.restaurant_id
+            GROUP BY r.cuisine_type
+            ORDER BY orders DESC
+            LIMIT 10
+        """).fetchall()
+
+        customer_segments = con.execute("""
+            SELECT segment, COUNT(*) AS customers
+            FROM dim_customer
+            GROUP BY segment
+            ORDER BY customers DESC
+        """).fetchall()
+    finally:
+        con.close()
+
+    return {
+        'total_orders': total_orders,
+        'total_revenue': float(total_revenue),
+        'avg_order_value': float(avg_order_value),
+        'avg_delivery_time': float(avg_delivery_time),
+        'orders_by_month': [
+            {'month': month, 'count': count, 'revenue': revenue}
+            for month, count, revenue in orders_by_month
+        ],
+        'top_restaurants': [
+            {'restaurant__restaurant_name': name, 'revenue': revenue, 'order_count': count}
+            for name, revenue, count in top_restaurants
+        ],
+        'cuisine_stats': [
+            {'restaurant__cuisine_type': cuisine, 'count': count, 'revenue': revenue}
+            for cuisine, count, revenue in cuisine_stats
+        ],
+        'customer_segments': [
+            {'segment': segment, 'count': count}
+            for segment, count in customer_segments
+        ],
+    }
@@ -0,0 +1,146 @@
+"""
+Background processing of ETL jobs in the web process, for when Celery is not
+available.
+
+Uploads and manual triggers must return at once, so a file is never processed
+inside the request. Without Celery, the job goes to a small pool of
+background threads (an ETLConnectionPool of ETL_LOCAL_EXECUTOR_WORKERS
+threads), and the ETLJob table serves as the persistent queue:
+
+- a job handed to the executor is marked queued with a lease owned by this
+  process (etl.claims); at most ETL_LOCAL_EXECUTOR_BACKLOG jobs wait in
+  memory, further jobs are left pending in the table
+- whenever a thread finishes a job it claims the next pending job, or a
+  queued job whose lease expired, and runs it in the same loop, so a backlog
+  drains without Celery
+- if the process exits, the leases of its waiting jobs expire and the jobs
+  are claimed again, by scheduled_etl_processing or by another executor;
+  so are the jobs it was running, once their running lease is no longer
+  renewed (claims.running_lease)
+- jobs start through claims.start_job, so a job handed to both the executor
+  and a Celery worker runs once
+"""
+
+import atexit
+import logging
+import threading
+from typing import Optional
+
+from django.conf import settings
+
+from . import claims, tracing
+from .connection_pool import ETLConnectionPool
+from .models import ETLJob
+
+logger = logging.getLogger(__name__)
+
+
+class LocalExecutor:
+    """
+    Runs file ETL jobs on background threads of this process.
+
+    Args:
+        workers: Number of background threads (jobs processed at once)
+        backlog: Maximum jobs running or waiting in memory
+    """
+
+    def __init__(self, workers: int, backlog: int):
+        self.backlog = backlog
+        self.owner = f'local:{claims.owner_id()}'
+        self._pool = ETLConnectionPool(workers, name='etl-local')
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: int) -> bool:
+        """
+        Queue a job for a background thread.
+
+        Returns:
+            True if the job was queued here, False if it was left pending in
+            the table (the backlog is full) or has already started
+        """
+        with self._lock:
+            if self._in_flight >= self.backlog:
+                ETLJob.objects.filter(id=job_id, status__in=['pending', 'queued']).update(
+                    status='pending', claimed_by='', lease_expires_at=None
+                )
+                logger.warning(f"Local ETL backlog is full, ETL job {job_id} left pending")
+                return False
+            claimed = ETLJob.objects.filter(id=job_id, status__in=['pending', 'queued']).update(
+                **claims.queued_lease(self.owner)
+            )
+            if not claimed:
+                return False
+            self._in_flight += 1
+
+        self._pool.submit(self._drain, tracing.bind(self._run), job_id)
+        return True
+
+    def _drain(self, run, job_id: Optional[int]) -> None:
+        """
+        Run a job, then keep claiming and running the jobs waiting in the
+        table until none is left. Jobs picked up from the table run outside
+        the submitter's span, in the trace of their own upload.
+        """
+        while job_id is not None:
+            try:
+                run(job_id)
+            except Exception as e:
+                logger.error(f"Local ETL executor failed to run ETL job {job_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+            run = self._run
+            job_id = self._claim_next()
+
+    def _run(self, job_id: int) -> None:
+        # Import here to avoid circular imports
+        from .signals import process_etl_file_sync
+
+        process_etl_file_sync(job_id)
+
+    def _claim_next(self) -> Optional[int]:
+        """
+        Take the next job waiting in the table, if there is room.
+
+        Returns:
+            Id of the claimed job, or None
+        """
+        with self._lock:
+            if self._in_flight >= self.backlog:
+                return None
+            try:
+                job_ids = claims.claim_pending_jobs(1, owner=self.owner)
+            except Exception as e:
+                logger.error(f"Could not claim pending ETL jobs: {str(e)}")
+                return None
+            self._in_flight += len(job_ids)
+
+        if not job_ids:
+            return None
+        logger.info(f"Local ETL executor picked up pending ETL job {job_ids[0]}")
+        return job_ids[0]
+
+    def shutdown(self) -> None:
+        """
+        Stop taking jobs; jobs still waiting, and jobs left running when the
+        process exits, are claimed again once their lease expires.
+        """
+        self._pool.shutdown(wait=False)
+
+
+_executor: Optional[LocalExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> LocalExecutor:
+    """Process-wide local executor, sized by ETL_LOCAL_EXECUTOR_WORKERS and ETL_LOCAL_EXECUTOR_BACKLOG."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = LocalExecutor(
+                getattr(settings, 'ETL_LOCAL_EXECUTOR_WORKERS', 2),
+                getattr(settings, 'ETL_LOCAL_EXECUTOR_BACKLOG', 20),
+            )
+            atexit.register(_executor.shutdown)
+        return _executor
@@ -0,0 +1,496 @@
+import csv
+import gzip
+import logging
+import math
+import os
+import secrets
+import shutil
+import concurrent.futures
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Sum, Avg, F, Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import FactOrders, FactOrdersArchive, WarehouseRun
+from etl.archival import needs_archive
+
+logger = logging.getLogger(__name__)
+
+
+ORDER_EXPORT_HEADER = [
+    'Order ID', 'Customer Name', 'Restaurant Name', 'Order Date',
+    'Order Cost', 'Rating', 'Delivery Time', 'Total Time'
+]
+
+RESTAURANT_EXPORT_HEADER = [
+    'Restaurant Name', 'Cuisine Type', 'Total Orders',
+    'Total Revenue', 'Average Rating'
+]
+
+EXPORT_TYPES = ('orders', 'restaurants')
+
+
+def parse_export_filters(params) -> Dict[str, Any]:
+    """
+    Parse export filters from request parameters.
+
+    Args:
+        params: QueryDict or dictionary with the raw request parameters
+
+    Returns:
+        Dictionary with the filters that were provided (JSON serializable)
+
+    Raises:
+        ValueError: If a filter value is malformed
+    """
+    filters = {}
+
+    for key in ('start_date', 'end_date'):
+        value = (params.get(key) or '').strip()
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"Invalid {key} '{value}', expected YYYY-MM-DD")
+            filters[key] = value
+
+    restaurant = (params.get('restaurant') or '').strip()
+    if restaurant:
+        try:
+            filters['restaurant'] = int(restaurant)
+        except ValueError:
+            raise ValueError(f"Invalid restaurant '{restaurant}', expected a restaurant id")
+
+    cuisine = (params.get('cuisine') or '').strip()
+    if cuisine:
+        filters['cuisine'] = cuisine
+
+    since = (params.get('since') or '').strip()
+    if since:
+        parse_watermark(since)
+        filters['since'] = since
+
+    return filters
+
+
+def parse_watermark(value: str) -> Tuple[str, Any]:
+    """
+    Parse a change watermark.
+
+    A watermark is either an ETL version (integer) or an ISO 8601 timestamp.
+
+    Args:
+        value: Raw watermark value
+
+    Returns:
+        Tuple of ('version', int) or ('timestamp', datetime)
+
+    Raises:
+        ValueError: If the value is neither a version nor a timestamp
+    """
+    value = str(value).strip()
+    if value.isdigit():
+        return 'version', int(value)
+
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        try:
+            timestamp = datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), datetime.min.time())
+        except ValueError:
+            raise ValueError(f"Invalid since '{value}', expected an ETL version or ISO timestamp")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    return 'timestamp', timestamp
+
+
+def current_watermark(using: str = 'olapdb') -> int:
+    """
+    Get the latest ETL version whose fact rows are completely written.
+
+    Every warehouse run stamps its own version (WarehouseRun). The watermark
+    stops below the oldest run that is still writing, so a delta never returns
+    part of a version. A run open for longer than ETL_RUN_TIMEOUT_SECONDS is
+    treated as dead and no longer holds the watermark back.
+    """
+    runs = WarehouseRun.objects.using(using)
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'ETL_RUN_TIMEOUT_SECONDS', 21600))
+    oldest_open = runs.filter(status='running', started_at__gte=cutoff).aggregate(version=Min('version'))['version']
+    if oldest_open is not None:
+        return oldest_open - 1
+
+    version = runs.aggregate(version=Max('version'))['version']
+    if version is None:
+        # No runs recorded yet: versions stamped before runs were tracked
+        version = FactOrders.objects.using(using).aggregate(version=Max('etl_version'))['version']
+    return version or 0
+
+
+def apply_export_filters(queryset, filters: Dict[str, Any]):
+    """
+    Apply export filters to a FactOrders queryset.
+
+    Args:
+        queryset: FactOrders queryset
+        filters: Filters as returned by parse_export_filters
+
+    Returns:
+        Filtered queryset
+    """
+    # date_id is YYYYMMDD of order_date; filtering on it too lets MySQL prune
+    # fact_orders partitions
+    if filters.get('start_date'):
+        queryset = queryset.filter(
+            order_date__gte=filters['start_date'],
+            date_id__gte=int(filters['start_date'].replace('-', ''))
+        )
+    if filters.get('end_date'):
+        queryset = queryset.filter(
+            order_date__lte=filters['end_date'],
+            date_id__lte=int(filters['end_date'].replace('-', ''))
+        )
+    if filters.get('restaurant'):
+        queryset = queryset.filter(restaurant_id=filters['restaurant'])
+    if filters.get('cuisine'):
+        queryset = queryset.filter(restaurant__cuisine_type=filters['cuisine'])
+    if filters.get('since'):
+        kind, watermark = parse_watermark(filters['since'])
+        if kind == 'version':
+            queryset = queryset.filter(etl_version__gt=watermark)
+        else:
+            queryset = queryset.filter(updated_at__gt=watermark)
+    if filters.get('until_version') is not None:
+        # Upper bound captured when the delta was requested (current_watermark),
+        # below any version a concurrent ETL run is still writing
+        queryset = queryset.filter(etl_version__lte=filters['until_version'])
+    return queryset
+
+
+def get_order_sources(filters: Dict[str, Any], using: str = 'olapdb') -> List[bool]:
+    """
+    Tables an export has to read, as `archived` flags: the hot table, plus the
+    archive when the requested date range reaches into it.
+    """
+    if needs_archive(filters.get('start_date'), using=using):
+        return [False, True]
+    return [False]
+
+
+def get_orders_queryset(filters: Dict[str, Any], using: str = 'olapdb', archived: bool = False):
+    """Get the filtered fact orders queryset used by order exports."""
+    model = FactOrdersArchive if archived else FactOrders
+    queryset = model.objects.using(using).select_related('customer', 'restaurant')
+    return apply_export_filters(queryset, filters)
+
+
+def get_restaurant_stats_queryset(filters: Dict[str, Any], using: str = 'olapdb', archived: bool = False):
+    """Get the filtered restaurant performance aggregation used by exports."""
+    model = FactOrdersArchive if archived else FactOrders
+    queryset = apply_export_filters(model.objects.using(using), filters)
+    return queryset.values(
+        'restaurant__restaurant_name',
+        'restaurant__cuisine_type'
+    ).annotate(
+        order_count=Count('order_id'),
+        total_revenue=Sum('order_cost'),
+        avg_rating=Avg('rating'),
+        rating_count=Count('rating')
+    )
+
+
+def get_restaurant_stats(filters: Dict[str, Any], using: str = 'olapdb') -> List[Dict[str, Any]]:
+    """Restaurant performance over the hot table and, when needed, the archive."""
+    sources = get_order_sources(filters, using=using)
+    if sources == [False]:
+        return list(get_restaurant_stats_queryset(filters, using=using))
+
+    merged = {}
+    for archived in sources:
+        for stat in get_restaurant_stats_queryset(filters, using=using, archived=archived):
+            key = (stat['restaurant__restaurant_name'], stat['restaurant__cuisine_type'])
+            if key not in merged:
+                merged[key] = dict(stat)
+                continue
+            entry = merged[key]
+            rating_count = entry['rating_count'] + stat['rating_count']
+            if rating_count:
+                entry['avg_rating'] = (
+                    (entry['avg_rating'] or 0) * entry['rating_count']
+                    + (stat['avg_rating'] or 0) * stat['rating_count']
+                ) / rating_count
+            entry['rating_count'] = rating_count
+            entry['order_count'] += stat['order_count']
+            if stat['total_revenue'] is not None:
+                entry['total_revenue'] = (entry['total_revenue'] or 0) + stat['total_revenue']
+    return list(merged.values())
+
+
+def order_rows(orders: Iterable[FactOrders]) -> Iterable[List[Any]]:
+    """Convert fact orders into export rows."""
+    for order in orders:
+        yield [
+            order.order_id,
+            order.customer.customer_name,
+            order.restaurant.restaurant_name,
+            order.order_date,
+            order.order_cost,
+            order.rating,
+            order.delivery_time,
+            order.total_time
+        ]
+
+
+def restaurant_rows(restaurant_stats: Iterable[Dict[str, Any]]) -> Iterable[List[Any]]:
+    """Convert restaurant aggregations into export rows."""
+    for stat in restaurant_stats:
+        yield [
+            stat['restaurant__restaurant_name'],
+            stat['restaurant__cuisine_type'],
+            stat['order_count'],
+            stat['total_revenue'],
+            stat['avg_rating']
+        ]
+
+
+class ExportService:
+    """
+    Service class to write large exports to ETL_EXPORT_DIR as compressed artifacts.
+
+    Order exports are split into primary key ranges that are extracted and
+    written in parallel, then stitched together into a single file.
+    """
+
+    def __init__(self, chunk_size: int = None, max_workers: int = None):
+        self.chunk_size = chunk_size or getattr(settings, 'ETL_EXPORT_CHUNK_SIZE', 50000)
+        self.max_workers = max_workers or getattr(settings, 'ETL_EXPORT_MAX_WORKERS', 4)
+
+    def run(self, export_job) -> str:
+        """
+        Run an export job and write its artifact.
+
+        Args:
+            export_job: ExportJob instance to process
+
+        Returns:
+            Path of the written file
+        """
+        from etl.models import ExportJob
+
+        if export_job.export_type not in EXPORT_TYPES:
+            raise ValueError(f"Unsupported export type: {export_job.export_type}")
+        if export_job.file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unsupported export format: {export_job.file_format}")
+
+        # Outside MEDIA_ROOT, which the web server serves without authentication;
+        # files are downloaded through the export_download view
+        export_dir = str(settings.ETL_EXPORT_DIR)
+        os.makedirs(export_dir, exist_ok=True)
+        extension = 'csv.gz' if export_job.file_format == 'csv' else 'parquet'
+        file_name = f"{export_job.export_type}_{export_job.id}_{secrets.token_hex(16)}.{extension}"
+        file_path = os.path.join(export_dir, file_name)
+
+        if export_job.export_type == 'orders':
+            chunks = self._plan_order_chunks(export_job.filters)
+        else:
+            chunks = [(False, None)]
+
+        ExportJob.objects.filter(pk=export_job.pk).update(total_chunks=len(chunks))
+
+        part_paths = [f"{file_path}.part{index}" for index in range(len(chunks))]
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._export_chunk, export_job, chunk, part_path, index == 0
+                    )
+                    for index, (chunk, part_path) in enumerate(zip(chunks, part_paths))
+                ]
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+
+            self._combine_parts(part_paths, file_path, export_job.file_format)
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        logger.info(f"Export job {export_job.id} written to {file_path}")
+        return file_path
+
+    def _plan_order_chunks(self, filters: Dict[str, Any]) -> List[Tuple[bool, Optional[Tuple[int, int]]]]:
+        """
+        Split the filtered order id range of every source table into roughly
+        chunk_size sized ranges.
+
+        Returns:
+            List of (archived, (start, end)) chunks
+        """
+        chunks = []
+        for archived in get_order_sources(filters):
+            bounds = get_orders_queryset(filters, archived=archived).aggregate(
+                min_id=Min('order_id'), max_id=Max('order_id'), total=Count('order_id')
+            )
+            if not bounds['total']:
+                continue
+
+            chunk_count = max(1, math.ceil(bounds['total'] / self.chunk_size))
+            span = bounds['max_id'] - bounds['min_id'] + 1
+            step = max(1, math.ceil(span / chunk_count))
+
+            start = bounds['min_id']
+            while start <= bounds['max_id']:
+                chunks.append((archived, (start, start + step)))
+                start += step
+        return chunks or [(False, None)]
+
+    def _export_chunk(self, export_job, chunk, part_path: str, include_header: bool) -> int:
+        """Extract one chunk and write it to a part file."""
+        from etl.models import ExportJob
+
+        try:
+            archived, id_range = chunk
+            if export_job.export_type == 'orders':
+                header = ORDER_EXPORT_HEADER
+                queryset = get_orders_queryset(export_job.filters, archived=archived)
+                if id_range is not None:
+                    queryset = queryset.filter(order_id__gte=id_range[0], order_id__lt=id_range[1])
+                rows = order_rows(queryset.order_by('order_id').iterator(chunk_size=2000))
+            else:
+                header = RESTAURANT_EXPORT_HEADER
+                rows = restaurant_rows(get_restaurant_stats(export_job.filters))
+
+            if export_job.file_format == 'csv':
+                written = self._write_csv_part(part_path, header, rows, include_header)
+            else:
+                written = self._write_parquet_part(part_path, header, rows)
+
+            ExportJob.objects.filter(pk=export_job.pk).update(
+                chunks_completed=F('chunks_completed') + 1,
+                records_exported=F('records_exported') + written
+            )
+            return written
+        finally:
+            # Worker threads open their own connections; release them explicitly
+            connections.close_all()
+
+    def _write_csv_part(self, part_path: str, header: List[str], rows, include_header: bool) -> int:
+        """Write rows to a gzip member. Concatenated gzip members form a valid gzip file."""
+        written = 0
+        with gzip.open(part_path, 'wt', encoding='utf-8', newline='') as part_file:
+            writer = csv.writer(part_file)
+            if include_header:
+                writer.writerow(header)
+            for row in rows:
+                writer.writerow(row)
+                written += 1
+        return written
+
+    def _write_parquet_part(self, part_path: str, header: List[str], rows) -> int:
+        """Write rows to a Parquet part file with a fixed schema shared by all parts."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("pyarrow is required for Parquet exports")
+
+        schema = _parquet_schema(header)
+        columns = [[] for _ in header]
+        for row in rows:
+            for index, value in enumerate(row):
+                columns[index].append(value)
+
+        for values, field in zip(columns, schema):
+            if pa.types.is_floating(field.type):
+                # Aggregates come back as Decimal on some backends
+                values[:] = [None if value is None else float(value) for value in values]
+
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        )
+        pq.write_table(table, part_path, compression='snappy')
+        return table.num_rows
+
+    def _combine_parts(self, part_paths: List[str], file_path: str, file_format: str) -> None:
+        """Stitch part files together into the final artifact."""
+        if file_format == 'csv':
+            with open(file_path, 'wb') as output:
+                for part_path in part_paths:
+                    with open(part_path, 'rb') as part_file:
+                        shutil.copyfileobj(part_file, output)
+            return
+
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("pyarrow is required for Parquet exports")
+
+        writer = None
+        try:
+            for part_path in part_paths:
+                table = pq.read_table(part_path)
+                if writer is None:
+                    writer = pq.ParquetWriter(file_path, table.schema, compression='snappy')
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+def _parquet_schema(header: List[str]):
+    """Arrow schema of an export, so that every part file is written identically."""
+    import pyarrow as pa
+
+    types = {
+        'Order ID': pa.int64(),
+        'Order Date': pa.date32(),
+        'Order Cost': pa.decimal128(10, 2),
+        'Rating': pa.int64(),
+        'Delivery Time': pa.int64(),
+        'Total Time': pa.int64(),
+        'Total Orders': pa.int64(),
+        'Total Revenue': pa.float64(),
+        'Average Rating': pa.float64(),
+    }
+    return pa.schema([pa.field(name, types.get(name, pa.string())) for name in header])
+
+
+def run_export_job(export_job_id: int) -> str:
+    """
+    Run an export job end to end, tracking its status.
+
+    Args:
+        export_job_id: ID of the ExportJob to run
+
+    Returns:
+        Path of the written file
+    """
+    from etl.models import ExportJob
+
+    export_job = ExportJob.objects.get(id=export_job_id)
+    export_job.status = 'running'
+    export_job.started_at = timezone.now()
+    export_job.chunks_completed = 0
+    export_job.records_exported = 0
+    export_job.save()
+
+    try:
+        file_path = ExportService().run(export_job)
+
+        export_job.refresh_from_db()
+        export_job.file_path = file_path
+        export_job.status = 'completed'
+        export_job.completed_at = timezone.now()
+        export_job.save()
+        return file_path
+
+    except Exception as e:
+        logger.error(f"Export job {export_job_id} failed: {str(e)}")
+        export_job.status = 'failed'
+        export_job.error_message = str(e)
+        export_job.completed_at = timezone.now()
+        export_job.save()
+        raise
@@ -0,0 +1,269 @@
+"""
+EXPLAIN-based index advisor for the queries the application issues.
+
+ADVISOR_QUERIES mirrors the lookups of the CSV ingest (ETLService), the
+warehouse ETL, the analytics views, exports and the warehouse API. Each query
+is explained on its database and the plan is checked for full table scans,
+unused expected indexes, filesorts and temporary tables.
+
+Plans depend on table statistics: on near-empty tables the optimizer may
+prefer a scan even when a suitable index exists, so run the advisor against
+production-sized data.
+"""
+
+import logging
+from typing import Dict, List, Any, Callable, Optional
+
+from django.db import connections
+from django.db.models import Count, Sum, Avg
+from django.db.models.functions import TruncMonth
+
+from core.models import (
+    Customer, Restaurant, Day, DeliveryPerson, Order,
+    DimCustomer, DimRestaurant, DimDate, DimLocation, FactOrders, FactOrderSketch
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AdvisorQuery:
+    """
+    A representative application query.
+
+    Args:
+        label: Where the query is issued
+        using: Database alias it runs on
+        build: Callable returning the queryset, given a sample(model, field) helper
+        expected_index: Index the query should use (None if any plan is acceptable)
+        scan_expected: Whether a full scan is inherent (whole-table aggregates)
+    """
+
+    def __init__(self, label: str, using: str, build: Callable, expected_index: Optional[str] = None,
+                 scan_expected: bool = False):
+        self.label = label
+        self.using = using
+        self.build = build
+        self.expected_index = expected_index
+        self.scan_expected = scan_expected
+
+
+ADVISOR_QUERIES = [
+    # CSV ingest (ordersdb); natural keys are unique, so any scan is reported
+    AdvisorQuery('ETLService._get_or_create_customer', 'default',
+                 lambda sample: Customer.objects.filter(customer_id=sample(Customer, 'customer_id')),
+                 expected_index='PRIMARY'),
+    AdvisorQuery('ETLService._get_or_create_restaurant', 'default',
+                 lambda sample: Restaurant.objects.filter(restaurant_name=sample(Restaurant, 'restaurant_name'))),
+    AdvisorQuery('ETLService._get_or_create_day', 'default',
+                 lambda sample: Day.objects.filter(day_name=sample(Day, 'day_name'))),
+    AdvisorQuery('ETLService._get_or_create_delivery_person', 'default',
+                 lambda sample: DeliveryPerson.objects.filter(
+                     delivery_person_id=sample(DeliveryPerson, 'delivery_person_id')),
+                 expected_index='PRIMARY'),
+    AdvisorQuery('ETLService._create_order', 'default',
+                 lambda sample: Order.objects.filter(order_id=sample(Order, 'order_id'))),
+
+    # Warehouse ETL
+    AdvisorQuery('DataWarehouseETL.extract_dim_location (customer cities)', 'default',
+                 lambda sample: Customer.objects.values('city', 'address').distinct(),
+                 scan_expected=True),
+    AdvisorQuery('DataWarehouseETL._get_location_for_order', 'olapdb',
+                 lambda sample: DimLocation.objects.filter(city=sample(DimLocation, 'city')),
+                 expected_index='dim_location_city_idx'),
+    AdvisorQuery('DataWarehouseETL.extract_fact_orders (existing fact)', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(order_id=sample(FactOrders, 'order_id')),
+                 expected_index='PRIMARY'),
+    AdvisorQuery('DataWarehouseETL.build_order_sketches (cell rows)', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(
+                     restaurant_id__in=[sample(FactOrders, 'restaurant_id')],
+                     date_id__in=[sample(FactOrders, 'date_id')]
+                 ).values_list('restaurant_id', 'date_id', 'customer_id', 'delivery_time', 'food_preparation_time'),
+                 expected_index='fact_orders_rest_date_idx'),
+    AdvisorQuery('DataWarehouseETL.build_order_sketches (current version)', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(
+                     etl_version=sample(FactOrders, 'etl_version')
+                 ).values_list('restaurant_id', 'date_id').distinct()),
+
+    # Analytics dashboard (olapdb)
+    AdvisorQuery('analytics: orders by month', 'olapdb',
+                 lambda sample: FactOrders.objects.annotate(month=TruncMonth('order_date')).values('month').annotate(
+                     count=Count('order_id'), revenue=Sum('order_cost')).order_by('month'),
+                 scan_expected=True),
+    AdvisorQuery('analytics: top restaurants', 'olapdb',
+                 lambda sample: FactOrders.objects.values('restaurant__restaurant_name').annotate(
+                     revenue=Sum('order_cost'), order_count=Count('order_id')).order_by('-revenue'),
+                 scan_expected=True),
+    AdvisorQuery('analytics: cuisine stats', 'olapdb',
+                 lambda sample: FactOrders.objects.values('restaurant__cuisine_type').annotate(
+                     count=Count('order_id'), revenue=Sum('order_cost')).order_by('-count'),
+                 scan_expected=True),
+    AdvisorQuery('analytics: percentiles by date range', 'olapdb',
+                 lambda sample: FactOrderSketch.objects.filter(
+                     date_id__gte=sample(FactOrderSketch, 'date_id'), date_id__lte=sample(FactOrderSketch, 'date_id')),
+                 expected_index='fact_sketch_date_idx'),
+
+    # Exports (olapdb)
+    AdvisorQuery('export: orders by date range', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(
+                     order_date__gte=sample(FactOrders, 'order_date'), order_date__lte=sample(FactOrders, 'order_date')
+                 ).order_by('order_id'),
+                 expected_index='fact_orders_date_cost_idx'),
+    AdvisorQuery('export: orders by restaurant', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(
+                     restaurant_id=sample(FactOrders, 'restaurant_id')).order_by('order_id')),
+    AdvisorQuery('export: delta since version', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(
+                     etl_version__gt=sample(FactOrders, 'etl_version')).order_by('order_id')),
+    AdvisorQuery('export: restaurant performance', 'olapdb',
+                 lambda sample: FactOrders.objects.values(
+                     'restaurant__restaurant_name', 'restaurant__cuisine_type').annotate(
+                     order_count=Count('order_id'), total_revenue=Sum('order_cost'), avg_rating=Avg('rating')),
+                 scan_expected=True),
+
+    # Warehouse API (olapdb)
+    AdvisorQuery('api: fact-orders by customer and date', 'olapdb',
+                 lambda sample: FactOrders.objects.filter(
+                     customer_id=sample(FactOrders, 'customer_id')).order_by('date_id', 'order_id')[:101],
+                 expected_index='fact_orders_cust_date_idx'),
+    AdvisorQuery('api: customers by segment', 'olapdb',
+                 lambda sample: DimCustomer.objects.filter(
+                     segment=sample(DimCustomer, 'segment')).order_by('customer_id')[:101],
+                 expected_index='dim_customer_segment_idx'),
+    AdvisorQuery('api: restaurants by cuisine', 'olapdb',
+                 lambda sample: DimRestaurant.objects.filter(
+                     cuisine_type=sample(DimRestaurant, 'cuisine_type')).order_by('restaurant_id')[:101],
+                 expected_index='dim_restaurant_cuisine_idx'),
+    AdvisorQuery('api: dates by range', 'olapdb',
+                 lambda sample: DimDate.objects.filter(
+                     date_id__gte=sample(DimDate, 'date_id')).order_by('date_id')[:101],
+                 expected_index='PRIMARY'),
+]
+
+
+def _sampler(using: str) -> Callable:
+    """Build a helper returning a real column value, so lookups are not optimized away."""
+    cache = {}
+
+    def sample(model, field: str):
+        key = (model, field)
+        if key not in cache:
+            value = model.objects.using(using).exclude(**{f'{field}__isnull': True}).values_list(
+                field, flat=True
+            ).first()
+            field_type = model._meta.get_field(field).get_internal_type()
+            if value is None:
+                value = '' if field_type in ('CharField', 'TextField') else 0
+            cache[key] = value
+        return cache[key]
+
+    return sample
+
+
+def _explain_mysql(cursor, sql: str, params) -> Dict[str, Any]:
+    cursor.execute(f'EXPLAIN {sql}', params)
+    columns = [column[0].lower() for column in cursor.description]
+    plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    scans, indexes, notes = [], [], []
+    for step in plan:
+        table = step.get('table')
+        extra = step.get('extra') or ''
+        if step.get('key'):
+            indexes.append(step['key'])
+        if step.get('type') == 'ALL':
+            reason = 'no usable index' if not step.get('possible_keys') else 'index not chosen'
+            scans.append(f"{table}: full table scan of ~{step.get('rows')} rows ({reason})")
+        elif step.get('type') == 'index':
+            scans.append(f"{table}: full index scan of {step.get('key')} (~{step.get('rows')} rows)")
+        if 'Using filesort' in extra:
+            notes.append(f'{table}: filesort')
+        if 'Using temporary' in extra:
+            notes.append(f'{table}: temporary table')
+
+    lines = [
+        ' | '.join(f'{key}={value}' for key, value in step.items() if value is not None)
+        for step in plan
+    ]
+    return {'plan': lines, 'scans': scans, 'indexes': indexes, 'notes': notes}
+
+
+def _explain_sqlite(cursor, sql: str, params) -> Dict[str, Any]:
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    details = [row[-1] for row in cursor.fetchall()]
+
+    scans, indexes, notes = [], [], []
+    for detail in details:
+        words = detail.split()
+        if ' INDEX ' in f' {detail} ':
+            indexes.append(words[words.index('INDEX') + 1])
+        elif 'USING INTEGER PRIMARY KEY' in detail or 'USING ROWID' in detail:
+            indexes.append('PRIMARY')
+        if words[:1] == ['SCAN']:
+            if 'INDEX' in words:
+                scans.append(f"{words[1]}: full index scan of {words[words.index('INDEX') + 1]}")
+            else:
+                scans.append(f'{words[1]}: full table scan')
+        if 'TEMP B-TREE' in detail:
+            notes.append(detail.lower())
+
+    return {'plan': details, 'scans': scans, 'indexes': indexes, 'notes': notes}
+
+
+def explain_query(query: AdvisorQuery, sample: Callable) -> Dict[str, Any]:
+    """
+    Explain one advisor query.
+
+    Returns:
+        Dictionary with the plan lines, scans, used indexes, notes and problems found
+    """
+    connection = connections[query.using]
+    queryset = query.build(sample).using(query.using)
+    sql, params = queryset.query.get_compiler(using=query.using).as_sql()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            result = _explain_mysql(cursor, sql, params)
+        elif connection.vendor == 'sqlite':
+            result = _explain_sqlite(cursor, sql, params)
+        else:
+            raise NotImplementedError(f'EXPLAIN parsing is not implemented for {connection.vendor}')
+
+    problems = []
+    if result['scans'] and not query.scan_expected:
+        problems.extend(result['scans'])
+    if query.expected_index and query.expected_index.lower() not in [index.lower() for index in result['indexes']]:
+        problems.append(f"expected index {query.expected_index} is not used "
+                        f"(used: {', '.join(result['indexes']) or 'none'})")
+
+    result.update({
+        'label': query.label, 'using': query.using, 'problems': problems,
+        'sql': sql, 'params': list(params),
+    })
+    return result
+
+
+def run_advisor(aliases: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Explain every advisor query.
+
+    Args:
+        aliases: Restrict to queries on these database aliases
+
+    Returns:
+        List of explain results, in ADVISOR_QUERIES order
+    """
+    samplers = {}
+    results = []
+    for query in ADVISOR_QUERIES:
+        if aliases and query.using not in aliases:
+            continue
+        sample = samplers.setdefault(query.using, _sampler(query.using))
+        try:
+            results.append(explain_query(query, sample))
+        except Exception as e:
+            logger.error(f"Error explaining {query.label}: {str(e)}")
+            results.append({
+                'label': query.label, 'using': query.using, 'plan': [], 'scans': [],
+                'indexes': [], 'notes': [], 'sql': '', 'params': [], 'problems': [f'EXPLAIN failed: {str(e)}'],
+            })
+    return results
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from etl import archival
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Move old fact orders from the hot table into the compressed archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=None,
+            help='Archive facts older than this many months (default: ETL_ARCHIVE_AFTER_MONTHS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows moved per transaction',
+        )
+
+    def handle(self, *args, **options):
+        months = options['months'] if options['months'] is not None else archival.get_archive_after_months()
+        self.stdout.write(f"Archiving fact orders older than {months} months...")
+        
+        try:
+            result = archival.archive_facts(months=months, batch_size=options['batch_size'])
+            
+            self.stdout.write(f"Cutoff date_id:   {result['cutoff']}")
+            self.stdout.write(f"Orders archived:  {result['archived']}")
+            if result['partitions_dropped']:
+                self.stdout.write(f"Partitions dropped: {', '.join(result['partitions_dropped'])}")
+            self.stdout.write(self.style.SUCCESS('Fact archival completed successfully!'))
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Fact archival failed: {str(e)}')
+            )
+            sys.exit(1)
@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+from etl import benchmark
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Benchmark CSV ingest and every warehouse ETL stage, writing rows/s, peak RSS and query counts to JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'csv',
+            type=str,
+            help='Orders CSV to load (see generate_orders)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='benchmark.json',
+            help='Results file (default: benchmark.json)',
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help='Previous results file to compare against',
+        )
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Delete all OLTP and warehouse rows before the run, for a reproducible starting point',
+        )
+        parser.add_argument(
+            '--skip-ingest',
+            action='store_true',
+            help='Only benchmark the warehouse stages on the data already loaded',
+        )
+        parser.add_argument(
+            '--pipelined',
+            action='store_true',
+            help='Load facts with the pipelined fact load',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['flush']:
+                self.stdout.write(self.style.WARNING("Deleting all OLTP and warehouse rows..."))
+                benchmark.flush_benchmark_data()
+            
+            self.stdout.write(f"Benchmarking ETL with {options['csv']}...")
+            results = benchmark.run_benchmark(
+                options['csv'], pipelined=options['pipelined'], skip_ingest=options['skip_ingest']
+            )
+            benchmark.write_results(results, options['output'])
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'ETL benchmark failed: {str(e)}')
+            )
+            sys.exit(1)
+        
+        self.display_results(results)
+        if options['compare']:
+            self.display_comparison(benchmark.compare_results(benchmark.load_results(options['compare']), results))
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def display_results(self, results):
+        """Display the figures of each stage."""
+        self.stdout.write("\n" + "="*78)
+        self.stdout.write("ETL BENCHMARK")
+        self.stdout.write("="*78)
+        self.stdout.write(f"{'stage':<20}{'seconds':>10}{'rows':>10}{'rows/s':>12}{'peak MB':>10}{'queries':>10}")
+        for name, stage in results['stages'].items():
+            rows_per_second = stage.get('rows_per_second')
+            queries = sum(stage['queries'].values()) if 'queries' in stage else ''
+            self.stdout.write(
+                f"{name:<20}{stage['seconds']:>10.2f}{stage['rows'] if stage['rows'] is not None else '':>10}"
+                f"{rows_per_second if rows_per_second is not None else '':>12}"
+                f"{stage.get('peak_rss_mb', ''):>10}{queries:>10}"
+            )
+        self.stdout.write("="*78)
+
+    def display_comparison(self, comparison):
+        """Display the change of each stage against the baseline run."""
+        self.stdout.write("\nCHANGE AGAINST BASELINE:")
+        for entry in comparison:
+            def pct(value):
+                return 'n/a' if value is None else f"{value:+.1f}%"
+            self.stdout.write(
+                f"  {entry['stage']:<20} {entry['baseline_seconds']:>8.2f}s -> {entry['seconds']:>8.2f}s  "
+                f"time {pct(entry['seconds_change_pct'])}  rows/s {pct(entry['rows_per_second_change_pct'])}  "
+                f"queries {pct(entry['queries_change_pct'])}"
+            )
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+from core.models import Restaurant, Day, Order
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Merge duplicate restaurants and days and remove duplicate orders so the unique natural keys can be applied'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report duplicates',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        
+        try:
+            with transaction.atomic(using='default'):
+                # Restaurants and days are referenced by orders: repoint them to the kept row
+                merged_restaurants = self.merge_duplicates(Restaurant, 'restaurant_name', 'restaurant', dry_run)
+                merged_days = self.merge_duplicates(Day, 'day_name', 'day', dry_run)
+                removed_orders = self.remove_duplicate_orders(dry_run)
+            
+            self.stdout.write(f"Duplicate restaurants merged: {merged_restaurants}")
+            self.stdout.write(f"Duplicate days merged:        {merged_days}")
+            self.stdout.write(f"Duplicate orders removed:     {removed_orders}")
+            if dry_run:
+                self.stdout.write(self.style.WARNING('Dry run: no changes were made.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Natural keys are unique; run migrate to add the constraints.'))
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Deduplication failed: {str(e)}')
+            )
+            sys.exit(1)
+
+    def merge_duplicates(self, model, key_field, order_field, dry_run):
+        """Keep the lowest primary key per natural key and move orders onto it."""
+        pk_name = model._meta.pk.name
+        duplicates = model.objects.using('default').exclude(**{f'{key_field}__isnull': True}).values(
+            key_field
+        ).annotate(
+            rows=Count(pk_name), keep=Min(pk_name)
+        ).filter(rows__gt=1)
+        
+        merged = 0
+        for duplicate in duplicates:
+            extra = model.objects.using('default').filter(
+                **{key_field: duplicate[key_field]}
+            ).exclude(pk=duplicate['keep'])
+            merged += extra.count()
+            if not dry_run:
+                Order.objects.using('default').filter(**{f'{order_field}__in': extra}).update(
+                    **{f'{order_field}_id': duplicate['keep']}
+                )
+                extra.delete()
+        return merged
+
+    def remove_duplicate_orders(self, dry_run):
+        """Keep the first loaded row of every order_id."""
+        duplicates = Order.objects.using('default').values('order_id').annotate(
+            rows=Count('id'), keep=Min('id')
+        ).filter(rows__gt=1)
+        
+        removed = 0
+        for duplicate in duplicates:
+            extra = Order.objects.using('default').filter(
+                order_id=duplicate['order_id']
+            ).exclude(id=duplicate['keep'])
+            removed += extra.count()
+            if not dry_run:
+                extra.delete()
+        return removed
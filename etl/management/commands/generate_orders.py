@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from etl.benchmark import generate_orders_csv
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic orders CSV in the upload format for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            type=str,
+            help='Path of the CSV file to write',
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='Number of orders (default: 10000)',
+        )
+        parser.add_argument(
+            '--customers',
+            type=int,
+            default=None,
+            help='Distinct customers (default: rows / 10)',
+        )
+        parser.add_argument(
+            '--restaurants',
+            type=int,
+            default=500,
+            help='Distinct restaurants (default: 500)',
+        )
+        parser.add_argument(
+            '--couriers',
+            type=int,
+            default=2000,
+            help='Distinct delivery persons (default: 2000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed; the same arguments always produce the same file',
+        )
+
+    def handle(self, *args, **options):
+        customers = options['customers'] or max(1, options['rows'] // 10)
+        self.stdout.write(
+            f"Generating {options['rows']} orders ({customers} customers, {options['restaurants']} restaurants, "
+            f"{options['couriers']} couriers)..."
+        )
+        
+        try:
+            result = generate_orders_csv(
+                options['output'],
+                rows=options['rows'],
+                customers=customers,
+                restaurants=options['restaurants'],
+                couriers=options['couriers'],
+                seed=options['seed']
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"Wrote {result['rows']} orders to {result['path']} in {result['seconds']:.1f}s")
+            )
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Order generation failed: {str(e)}')
+            )
+            sys.exit(1)
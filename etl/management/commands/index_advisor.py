@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from etl.index_advisor import run_advisor
+import sys
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queries issued by ingest, warehouse ETL, analytics, exports and the API, and report full scans and missing indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            choices=['default', 'olapdb'],
+            help='Only check queries on this database (repeatable)',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Print the SQL and full plan of every query',
+        )
+        parser.add_argument(
+            '--strict',
+            action='store_true',
+            help='Exit with status 1 when any problem is found',
+        )
+
+    def handle(self, *args, **options):
+        results = run_advisor(options['database'])
+        problem_count = 0
+        
+        self.stdout.write("\n" + "="*60)
+        self.stdout.write("INDEX ADVISOR")
+        self.stdout.write("="*60)
+        
+        for result in results:
+            if result['problems']:
+                problem_count += 1
+                self.stdout.write(self.style.WARNING(f"\n[{result['using']}] {result['label']}"))
+                for problem in result['problems']:
+                    self.stdout.write(f"  - {problem}")
+            else:
+                self.stdout.write(f"\n[{result['using']}] {result['label']}: " + self.style.SUCCESS('OK'))
+                if result['indexes']:
+                    self.stdout.write(f"  index: {', '.join(result['indexes'])}")
+            
+            for note in result['notes']:
+                self.stdout.write(f"  note: {note}")
+            
+            if options['verbose_plans']:
+                self.stdout.write(f"  sql: {result['sql']}")
+                self.stdout.write(f"  params: {result['params']}")
+                for line in result['plan']:
+                    self.stdout.write(f"  plan: {line}")
+        
+        self.stdout.write("\n" + "-"*60)
+        self.stdout.write(f"Queries checked: {len(results)}")
+        self.stdout.write(f"With problems:   {problem_count}")
+        self.stdout.write("="*60)
+        
+        if problem_count and options['strict']:
+            sys.exit(1)
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.models import FactOrderSketch
+from etl import partitioning, columnar, duckdb_mirror
+from etl.exports import current_watermark
+from datetime import datetime
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Partition fact_orders by month of date_id, create future partitions and retire old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=getattr(settings, 'ETL_FACT_PARTITION_MONTHS_AHEAD', 3),
+            help='Number of future months to keep partitions for',
+        )
+        parser.add_argument(
+            '--drop-before',
+            metavar='YYYY-MM',
+            help='Drop every partition holding months before this one',
+        )
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='Only list the current partitions',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['status']:
+                self.display_partitions()
+                return
+            
+            if options['drop_before']:
+                self.drop_partitions(options['drop_before'])
+                return
+            
+            if not partitioning.is_partitioned():
+                self.stdout.write("Partitioning fact_orders by month (this rebuilds the table)...")
+                created = partitioning.partition_table(months_ahead=options['months_ahead'])
+            else:
+                created = partitioning.ensure_partitions(months_ahead=options['months_ahead'])
+            
+            if created:
+                self.stdout.write(f"Created partitions: {', '.join(created)}")
+            else:
+                self.stdout.write("All partitions already exist")
+            self.stdout.write(self.style.SUCCESS('fact_orders partitions are up to date!'))
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Partition maintenance failed: {str(e)}')
+            )
+            sys.exit(1)
+
+    def drop_partitions(self, value):
+        """Drop old partitions and the aggregates derived from them."""
+        try:
+            first_kept = datetime.strptime(value, '%Y-%m').date()
+        except ValueError:
+            self.stdout.write(self.style.ERROR(f"Invalid --drop-before '{value}', expected YYYY-MM"))
+            sys.exit(1)
+        
+        dropped = partitioning.drop_partitions_before(first_kept.year, first_kept.month)
+        if not dropped:
+            self.stdout.write("No partitions to drop")
+            return
+        
+        cutoff = int(first_kept.strftime('%Y%m%d'))
+        sketches, _ = FactOrderSketch.objects.using('olapdb').filter(date_id__lt=cutoff).delete()
+        self.stdout.write(f"Dropped partitions: {', '.join(dropped)}")
+        self.stdout.write(f"Deleted {sketches} order sketches before {first_kept}")
+        
+        # Derived read models copy fact rows, so rebuild them without the retired months
+        if columnar.is_enabled():
+            columnar.export_snapshot(version=current_watermark())
+        if duckdb_mirror.is_enabled():
+            duckdb_mirror.refresh_mirror(full=True)
+        
+        self.stdout.write(self.style.SUCCESS('Old fact_orders partitions retired successfully!'))
+
+    def display_partitions(self):
+        """List the partitions of fact_orders."""
+        partitions = partitioning.get_partitions()
+        if not partitions:
+            self.stdout.write("fact_orders is not partitioned")
+            return
+        
+        self.stdout.write(f"{'Partition':<12} {'Less than':<12} {'Rows (est.)':>12}")
+        for partition in partitions:
+            less_than = partition['less_than'] if partition['less_than'] is not None else 'MAXVALUE'
+            self.stdout.write(f"{partition['name']:<12} {less_than!s:<12} {partition['rows']:>12}")
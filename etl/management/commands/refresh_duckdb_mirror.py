@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from etl import duckdb_mirror
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Refresh the DuckDB mirror of the warehouse used for exploratory queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild the mirror from scratch instead of copying changed fact rows only',
+        )
+
+    def handle(self, *args, **options):
+        if not duckdb_mirror.is_enabled():
+            self.stdout.write(
+                self.style.ERROR('ETL_DUCKDB_MIRROR_PATH is not set; configure it to enable the DuckDB mirror.')
+            )
+            sys.exit(1)
+
+        self.stdout.write(f"Refreshing DuckDB mirror at {duckdb_mirror.get_mirror_path()}...")
+        
+        try:
+            stats = duckdb_mirror.refresh_mirror(full=options['full'])
+            
+            for table, rows in stats.items():
+                self.stdout.write(f"{table}: {rows} rows copied")
+            self.stdout.write(f"Watermark: {duckdb_mirror.mirror_watermark()}")
+            self.stdout.write(self.style.SUCCESS('DuckDB mirror refreshed successfully!'))
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'DuckDB mirror refresh failed: {str(e)}')
+            )
+            sys.exit(1)
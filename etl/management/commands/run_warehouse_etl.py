@@ -1,6 +1,12 @@
 from django.core.management.base import BaseCommand
 from etl.warehouse_etl import DataWarehouseETL
 from etl.models import ETLJob
+from etl import claims, tracing
+from etl.tasks import rebuild_warehouse_async, run_warehouse_etl_async
+from etl.progress import JobProgress, last_duration
+from etl.profiling import (
+    CPUProfiler, MemoryProfiler, QueryProfiler, combine_profilers, get_profiler, profile_output_dir
+)
 from django.utils import timezone
 import sys
 
@@ -14,6 +20,42 @@ class Command(BaseCommand):
             action='store_true',
             help='Force run even if recent job exists',
         )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rebuild fact_orders in a shadow table and swap it in atomically (MySQL)',
+        )
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Queue the run on the Celery warehouse queue instead of running it here (rebuilds are rate limited)',
+        )
+        parser.add_argument(
+            '--pipelined',
+            action='store_true',
+            default=None,
+            help='Load facts with concurrent extract, transform and load stages',
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Record the SQL of every ETL stage, save it with the job and print a summary',
+        )
+        parser.add_argument(
+            '--profile-cpu',
+            action='store_true',
+            help='Profile every stage with cProfile (pstats, text report and collapsed stacks)',
+        )
+        parser.add_argument(
+            '--profile-mem',
+            action='store_true',
+            help='Report the largest allocations of every stage with tracemalloc',
+        )
+        parser.add_argument(
+            '--profile-dir',
+            type=str,
+            help='Directory for the CPU and memory reports (default: a new directory under ETL_PROFILE_DIR)',
+        )
 
     def handle(self, *args, **options):
         # Check for recent ETL jobs unless forced
@@ -32,18 +74,34 @@ class Command(BaseCommand):
                 )
                 return
         
+        if options['queue']:
+            self.queue_warehouse_etl(options['rebuild'])
+            return
+        
         # Create ETL job record
         etl_job = ETLJob.objects.create(
             name=f"Data Warehouse ETL - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}",
             status='running',
-            started_at=timezone.now()
+            started_at=timezone.now(),
+            trace_id=tracing.new_trace_id()
         )
         
         self.stdout.write("Starting data warehouse ETL process...")
         
+        profiler = QueryProfiler() if options['profile'] else get_profiler()
+        cpu_profiler = CPUProfiler() if options['profile_cpu'] else None
+        memory_profiler = MemoryProfiler() if options['profile_mem'] else None
+        job_progress = JobProgress(etl_job.id)
+        job_progress.start(expected_seconds=last_duration('Warehouse ETL'))
+        
         try:
-            warehouse_etl = DataWarehouseETL()
-            stats = warehouse_etl.run_full_etl()
+            warehouse_etl = DataWarehouseETL(
+                profiler=combine_profilers(profiler, memory_profiler, cpu_profiler), progress=job_progress
+            )
+            with tracing.span('warehouse_etl', trace_id=etl_job.trace_id, job_id=etl_job.id):
+                stats = warehouse_etl.run_full_etl(
+                    rebuild_facts=options['rebuild'], pipelined=options['pipelined']
+                )
             
             # Update job with results
             total_processed = sum(table_stats['processed'] for table_stats in stats.values())
@@ -57,9 +115,20 @@ class Command(BaseCommand):
             etl_job.records_errored = total_errors
             etl_job.status = 'completed'
             etl_job.completed_at = timezone.now()
+            if profiler:
+                etl_job.profile = profiler.report()
             etl_job.save()
+            job_progress.finish('completed')
             
             self.display_detailed_stats(stats)
+            if warehouse_etl.pipeline_stats:
+                self.display_pipeline_stats(warehouse_etl.pipeline_stats)
+            if options['profile']:
+                self.display_query_profile(etl_job.profile)
+            if cpu_profiler or memory_profiler:
+                self.write_stage_profiles(
+                    cpu_profiler, memory_profiler, options['profile_dir'] or profile_output_dir('warehouse')
+                )
             self.stdout.write(
                 self.style.SUCCESS('Data warehouse ETL process completed successfully!')
             )
@@ -69,13 +138,39 @@ class Command(BaseCommand):
             etl_job.status = 'failed'
             etl_job.error_message = str(e)
             etl_job.completed_at = timezone.now()
+            if profiler:
+                etl_job.profile = profiler.report()
             etl_job.save()
+            job_progress.finish('failed')
             
             self.stdout.write(
                 self.style.ERROR(f'Data warehouse ETL process failed: {str(e)}')
             )
             sys.exit(1)
 
+    def queue_warehouse_etl(self, rebuild):
+        """Create a pending ETL job and queue it for a warehouse worker."""
+        etl_job = ETLJob.objects.create(
+            name=f"Data Warehouse ETL - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            trace_id=tracing.new_trace_id(),
+            **claims.queued_lease()
+        )
+        task = rebuild_warehouse_async if rebuild else run_warehouse_etl_async
+        try:
+            task.delay(etl_job.id)
+        except Exception as e:
+            etl_job.status = 'failed'
+            etl_job.error_message = str(e)
+            etl_job.save()
+            self.stdout.write(
+                self.style.ERROR(f'Could not queue the data warehouse ETL: {str(e)}')
+            )
+            sys.exit(1)
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Data warehouse ETL queued as job {etl_job.id}')
+        )
+
     def display_detailed_stats(self, stats):
         """Display detailed statistics for each table."""
         self.stdout.write("\n" + "="*60)
@@ -102,3 +197,60 @@ class Command(BaseCommand):
         self.stdout.write(f"  Total Updated:   {total_updated}")
         self.stdout.write(f"  Total Errors:    {total_errors}")
         self.stdout.write("="*60)
+    
+    def display_pipeline_stats(self, pipeline_stats):
+        """Display the throughput of each fact pipeline stage."""
+        self.stdout.write("\nFACT PIPELINE STAGES:")
+        for stage, stage_stats in pipeline_stats.items():
+            self.stdout.write(
+                f"  {stage:<10} {stage_stats['rows']:>8} rows  {stage_stats['busy_seconds']:>8.2f}s busy  "
+                f"{stage_stats['rows_per_second'] or 0:>10.1f} rows/s  "
+                f"{(stage_stats['utilization'] or 0) * 100:>5.1f}% utilized"
+            )
+    
+    def display_query_profile(self, profile):
+        """Display the SQL profile of each ETL stage."""
+        self.stdout.write("\n" + "="*60)
+        self.stdout.write("SQL PROFILE")
+        self.stdout.write("="*60)
+        
+        for stage, stage_profile in profile.items():
+            aliases = ', '.join(
+                f"{alias} {alias_profile['queries']}" for alias, alias_profile in stage_profile['by_alias'].items()
+            )
+            self.stdout.write(
+                f"\n{stage.upper()}: {stage_profile['queries']} queries, "
+                f"{stage_profile['db_seconds']:.3f}s in the database ({aliases})"
+            )
+            for query in stage_profile['slowest'][:3]:
+                self.stdout.write(f"  slow  {query['seconds']:>8.4f}s  [{query['alias']}] {query['sql'][:120]}")
+            for shape in stage_profile['repeated']:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"  x{shape['count']:<6} {shape['seconds']:>7.4f}s  [{shape['alias']}] {shape['sql'][:120]}"
+                    )
+                )
+        self.stdout.write("="*60)
+    
+    def write_stage_profiles(self, cpu_profiler, memory_profiler, output_dir):
+        """Write the CPU and memory reports and display their summaries."""
+        if cpu_profiler:
+            self.stdout.write("\nCPU PROFILE (self time):")
+            for stage, stage_profile in cpu_profiler.write(output_dir).items():
+                self.stdout.write(f"  {stage}: {stage_profile['seconds']:.3f}s profiled across threads")
+                for function in stage_profile['top'][:5]:
+                    self.stdout.write(
+                        f"    {function['self_seconds']:>8.3f}s  {function['calls']:>9} calls  {function['function']}"
+                    )
+        if memory_profiler:
+            self.stdout.write("\nMEMORY PROFILE (net allocations):")
+            for stage, stage_profile in memory_profiler.write(output_dir).items():
+                self.stdout.write(
+                    f"  {stage}: {stage_profile['net_bytes'] / 1024:.1f} KiB net, "
+                    f"{stage_profile['peak_bytes'] / 1024 / 1024:.1f} MiB traced peak"
+                )
+                for allocation in stage_profile['top'][:5]:
+                    self.stdout.write(
+                        f"    {allocation['bytes'] / 1024:>10.1f} KiB  {allocation['blocks']:>8} blocks  {allocation['location']}"
+                    )
+        self.stdout.write(f"\nProfile reports written to {output_dir}")
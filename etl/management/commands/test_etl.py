@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from etl.services import ETLService
+from etl.profiling import CPUProfiler, MemoryProfiler, combine_profilers, profile_output_dir
 import sys
 
 
@@ -17,9 +18,26 @@ class Command(BaseCommand):
             action='store_true',
             help='Use sample data for testing',
         )
+        parser.add_argument(
+            '--profile-cpu',
+            action='store_true',
+            help='Profile every stage with cProfile (pstats, text report and collapsed stacks)',
+        )
+        parser.add_argument(
+            '--profile-mem',
+            action='store_true',
+            help='Report the largest allocations of every stage with tracemalloc',
+        )
+        parser.add_argument(
+            '--profile-dir',
+            type=str,
+            help='Directory for the CPU and memory reports (default: a new directory under ETL_PROFILE_DIR)',
+        )
 
     def handle(self, *args, **options):
-        etl_service = ETLService()
+        cpu_profiler = CPUProfiler() if options['profile_cpu'] else None
+        memory_profiler = MemoryProfiler() if options['profile_mem'] else None
+        etl_service = ETLService(profiler=combine_profilers(memory_profiler, cpu_profiler))
         
         if options['file']:
             self.stdout.write(f"Processing file: {options['file']}")
@@ -78,6 +96,11 @@ class Command(BaseCommand):
                 self.style.ERROR('Please specify --file or --sample')
             )
             sys.exit(1)
+        
+        if cpu_profiler or memory_profiler:
+            self.write_stage_profiles(
+                cpu_profiler, memory_profiler, options['profile_dir'] or profile_output_dir('ingest')
+            )
 
     def display_stats(self, stats):
         self.stdout.write(
@@ -89,6 +112,29 @@ class Command(BaseCommand):
         self.stdout.write(f"Records skipped: {stats['skipped']}")
         self.stdout.write(f"Records with errors: {stats['errors']}")
 
+    def write_stage_profiles(self, cpu_profiler, memory_profiler, output_dir):
+        """Write the CPU and memory reports and display their summaries."""
+        if cpu_profiler:
+            self.stdout.write("\nCPU PROFILE (self time):")
+            for stage, stage_profile in cpu_profiler.write(output_dir).items():
+                self.stdout.write(f"  {stage}: {stage_profile['seconds']:.3f}s profiled across threads")
+                for function in stage_profile['top'][:5]:
+                    self.stdout.write(
+                        f"    {function['self_seconds']:>8.3f}s  {function['calls']:>9} calls  {function['function']}"
+                    )
+        if memory_profiler:
+            self.stdout.write("\nMEMORY PROFILE (net allocations):")
+            for stage, stage_profile in memory_profiler.write(output_dir).items():
+                self.stdout.write(
+                    f"  {stage}: {stage_profile['net_bytes'] / 1024:.1f} KiB net, "
+                    f"{stage_profile['peak_bytes'] / 1024 / 1024:.1f} MiB traced peak"
+                )
+                for allocation in stage_profile['top'][:5]:
+                    self.stdout.write(
+                        f"    {allocation['bytes'] / 1024:>10.1f} KiB  {allocation['blocks']:>8} blocks  {allocation['location']}"
+                    )
+        self.stdout.write(f"\nProfile reports written to {output_dir}")
+
     def get_sample_data(self):
         return """order_id,customer_id,restaurant_name,cuisine_type,cost_of_the_order,day_of_the_week,rating,food_preparation_time,delivery_time,cust_first_name,cust_last_name,cust_email,cust_phone,cust_address,cust_city,cust_registration_date,rest_address,rest_city,rest_phone,rest_website,rest_price_range,rest_rating_avg,rest_opening_hour,rest_closing_hour,rest_established_date,is_weekend,is_holiday,del_first_name,del_last_name,del_phone,del_email,del_vehicle,del_hire_date,del_rating,delivery_person_id,tip_amount
 1477147,337525,Hangawi,Korean,30.75,Weekend,5,25,20,Kyle,White,hamiltonnicole@example.com,(687)256-0554x974,7620 Morris Curve,North Amanda,2022-11-27,969 Adkins Neck Apt. 368,Port Nicole,523-433-6080,www.hangawi.com,$$,3.27,9:00,22:00,2017-06-10,True,False,Sandra,Simmons,(276)857-0126,johnpace@example.com,scooter,2024-02-14,4.44,13,1.94
@@ -0,0 +1,399 @@
+"""
+ETL metrics in the Prometheus text exposition format.
+
+Counters and histograms are cheap enough for per-row hot loops: every
+thread increments its own cell without taking a lock, and the cells are only
+summed when the metrics are collected.
+
+The ETL runs in Celery workers while /metrics is served by the web workers,
+so every process publishes a snapshot of its metrics to the Django cache
+(at most every ETL_METRICS_PUBLISH_INTERVAL seconds, and at the end of each
+ETL stage). /metrics adds up the snapshots of all processes:
+
+- counters and histograms are summed; a process that stops publishing drops
+  out after ETL_METRICS_PROCESS_TTL, which Prometheus sees as a counter reset
+- for gauges the most recently set value wins
+
+Metrics that are cheaper to read from the database than to track (the ETLJob
+queue depth and the warehouse freshness) are computed when scraped.
+"""
+
+import bisect
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Any, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_PREFIX = 'etl_metrics'
+
+# Seconds; covers sub-second requests up to multi-hour warehouse rebuilds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0, 7200.0
+)
+
+
+class ThreadLocalCounter:
+    """
+    Sums keyed by label values, incremented without locking.
+
+    Each thread adds to its own dict; the lock is only taken when a thread
+    increments for the first time and when the totals are read. Cells of
+    threads that have exited are folded into a single dict.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cells = []
+        self._retired = {}
+
+    def inc(self, key: tuple, amount: float = 1):
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            cell = self._register()
+        cell[key] = cell.get(key, 0) + amount
+
+    def _register(self) -> dict:
+        cell = {}
+        with self._lock:
+            live = []
+            for thread, other in self._cells:
+                if thread.is_alive():
+                    live.append((thread, other))
+                else:
+                    self._merge(self._retired, other)
+            live.append((threading.current_thread(), cell))
+            self._cells = live
+        self._local.cell = cell
+        return cell
+
+    @staticmethod
+    def _merge(totals: dict, cell: dict):
+        # dict.copy() is atomic, so the owning thread may keep incrementing
+        for key, value in cell.copy().items():
+            totals[key] = totals.get(key, 0) + value
+
+    def totals(self) -> Dict[tuple, float]:
+        with self._lock:
+            totals = dict(self._retired)
+            cells = [cell for _, cell in self._cells]
+        for cell in cells:
+            self._merge(totals, cell)
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._cells = []
+            self._retired = {}
+            self._local = threading.local()
+
+
+class Counter:
+    """Monotonic counter, optionally labelled."""
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = ThreadLocalCounter()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values.inc(labelvalues, amount)
+
+    def values(self) -> Dict[tuple, float]:
+        return self._values.totals()
+
+    def reset(self):
+        self._values.reset()
+
+    def samples(self, values: Dict[tuple, Any]) -> List[Tuple[str, Dict[str, str], float]]:
+        return [
+            (self.name, dict(zip(self.labelnames, labelvalues)), value)
+            for labelvalues, value in sorted(values.items())
+        ]
+
+
+class Histogram(Counter):
+    """Distribution of observed values over fixed buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labelvalues, value: float):
+        self._values.inc(labelvalues + ('bucket', bisect.bisect_left(self.buckets, value)))
+        self._values.inc(labelvalues + ('sum',), value)
+        self._values.inc(labelvalues + ('count',))
+
+    def samples(self, values: Dict[tuple, Any]) -> List[Tuple[str, Dict[str, str], float]]:
+        series = {}
+        for key, value in values.items():
+            size = len(self.labelnames)
+            labelvalues, part = key[:size], key[size:]
+            entry = series.setdefault(labelvalues, {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0, 'count': 0})
+            if part[0] == 'bucket':
+                entry['buckets'][part[1]] += value
+            else:
+                entry[part[0]] += value
+
+        samples = []
+        for labelvalues, entry in sorted(series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry['buckets']):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((f'{self.name}_sum', labels, entry['sum']))
+            samples.append((f'{self.name}_count', labels, entry['count']))
+        return samples
+
+
+class Gauge(Counter):
+    """Value that is set rather than incremented; the latest value wins across processes."""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._lock = threading.Lock()
+        self._gauges = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        raise TypeError('Gauges are set, not incremented')
+
+    def set(self, *labelvalues, value: float):
+        with self._lock:
+            self._gauges[labelvalues] = (value, time.time())
+
+    def values(self) -> Dict[tuple, Tuple[float, float]]:
+        with self._lock:
+            return dict(self._gauges)
+
+    def reset(self):
+        with self._lock:
+            self._gauges = {}
+
+    def samples(self, values: Dict[tuple, Any]) -> List[Tuple[str, Dict[str, str], float]]:
+        return super().samples({labelvalues: value for labelvalues, (value, _) in values.items()})
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return f'{value:.1f}'
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """The metrics of this process and their publication through the cache."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_publish = 0.0
+        self.process_key = self._make_process_key()
+        if hasattr(os, 'register_at_fork'):
+            # Forked Celery workers must not publish their parent's counts again
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @staticmethod
+    def _make_process_key() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._last_publish = 0.0
+        self.process_key = self._make_process_key()
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def register(self, metric: Counter) -> Counter:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current values of this process's metrics."""
+        return {
+            'time': time.time(),
+            'metrics': {name: metric.values() for name, metric in self._metrics.items()},
+        }
+
+    def publish(self, force: bool = False) -> None:
+        """
+        Store this process's snapshot in the cache for /metrics.
+
+        Args:
+            force: Publish even if the last publication is more recent than
+                ETL_METRICS_PUBLISH_INTERVAL
+        """
+        now = time.monotonic()
+        interval = getattr(settings, 'ETL_METRICS_PUBLISH_INTERVAL', 10)
+        if not force and now - self._last_publish < interval:
+            return
+        self._last_publish = now
+
+        ttl = getattr(settings, 'ETL_METRICS_PROCESS_TTL', 86400)
+        try:
+            cache.set(f'{CACHE_PREFIX}:process:{self.process_key}', self.snapshot(), ttl)
+            processes = cache.get(f'{CACHE_PREFIX}:processes') or {}
+            if self.process_key not in processes:
+                cutoff = time.time() - ttl
+                processes = {key: seen for key, seen in processes.items() if seen >= cutoff}
+                processes[self.process_key] = time.time()
+                cache.set(f'{CACHE_PREFIX}:processes', processes, None)
+        except Exception as e:
+            logger.warning(f"Could not publish ETL metrics: {str(e)}")
+
+    def collect(self) -> Dict[str, Dict[tuple, Any]]:
+        """Values of every metric, combined over all publishing processes."""
+        snapshots = [self.snapshot()]
+        try:
+            processes = cache.get(f'{CACHE_PREFIX}:processes') or {}
+            keys = [f'{CACHE_PREFIX}:process:{key}' for key in processes if key != self.process_key]
+            snapshots.extend(cache.get_many(keys).values())
+        except Exception as e:
+            logger.warning(f"Could not read published ETL metrics: {str(e)}")
+
+        combined = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot['metrics'].items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                target = combined[name]
+                for key, value in values.items():
+                    if metric.type == 'gauge':
+                        if key not in target or value[1] > target[key][1]:
+                            target[key] = value
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return combined
+
+    def render(self, extra: Optional[List[Gauge]] = None) -> str:
+        """
+        Prometheus text exposition of all processes' metrics.
+
+        Args:
+            extra: Gauges computed for this scrape only
+        """
+        combined = self.collect()
+        families = [(metric, combined[name]) for name, metric in sorted(self._metrics.items())]
+        families += [(gauge, gauge.values()) for gauge in extra or []]
+
+        lines = []
+        for metric, values in families:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples(values):
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+ETL_ROWS = REGISTRY.register(Counter(
+    'etl_rows_total', 'Rows handled by ETL stages, by outcome', ['stage', 'outcome']
+))
+ETL_STAGE_DURATION = REGISTRY.register(Histogram(
+    'etl_stage_duration_seconds', 'Wall time of ETL stages', ['stage']
+))
+ETL_STAGE_THROUGHPUT = REGISTRY.register(Gauge(
+    'etl_stage_rows_per_second', 'Rows processed per second by the latest run of each ETL stage', ['stage']
+))
+ETL_RUNS = REGISTRY.register(Counter(
+    'etl_runs_total', 'Completed ETL runs, by kind and result', ['kind', 'result']
+))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'etl_http_request_duration_seconds', 'Latency of export and analytics requests', ['view', 'status']
+))
+
+
+@contextmanager
+def stage_timer(stage: str, processed: Optional[Callable[[], int]] = None):
+    """
+    Record the duration (and throughput) of an ETL stage, then publish.
+
+    Args:
+        stage: Stage name
+        processed: Returns the rows the stage has processed so far; read
+            before and after the stage to derive its rows per second
+    """
+    before = processed() if processed else 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        ETL_STAGE_DURATION.observe(stage, value=elapsed)
+        if processed and elapsed > 0:
+            ETL_STAGE_THROUGHPUT.set(stage, value=(processed() - before) / elapsed)
+        REGISTRY.publish(force=True)
+
+
+def observe_latency(view_name: str):
+    """Decorator recording a view's latency and response status."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                HTTP_REQUEST_DURATION.observe(view_name, str(status), value=time.perf_counter() - start)
+                REGISTRY.publish()
+        return wrapper
+    return decorator
+
+
+def scrape_gauges() -> List[Gauge]:
+    """Gauges read from the database at scrape time: ETL job queue depth and warehouse freshness."""
+    from django.db.models import Count, Max
+    from django.utils import timezone
+    from etl.models import ETLJob
+
+    queue_depth = Gauge('etl_jobs', 'ETL jobs by status (pending and queued jobs are the queue depth)', ['status'])
+    counts = dict(
+        ETLJob.objects.filter(status__in=['pending', 'queued', 'running']).values('status')
+        .annotate(jobs=Count('id')).values_list('status', 'jobs')
+    )
+    for status in ('pending', 'queued', 'running'):
+        queue_depth.set(status, value=counts.get(status, 0))
+
+    freshness = Gauge(
+        'etl_warehouse_freshness_seconds', 'Seconds since the last successful warehouse ETL run finished'
+    )
+    last_run = ETLJob.objects.filter(
+        name__contains='Warehouse ETL', status='completed'
+    ).aggregate(last=Max('completed_at'))['last']
+    if last_run:
+        freshness.set(value=(timezone.now() - last_run).total_seconds())
+    return [queue_depth, freshness]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.urls import reverse
 from django.core.files.storage import default_storage
 import os
 
@@ -8,6 +9,7 @@ class ETLJob(models.Model):
     
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('queued', 'Queued'),
         ('running', 'Running'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
@@ -29,10 +31,24 @@ class ETLJob(models.Model):
     
     error_message = models.TextField(null=True, blank=True)
     
+    # Per-stage SQL profile of the run (etl.profiling), when profiling was enabled
+    profile = models.JSONField(null=True, blank=True)
+    
+    # Trace (etl.tracing) the job's spans belong to
+    trace_id = models.CharField(max_length=32, blank=True, default='', db_index=True)
+    
+    # Process that queued or started the job, and when a queued job may be
+    # claimed again (etl.claims)
+    claimed_by = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         db_table = 'etl_jobs'
         ordering = ['-created_at']
         app_label = 'etl'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='etl_jobs_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"ETL Job: {self.name} - {self.status}"
@@ -46,6 +62,7 @@ class DataUpload(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     etl_job = models.ForeignKey(ETLJob, on_delete=models.CASCADE, null=True, blank=True)
+    trace_id = models.CharField(max_length=32, blank=True, default='')
     
     class Meta:
         db_table = 'data_uploads'
@@ -66,3 +83,54 @@ class DataUpload(models.Model):
         if self.file:
             if default_storage.exists(self.file.name):
                 default_storage.delete(self.file.name)
+
+
+class ExportJob(models.Model):
+    """Model to track asynchronous data export jobs."""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('csv', 'Gzip CSV'),
+        ('parquet', 'Parquet'),
+    ]
+    
+    export_type = models.CharField(max_length=50, default='orders')
+    file_format = models.CharField(max_length=20, choices=FORMAT_CHOICES, default='csv')
+    filters = models.JSONField(default=dict, blank=True)
+    requested_by = models.CharField(max_length=150, blank=True, default='')  # Username; users live in the OLTP database
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file_path = models.CharField(max_length=500, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    # Progress
+    total_chunks = models.IntegerField(default=0)
+    chunks_completed = models.IntegerField(default=0)
+    records_exported = models.IntegerField(default=0)
+    
+    error_message = models.TextField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'export_jobs'
+        ordering = ['-created_at']
+        app_label = 'etl'
+    
+    def __str__(self):
+        return f"Export Job: {self.export_type} ({self.file_format}) - {self.status}"
+    
+    def get_download_url(self):
+        """Get the URL of the exported file; it is served only to the user who requested it."""
+        if self.status != 'completed' or not self.file_path:
+            return None
+        return reverse('etl:export_download', args=[self.id])
+    
+    def can_access(self, user):
+        """Whether user may see this export job and download its file."""
+        return user.is_staff or (bool(self.requested_by) and self.requested_by == user.get_username())
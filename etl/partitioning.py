@@ -0,0 +1,269 @@
+"""
+Monthly RANGE partitioning of fact_orders by date_id (MySQL).
+
+Each partition holds one month of date_ids and is named pYYYYMM:
+
+    PARTITION p202401 VALUES LESS THAN (20240201)
+    PARTITION p202402 VALUES LESS THAN (20240301)
+    ...
+    PARTITION pmax    VALUES LESS THAN MAXVALUE
+
+Queries filtering on date_id only read the matching partitions, and retiring
+a month of history is a DROP PARTITION instead of a large DELETE.
+
+MySQL requires the partitioning column in every unique key and does not allow
+foreign keys on partitioned InnoDB tables, so partitioning the table redefines
+the primary key as (order_id, date_id) and drops its foreign key constraints.
+The ETL keeps order_id unique and only writes dimension keys it has loaded.
+"""
+
+import logging
+from datetime import date
+from typing import Dict, List, Any, Optional, Tuple
+
+from django.db import connections
+
+from core.models import FactOrders
+
+logger = logging.getLogger(__name__)
+
+
+TABLE = FactOrders._meta.db_table
+MAXVALUE_PARTITION = 'pmax'
+
+
+class PartitioningError(Exception):
+    """Raised when fact_orders cannot be (re)partitioned."""
+
+
+def _add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def _month_of(date_id: int) -> Tuple[int, int]:
+    return date_id // 10000, date_id // 100 % 100
+
+
+def partition_name(year: int, month: int) -> str:
+    """Name of the partition holding a month."""
+    return f'p{year:04d}{month:02d}'
+
+
+def partition_bound(year: int, month: int) -> int:
+    """Exclusive upper date_id of a month's partition (first day of the next month)."""
+    next_year, next_month = _add_months(year, month, 1)
+    return next_year * 10000 + next_month * 100 + 1
+
+
+def _partition_definitions(first: Tuple[int, int], last: Tuple[int, int]) -> List[str]:
+    definitions = []
+    year, month = first
+    while (year, month) <= last:
+        definitions.append(
+            f'PARTITION {partition_name(year, month)} VALUES LESS THAN ({partition_bound(year, month)})'
+        )
+        year, month = _add_months(year, month, 1)
+    return definitions
+
+
+def _mysql_connection(using: str):
+    connection = connections[using]
+    if connection.vendor != 'mysql':
+        raise PartitioningError(f'Partitioning requires MySQL, {using} uses {connection.vendor}')
+    return connection
+
+
+def get_partitions(using: str = 'olapdb') -> List[Dict[str, Any]]:
+    """
+    List the partitions of fact_orders.
+
+    Returns:
+        List of dictionaries with name, less_than (None for MAXVALUE) and
+        estimated rows, in partition order. Empty if the table is not partitioned.
+    """
+    connection = connections[using]
+    if connection.vendor != 'mysql':
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, [TABLE])
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'name': name,
+            'less_than': None if description == 'MAXVALUE' else int(description),
+            'rows': table_rows,
+        }
+        for name, description, table_rows in rows
+    ]
+
+
+def is_partitioned(using: str = 'olapdb') -> bool:
+    """Whether fact_orders is partitioned."""
+    return bool(get_partitions(using))
+
+
+def partition_table(using: str = 'olapdb', months_ahead: int = 3) -> List[str]:
+    """
+    Convert fact_orders into a monthly RANGE partitioned table.
+
+    Partitions cover the months present in the table up to months_ahead
+    months after the current month, plus a MAXVALUE catch-all.
+
+    Args:
+        using: Database alias of the warehouse
+        months_ahead: Number of future months to create partitions for
+
+    Returns:
+        Names of the partitions created
+    """
+    connection = _mysql_connection(using)
+    if is_partitioned(using):
+        raise PartitioningError(f'{TABLE} is already partitioned')
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT CONSTRAINT_NAME
+            FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, [TABLE])
+        foreign_keys = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(f'SELECT MIN(date_id), MAX(date_id) FROM {TABLE}')
+        min_date_id, max_date_id = cursor.fetchone()
+
+        today = date.today()
+        first = _month_of(min_date_id) if min_date_id else (today.year, today.month)
+        latest = max(_month_of(max_date_id) if max_date_id else first, (today.year, today.month))
+        last = _add_months(*latest, months_ahead)
+        definitions = _partition_definitions(first, last)
+
+        if foreign_keys:
+            drops = ', '.join(f'DROP FOREIGN KEY `{name}`' for name in foreign_keys)
+            logger.info(f"Dropping foreign keys on {TABLE}: {', '.join(foreign_keys)}")
+            cursor.execute(f'ALTER TABLE {TABLE} {drops}')
+
+        cursor.execute(f'ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (order_id, date_id)')
+        cursor.execute(
+            f"ALTER TABLE {TABLE} PARTITION BY RANGE (date_id) ("
+            f"{', '.join(definitions)}, "
+            f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE)"
+        )
+
+    names = [definition.split()[1] for definition in definitions] + [MAXVALUE_PARTITION]
+    logger.info(f"Partitioned {TABLE} into {len(names)} partitions")
+    return names
+
+
+def ensure_partitions(using: str = 'olapdb', through_date_id: Optional[int] = None,
+                      months_ahead: int = 3) -> List[str]:
+    """
+    Create monthly partitions up to months_ahead months after the current
+    month (or after through_date_id, if later).
+
+    New months are split out of the MAXVALUE partition, which stays empty as
+    long as partitions are created ahead of the data.
+
+    Args:
+        using: Database alias of the warehouse
+        through_date_id: Latest date_id that is about to be loaded
+        months_ahead: Number of months to keep ahead
+
+    Returns:
+        Names of the partitions created (empty if none were needed or the
+        table is not partitioned)
+    """
+    partitions = get_partitions(using)
+    bounds = [partition['less_than'] for partition in partitions if partition['less_than'] is not None]
+    if not bounds:
+        return []
+
+    today = date.today()
+    latest = (today.year, today.month)
+    if through_date_id:
+        latest = max(latest, _month_of(through_date_id))
+    last = _add_months(*latest, months_ahead)
+    first = _month_of(max(bounds))  # the highest bound is the first day of the first missing month
+
+    definitions = _partition_definitions(first, last)
+    if not definitions:
+        return []
+
+    with _mysql_connection(using).cursor() as cursor:
+        if any(partition['name'] == MAXVALUE_PARTITION for partition in partitions):
+            cursor.execute(
+                f"ALTER TABLE {TABLE} REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO ("
+                f"{', '.join(definitions)}, "
+                f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE)"
+            )
+        else:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD PARTITION ({', '.join(definitions)})")
+
+    names = [definition.split()[1] for definition in definitions]
+    logger.info(f"Created {TABLE} partitions: {', '.join(names)}")
+    return names
+
+
+def drop_partitions_before(year: int, month: int, using: str = 'olapdb') -> List[str]:
+    """
+    Retire history by dropping every monthly partition before a month.
+
+    Args:
+        year: Year of the first month to keep
+        month: First month to keep
+        using: Database alias of the warehouse
+
+    Returns:
+        Names of the partitions dropped
+    """
+    names = partitions_before(year * 10000 + month * 100 + 1, using)
+    if not names:
+        return []
+
+    with _mysql_connection(using).cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(names)}")
+
+    logger.info(f"Dropped {TABLE} partitions: {', '.join(names)}")
+    return names
+
+
+def partitions_before(cutoff: int, using: str = 'olapdb') -> List[str]:
+    """Names of the monthly partitions holding only date_ids before cutoff."""
+    return [
+        partition['name'] for partition in get_partitions(using)
+        if partition['less_than'] is not None and partition['less_than'] <= cutoff
+    ]
+
+
+def detach_partition(name: str, target: str, using: str = 'olapdb') -> None:
+    """
+    Move the rows of a partition into a new table and drop the partition.
+
+    EXCHANGE PARTITION swaps the rows into `target` as a metadata operation.
+    It runs under LOCK TABLES together with the DROP PARTITION, so no write
+    can land in the partition between the two statements. Later writes for
+    the partition's dates go to the next partition.
+
+    Args:
+        name: Partition to detach
+        target: Name of the table created to receive its rows (must not exist)
+        using: Database alias of the warehouse
+    """
+    with _mysql_connection(using).cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {target} LIKE {TABLE}')
+        cursor.execute(f'ALTER TABLE {target} REMOVE PARTITIONING')
+        cursor.execute(f'LOCK TABLES {TABLE} WRITE, {target} WRITE')
+        try:
+            cursor.execute(f'ALTER TABLE {TABLE} EXCHANGE PARTITION {name} WITH TABLE {target}')
+            cursor.execute(f'ALTER TABLE {TABLE} DROP PARTITION {name}')
+        finally:
+            cursor.execute('UNLOCK TABLES')
+
+    logger.info(f"Detached {TABLE} partition {name} into {target}")
@@ -0,0 +1,300 @@
+"""
+Pipelined fact load: OLTP extraction, transformation and OLAP loading run
+concurrently, connected by bounded queues.
+
+    extract (one thread per order shard) -> transform -> load
+
+- extract streams orders in chunks of chunk_size from every order shard
+- transform resolves the dimension keys of a whole chunk with one query per
+  dimension and derives the fact measures (DataWarehouseETL._build_fact_data)
+- load upserts a chunk into fact_orders with one bulk insert and one bulk
+  update per chunk
+
+Each queue holds at most queue_size chunks, so a fast stage blocks until the
+next one catches up (backpressure) and memory stays bounded. Every stage
+records its rows and busy time, which run() reports as per-stage throughput.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Any
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import (
+    Order, DimCustomer, DimRestaurant, DimDate, DimLocation, DimTimeslot, DimDeliveryPerson,
+    FactOrders, FactOrdersArchive
+)
+from etl.connection_pool import release_connections
+
+logger = logging.getLogger(__name__)
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has failed."""
+
+
+class _Stage:
+    """Rows and busy time of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, rows: int, seconds: float):
+        with self._lock:
+            self.rows += rows
+            self.busy += seconds
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'busy_seconds': round(self.busy, 3),
+            'rows_per_second': round(self.rows / self.busy, 1) if self.busy else None,
+            'utilization': round(self.busy / elapsed, 3) if elapsed else None,
+        }
+
+
+class FactOrdersPipeline:
+    """
+    Pipelined replacement for DataWarehouseETL.extract_fact_orders.
+
+    Args:
+        etl: The DataWarehouseETL run the facts belong to (stats, etl_version,
+            touched sketch cells and shard aliases)
+        chunk_size: Orders per chunk
+        queue_size: Chunks buffered between two stages
+    """
+
+    def __init__(self, etl, chunk_size: int = 1000, queue_size: int = 4):
+        self.etl = etl
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.stages = {name: _Stage(name) for name in ('extract', 'transform', 'load')}
+        self._aborted = threading.Event()
+        self._errors = []
+        self._dates = None
+        self._time_slots = None
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load all facts through the pipeline.
+
+        Returns:
+            Per-stage rows, busy seconds, rows per busy second and utilization
+            (busy share of the pipeline's wall time)
+        """
+        start_time = time.monotonic()
+        extracted = queue.Queue(maxsize=self.queue_size)
+        transformed = queue.Queue(maxsize=self.queue_size)
+
+        archived_order_ids = set(
+            FactOrdersArchive.objects.using('olapdb').values_list('order_id', flat=True)
+        )
+
+        readers = [
+            self._thread(f'extract-{alias}', self._extract, alias, extracted)
+            for alias in self.etl.shard_aliases
+        ]
+        threads = readers + [
+            self._thread('transform', self._transform, extracted, transformed, len(readers), archived_order_ids),
+            self._thread('load', self._load, transformed),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        elapsed = time.monotonic() - start_time
+        report = {name: stage.report(elapsed) for name, stage in self.stages.items()}
+        for name, stage_report in report.items():
+            logger.info(
+                f"Pipeline {name}: {stage_report['rows']} rows, {stage_report['busy_seconds']}s busy, "
+                f"{stage_report['rows_per_second']} rows/s, {stage_report['utilization']} utilization"
+            )
+        logger.info(f"Fact orders pipeline completed in {elapsed:.2f} seconds")
+        return report
+
+    def _thread(self, name: str, target, *args) -> threading.Thread:
+        target = self.etl._bind(target)
+
+        def run():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except Exception as e:
+                logger.error(f"Fact orders pipeline stage {name} failed: {str(e)}")
+                self._errors.append(e)
+                self._aborted.set()
+            finally:
+                release_connections()
+
+        return threading.Thread(target=run, name=f'fact-pipeline-{name}', daemon=True)
+
+    def _put(self, target: queue.Queue, item):
+        """Put with backpressure, giving up once another stage failed."""
+        while True:
+            if self._aborted.is_set():
+                raise PipelineAborted()
+            try:
+                target.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source: queue.Queue):
+        while True:
+            if self._aborted.is_set():
+                raise PipelineAborted()
+            try:
+                return source.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _extract(self, alias: str, extracted: queue.Queue):
+        orders = Order.objects.using(alias).select_related(
+            'customer', 'restaurant', 'day', 'delivery_person'
+        ).iterator(chunk_size=self.chunk_size)
+
+        try:
+            chunk = []
+            started = time.monotonic()
+            for order in orders:
+                chunk.append(order)
+                if len(chunk) >= self.chunk_size:
+                    self.stages['extract'].record(len(chunk), time.monotonic() - started)
+                    self._put(extracted, chunk)
+                    chunk = []
+                    started = time.monotonic()
+            if chunk:
+                self.stages['extract'].record(len(chunk), time.monotonic() - started)
+                self._put(extracted, chunk)
+        finally:
+            self._put(extracted, _DONE)
+
+    def _transform(self, extracted: queue.Queue, transformed: queue.Queue, readers: int,
+                   archived_order_ids: set):
+        try:
+            while readers:
+                chunk = self._get(extracted)
+                if chunk is _DONE:
+                    readers -= 1
+                    continue
+
+                started = time.monotonic()
+                dimensions = self._prefetch_dimensions(chunk)
+                # A chunk comes from one shard; orders also held by an earlier shard are loaded from there
+                shadowed_order_ids = self.etl._shadowed_order_ids(
+                    chunk[0]._state.db, [order.order_id for order in chunk]
+                )
+                facts = []
+                for order in chunk:
+                    self.etl._update_stats('fact_orders', 'processed')
+                    if order.order_id in archived_order_ids or order.order_id in shadowed_order_ids:
+                        continue
+                    try:
+                        order_data = self.etl._build_fact_data(order, dimensions)
+                        if order_data is None:
+                            logger.warning(f"Missing dimension data for order {order.order_id}")
+                            continue
+                        facts.append((order.order_id, order_data))
+                    except Exception as e:
+                        self.etl._update_stats('fact_orders', 'errors')
+                        logger.error(f"Error processing order {order.order_id}: {str(e)}")
+                self.stages['transform'].record(len(chunk), time.monotonic() - started)
+                self._put(transformed, facts)
+        finally:
+            self._put(transformed, _DONE)
+
+    def _prefetch_dimensions(self, chunk: List[Order]) -> Dict[str, Dict[Any, Any]]:
+        """Load the dimension rows a chunk of orders refers to, one query per dimension."""
+        olap = 'olapdb'
+        customer_ids = {order.customer.customer_id for order in chunk}
+        restaurant_ids = {order.restaurant.restaurant_id for order in chunk}
+        delivery_person_ids = {order.delivery_person.delivery_person_id for order in chunk if order.delivery_person}
+        cities = {order.customer.city for order in chunk}
+
+        locations = {}
+        for location in DimLocation.objects.using(olap).filter(city__in=cities).order_by('-location_id'):
+            locations[location.city] = location  # first match by id wins, like .first()
+
+        return {
+            'customer': DimCustomer.objects.using(olap).in_bulk(customer_ids),
+            'restaurant': DimRestaurant.objects.using(olap).in_bulk(restaurant_ids),
+            'delivery_person': DimDeliveryPerson.objects.using(olap).in_bulk(delivery_person_ids),
+            # Order dates are derived per order, so the date dimension is loaded whole
+            'date': self._date_dimension(),
+            'location': locations,
+            'time_slot': self._time_slot_dimension(),
+        }
+
+    def _date_dimension(self) -> Dict[int, DimDate]:
+        if self._dates is None:
+            self._dates = DimDate.objects.using('olapdb').in_bulk()
+        return self._dates
+
+    def _time_slot_dimension(self) -> Dict[int, DimTimeslot]:
+        if self._time_slots is None:
+            self._time_slots = DimTimeslot.objects.using('olapdb').in_bulk()
+        return self._time_slots
+
+    def _load(self, transformed: queue.Queue):
+        fields = [field for field in FactOrders._meta.concrete_fields if field.name != 'order_id']
+        while True:
+            facts = self._get(transformed)
+            if facts is _DONE:
+                return
+
+            started = time.monotonic()
+            existing = FactOrders.objects.using('olapdb').in_bulk(
+                [order_id for order_id, _ in facts], field_name='order_id'
+            )
+            now = timezone.now()
+            inserts, updates, touched, seen = [], [], set(), set()
+            for order_id, order_data in facts:
+                # The first fact of an order_id wins, so one bulk_create never inserts it twice
+                if order_id in seen:
+                    continue
+                seen.add(order_id)
+                cell = (order_data['restaurant'].restaurant_id, order_data['date'].date_id)
+                fact_order = existing.get(order_id)
+                if fact_order is None:
+                    inserts.append(FactOrders(
+                        order_id=order_id, etl_version=self.etl.etl_version, updated_at=now, **order_data
+                    ))
+                    touched.add(cell)
+                    continue
+
+                previous_cell = (fact_order.restaurant_id, fact_order.date_id)
+                updated = False
+                for field, value in order_data.items():
+                    if getattr(fact_order, field) != value:
+                        setattr(fact_order, field, value)
+                        updated = True
+                if updated:
+                    fact_order.etl_version = self.etl.etl_version
+                    fact_order.updated_at = now
+                    updates.append(fact_order)
+                    touched.update((previous_cell, cell))
+
+            with transaction.atomic(using='olapdb'):
+                FactOrders.objects.using('olapdb').bulk_create(inserts)
+                FactOrders.objects.using('olapdb').bulk_update(updates, [field.name for field in fields])
+
+            self.etl._update_stats('fact_orders', 'inserted', len(inserts))
+            self.etl._update_stats('fact_orders', 'updated', len(updates))
+            self.etl._touched_cells.update(touched)
+            self.stages['load'].record(len(facts), time.monotonic() - started)
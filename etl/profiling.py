@@ -0,0 +1,504 @@
+"""
+Opt-in per-stage profilers for ETL runs.
+
+Every profiler attributes work to the ETL stage active in the current thread:
+
+    profiler = QueryProfiler()
+    with profiler.stage('dim_customer'):
+        ...
+    profiler.report()
+
+Work handed to other threads must be wrapped with profiler.bind(fn), which
+runs fn under the stage that was active when it was bound. Stages can be
+nested: statements count towards the innermost stage, CPU time and
+allocations towards the outermost stage of a thread.
+
+- QueryProfiler installs a connection.execute_wrapper on every configured
+  database alias (default, olapdb, order shards and replicas). For each stage
+  it reports the query count and total database time per alias, the slowest
+  statements and the normalized statement shapes executed many times, which
+  is how N+1 query patterns show up.
+- CPUProfiler runs cProfile in every thread working on a stage and writes a
+  pstats dump, a text report and flamegraph-compatible collapsed stacks per
+  stage.
+- MemoryProfiler diffs tracemalloc snapshots taken around each stage and
+  writes the source lines that allocated the most memory. tracemalloc traces
+  the whole process, so stages running concurrently (the dimensions) see
+  each other's allocations.
+
+ProfilerGroup runs several profilers over the same stages.
+"""
+
+import cProfile
+import heapq
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager, nullcontext
+from typing import Callable, Dict, List, Any, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_VALUES_LIST = re.compile(r'(VALUES\s*\([^)]*\))(?:\s*,\s*\([^)]*\))+', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_OBJECT_ADDRESS = re.compile(r' at 0x[0-9a-f]+')
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Reduce a statement to its shape: literals become ?, placeholder lists and
+    multi-row VALUES collapse, whitespace is squeezed.
+    """
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _PLACEHOLDER_LIST.sub('(...)', shape)
+    shape = _VALUES_LIST.sub(r'\1, ...', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class _StageStats:
+    """Statements recorded for one stage."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.by_alias = {}
+        self.shapes = {}
+        self.slowest = []  # min-heap of (seconds, sequence, alias, sql)
+        self._sequence = 0
+
+    def record(self, alias: str, sql: str, seconds: float, slowest: int):
+        self.queries += 1
+        self.seconds += seconds
+        alias_stats = self.by_alias.setdefault(alias, {'queries': 0, 'seconds': 0.0})
+        alias_stats['queries'] += 1
+        alias_stats['seconds'] += seconds
+
+        shape = normalize_sql(sql)
+        shape_stats = self.shapes.setdefault(shape, {'count': 0, 'seconds': 0.0, 'alias': alias})
+        shape_stats['count'] += 1
+        shape_stats['seconds'] += seconds
+
+        self._sequence += 1
+        entry = (seconds, self._sequence, alias, sql)
+        if len(self.slowest) < slowest:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+class StageProfiler:
+    """
+    Base class tracking the stage of each thread. Subclasses measure the
+    outermost stage of a thread in _measure(name).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Attribute the work of the current thread to a stage.
+
+        Stages can be nested; work counts towards the innermost one.
+        """
+        previous = getattr(self._local, 'stage', None)
+        self._local.stage = name
+        try:
+            with self._measure(name) if previous is None else nullcontext():
+                yield
+        finally:
+            self._local.stage = previous
+
+    def bind(self, fn: Callable, stage: Optional[str] = None) -> Callable:
+        """
+        Wrap fn to run under a stage in whichever thread calls it.
+
+        Args:
+            fn: Callable handed to another thread
+            stage: Stage name (defaults to the current thread's stage)
+        """
+        name = stage or getattr(self._local, 'stage', None)
+        if name is None:
+            return fn
+
+        def run_in_stage(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+
+        return run_in_stage
+
+    def _measure(self, name: str):
+        raise NotImplementedError
+
+
+class QueryProfiler(StageProfiler):
+    """
+    Records the SQL executed by each ETL stage.
+
+    Args:
+        slowest: Number of slowest statements kept per stage
+        duplicate_threshold: Executions of one statement shape within a stage
+            from which it is reported as repeated (likely N+1)
+        max_sql_length: Statements are truncated to this length in the report
+    """
+
+    def __init__(self, slowest: int = 10, duplicate_threshold: int = 20, max_sql_length: int = 500):
+        super().__init__()
+        self.slowest = slowest
+        self.duplicate_threshold = duplicate_threshold
+        self.max_sql_length = max_sql_length
+        self.aliases = list(settings.DATABASES)
+        self._stages = {}
+
+    @contextmanager
+    def _measure(self, name: str):
+        # Statements are attributed to the thread's current (innermost) stage
+        with ExitStack() as stack:
+            for alias in self.aliases:
+                stack.enter_context(connections[alias].execute_wrapper(self._execute))
+            yield
+
+    def _execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            name = getattr(self._local, 'stage', None) or 'other'
+            with self._lock:
+                stats = self._stages.setdefault(name, _StageStats())
+                stats.record(context['connection'].alias, sql, seconds, self.slowest)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarize the recorded stages.
+
+        Returns:
+            Per stage: query count, database seconds, per-alias figures, the
+            slowest statements and the repeated statement shapes
+        """
+        report = {}
+        with self._lock:
+            for name, stats in self._stages.items():
+                repeated = sorted(
+                    (
+                        {'sql': shape[:self.max_sql_length], 'alias': shape_stats['alias'],
+                         'count': shape_stats['count'], 'seconds': round(shape_stats['seconds'], 4)}
+                        for shape, shape_stats in stats.shapes.items()
+                        if shape_stats['count'] >= self.duplicate_threshold
+                    ),
+                    key=lambda shape: shape['count'], reverse=True
+                )
+                report[name] = {
+                    'queries': stats.queries,
+                    'db_seconds': round(stats.seconds, 4),
+                    'distinct_shapes': len(stats.shapes),
+                    'by_alias': {
+                        alias: {'queries': alias_stats['queries'], 'seconds': round(alias_stats['seconds'], 4)}
+                        for alias, alias_stats in sorted(stats.by_alias.items())
+                    },
+                    'slowest': [
+                        {'sql': sql[:self.max_sql_length], 'alias': alias, 'seconds': round(seconds, 4)}
+                        for seconds, _, alias, sql in sorted(stats.slowest, reverse=True)
+                    ],
+                    'repeated': repeated,
+                }
+        return report
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to the project, or the last two components for libraries."""
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        return os.path.relpath(filename, base_dir)
+    return os.path.join(*filename.split(os.sep)[-2:])
+
+
+def _function_label(function: tuple) -> str:
+    """Readable, flamegraph-safe name of a pstats function key."""
+    filename, line, name = function
+    if filename == '~':
+        label = _OBJECT_ADDRESS.sub('', name)
+    else:
+        label = f"{name} ({_short_path(filename)}:{line})"
+    return label.replace(';', ',')
+
+
+def collapsed_stacks(stats: pstats.Stats, max_depth: int = 64) -> Dict[str, int]:
+    """
+    Rebuild call stacks from a cProfile caller graph in collapsed format.
+
+    cProfile keeps caller/callee edges rather than full stacks, so a
+    function's time is split among its callers in proportion to the time
+    spent in it from each of them.
+
+    Returns:
+        Semicolon-joined stack -> microseconds of self time
+    """
+    entries = stats.stats
+    callees = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+    roots = [
+        function for function, entry in entries.items()
+        if not any(caller in entries for caller in entry[4])
+    ]
+
+    stacks = {}
+
+    def walk(function, path, labels, cumulative):
+        _, _, self_time, function_cumulative, _ = entries[function]
+        share = cumulative / function_cumulative if function_cumulative else 0.0
+        labels = labels + [_function_label(function)]
+        micros = int(self_time * share * 1e6)
+        if micros:
+            key = ';'.join(labels)
+            stacks[key] = stacks.get(key, 0) + micros
+        if len(labels) >= max_depth:
+            return
+        for callee, edge_cumulative in callees.get(function, ()):
+            if callee in path:
+                continue  # recursion is folded into the outermost call
+            callee_cumulative = edge_cumulative * share
+            if callee_cumulative >= 1e-6:
+                walk(callee, path | {callee}, labels, callee_cumulative)
+
+    for root in roots:
+        walk(root, {root}, [], entries[root][3])
+    return stacks
+
+
+def _stage_filename(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+class CPUProfiler(StageProfiler):
+    """
+    Runs cProfile over every thread working on an ETL stage.
+
+    write() produces per stage:
+        <stage>.prof       pstats dump (snakeviz, pstats.Stats)
+        <stage>.txt        functions sorted by cumulative time
+        <stage>.collapsed  collapsed stacks for flamegraph.pl / speedscope
+
+    Args:
+        top: Functions listed per stage in the summary
+    """
+
+    def __init__(self, top: int = 15):
+        super().__init__()
+        self.top = top
+        self._profiles = {}
+
+    @contextmanager
+    def _measure(self, name: str):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process, so
+            # concurrent stages cannot all be profiled there
+            logger.warning(f"cProfile already active, not profiling {name} in {threading.current_thread().name}")
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.setdefault(name, []).append(profile)
+
+    def write(self, output_dir: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Write the per-stage reports to output_dir.
+
+        Returns:
+            Per stage: profiled seconds and the functions with the most self time
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        summary = {}
+        with self._lock:
+            profiles = dict(self._profiles)
+
+        for name, stage_profiles in profiles.items():
+            stats = pstats.Stats(*stage_profiles)
+            base = os.path.join(output_dir, _stage_filename(name))
+            stats.dump_stats(f'{base}.prof')
+
+            report = io.StringIO()
+            pstats.Stats(*stage_profiles, stream=report).sort_stats('cumulative').print_stats(60)
+            with open(f'{base}.txt', 'w', encoding='utf-8') as file:
+                file.write(report.getvalue())
+
+            with open(f'{base}.collapsed', 'w', encoding='utf-8') as file:
+                for stack, micros in sorted(collapsed_stacks(stats).items()):
+                    file.write(f'{stack} {micros}\n')
+
+            top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]
+            summary[name] = {
+                'seconds': round(stats.total_tt, 4),
+                'top': [
+                    {'function': _function_label(function), 'calls': calls,
+                     'self_seconds': round(self_time, 4), 'cumulative_seconds': round(cumulative, 4)}
+                    for function, (_, calls, self_time, cumulative, _) in top
+                ],
+            }
+        return summary
+
+
+class MemoryProfiler(StageProfiler):
+    """
+    Records the memory allocated by each ETL stage with tracemalloc.
+
+    tracemalloc is started by the first stage (unless already tracing) and
+    stopped by write(). Allocations made by tracemalloc itself and by the
+    import system are left out.
+
+    Args:
+        top: Source lines listed per stage
+        frames: Traceback frames kept per allocation
+    """
+
+    _EXCLUDED = {
+        tracemalloc.__file__,
+        '<frozen importlib._bootstrap>',
+        '<frozen importlib._bootstrap_external>',
+        '<unknown>',
+    }
+
+    def __init__(self, top: int = 25, frames: int = 1):
+        super().__init__()
+        self.top = top
+        self.frames = frames
+        self._started = False
+        self._diffs = {}
+        self._peaks = {}
+
+    @contextmanager
+    def _measure(self, name: str):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._started = True
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            # Filtering the grouped statistics is much cheaper than filtering every trace
+            diff = [
+                stat for stat in tracemalloc.take_snapshot().compare_to(before, 'lineno')
+                if stat.traceback[0].filename not in self._EXCLUDED
+            ]
+            _, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                self._diffs.setdefault(name, []).extend(diff)
+                self._peaks[name] = max(self._peaks.get(name, 0), peak)
+
+    def write(self, output_dir: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Write <stage>.allocations.txt per stage to output_dir and stop tracing.
+
+        Returns:
+            Per stage: net allocated bytes, the process's traced peak and the
+            source lines that allocated the most
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        with self._lock:
+            if self._started:
+                tracemalloc.stop()
+                self._started = False
+            diffs = dict(self._diffs)
+
+        summary = {}
+        for name, stage_diffs in diffs.items():
+            lines = {}
+            for stat in stage_diffs:
+                frame = stat.traceback[0]
+                key = f'{_short_path(frame.filename)}:{frame.lineno}'
+                size, count = lines.get(key, (0, 0))
+                lines[key] = (size + stat.size_diff, count + stat.count_diff)
+            ranked = sorted(lines.items(), key=lambda item: item[1][0], reverse=True)
+
+            with open(os.path.join(output_dir, f'{_stage_filename(name)}.allocations.txt'), 'w', encoding='utf-8') as file:
+                for location, (size, count) in ranked:
+                    if size <= 0:
+                        break
+                    file.write(f'{size / 1024:>12.1f} KiB {count:>10} blocks  {location}\n')
+
+            summary[name] = {
+                'net_bytes': sum(size for size, _ in lines.values()),
+                'peak_bytes': self._peaks.get(name, 0),
+                'top': [
+                    {'location': location, 'bytes': size, 'blocks': count}
+                    for location, (size, count) in ranked[:self.top] if size > 0
+                ],
+            }
+        return summary
+
+
+class ProfilerGroup:
+    """
+    Runs several profilers over the same stages. They are entered in the given
+    order, so the last one measures the least of the others' overhead.
+    """
+
+    def __init__(self, profilers: List[StageProfiler]):
+        self.profilers = profilers
+
+    @contextmanager
+    def stage(self, name: str):
+        with ExitStack() as stack:
+            for profiler in self.profilers:
+                stack.enter_context(profiler.stage(name))
+            yield
+
+    def bind(self, fn: Callable, stage: Optional[str] = None) -> Callable:
+        # Wrapped inside out, so the threads enter the stages in the same order
+        for profiler in reversed(self.profilers):
+            fn = profiler.bind(fn, stage)
+        return fn
+
+
+def combine_profilers(*profilers: Optional[StageProfiler]):
+    """
+    Profiler running all of the given ones (see ProfilerGroup for the order),
+    None when none is given.
+    """
+    active = [profiler for profiler in profilers if profiler is not None]
+    if not active:
+        return None
+    if len(active) == 1:
+        return active[0]
+    return ProfilerGroup(active)
+
+
+def profile_output_dir(prefix: str) -> str:
+    """New directory for the CPU and memory reports of one run under ETL_PROFILE_DIR."""
+    return os.path.join(
+        str(getattr(settings, 'ETL_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))),
+        f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}"
+    )
+
+
+def get_profiler() -> Optional[QueryProfiler]:
+    """A new profiler when ETL_QUERY_PROFILING_ENABLED is set, else None."""
+    if getattr(settings, 'ETL_QUERY_PROFILING_ENABLED', False):
+        return QueryProfiler()
+    return None
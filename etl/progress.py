@@ -0,0 +1,225 @@
+"""
+Live progress of running ETL jobs, published through the Django cache.
+
+While a job runs, every process working on it publishes the rows it has done
+and the stages it is in, at most every ETL_PROGRESS_PUBLISH_INTERVAL seconds
+and whenever a stage starts or ends. Rows are added with cache.incr, so the
+chunk tasks of one file, running in different workers, add up to the job's
+total.
+
+    job_progress = JobProgress(job.id)
+    job_progress.start(rows_total=90)
+    with job_progress.stage('ingest'):
+        job_progress.advance()
+    job_progress.finish('completed')
+
+read_progress() returns the progress of a job with its throughput and ETA,
+read_progress_many() that of several jobs in one cache round trip. The
+dashboard follows its active jobs through one Server-Sent Events stream,
+which reads the cache instead of the ETLJob table while the jobs run.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from etl import metrics
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_PREFIX = 'etl_progress'
+
+FINISHED = ('completed', 'failed')
+
+
+def _state_key(job_id: int) -> str:
+    return f'{CACHE_PREFIX}:job:{job_id}'
+
+
+def _rows_key(job_id: int) -> str:
+    return f'{CACHE_PREFIX}:job:{job_id}:rows'
+
+
+def _ttl() -> int:
+    return getattr(settings, 'ETL_PROGRESS_TTL', 3600)
+
+
+class JobProgress:
+    """
+    Publishes this process's share of a job's progress.
+
+    advance() is called once per row from any thread; it only increments a
+    per-thread counter until the publish interval has passed.
+    """
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._rows = metrics.ThreadLocalCounter()
+        self._published_rows = 0
+        self._stages = []
+        self._lock = threading.Lock()
+        self._next_publish = 0.0
+
+    def start(self, rows_total: Optional[int] = None, expected_seconds: Optional[float] = None) -> None:
+        """
+        Reset the job's progress. Call once per job, before its work is
+        spread over several tasks.
+
+        Args:
+            rows_total: Rows the job will process, if known, for the ETA
+            expected_seconds: Expected duration, for the ETA of jobs whose
+                row count is not known in advance
+        """
+        try:
+            cache.set(_rows_key(self.job_id), 0, _ttl())
+            cache.set(_state_key(self.job_id), {
+                'status': 'running',
+                'started_at': time.time(),
+                'rows_total': rows_total,
+                'expected_seconds': expected_seconds,
+                'stages': [],
+                'updated_at': time.time(),
+            }, _ttl())
+        except Exception as e:
+            logger.warning(f"Could not publish progress of ETL job {self.job_id}: {str(e)}")
+
+    @contextmanager
+    def stage(self, name: str):
+        """Report the enclosed work as a stage the job is in."""
+        with self._lock:
+            self._stages.append(name)
+        self.publish(force=True)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stages.remove(name)
+            self.publish(force=True)
+
+    def advance(self, rows: int = 1) -> None:
+        """Count processed rows."""
+        self._rows.inc('rows', rows)
+        if time.monotonic() >= self._next_publish:
+            self.publish()
+
+    def publish(self, force: bool = False) -> None:
+        """
+        Add the rows done since the last publication to the job's progress.
+
+        Args:
+            force: Publish even if the last publication is more recent than
+                ETL_PROGRESS_PUBLISH_INTERVAL
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and now < self._next_publish:
+                return
+            self._next_publish = now + getattr(settings, 'ETL_PROGRESS_PUBLISH_INTERVAL', 1.0)
+            rows = self._rows.totals().get('rows', 0)
+            new_rows, self._published_rows = rows - self._published_rows, rows
+            stages = list(self._stages)
+
+        try:
+            if new_rows:
+                try:
+                    cache.incr(_rows_key(self.job_id), new_rows)
+                except ValueError:
+                    # The counter expired or start() was not called
+                    cache.set(_rows_key(self.job_id), new_rows, _ttl())
+            self._update_state(stages=stages)
+        except Exception as e:
+            logger.warning(f"Could not publish progress of ETL job {self.job_id}: {str(e)}")
+
+    def finish(self, status: str) -> None:
+        """Publish the remaining rows and mark the job completed or failed."""
+        self.publish(force=True)
+        try:
+            self._update_state(status=status, stages=[], finished_at=time.time())
+        except Exception as e:
+            logger.warning(f"Could not publish progress of ETL job {self.job_id}: {str(e)}")
+
+    def _update_state(self, **changes) -> None:
+        state = cache.get(_state_key(self.job_id)) or {'status': 'running', 'started_at': time.time()}
+        state.update(changes, updated_at=time.time())
+        cache.set(_state_key(self.job_id), state, _ttl())
+
+
+def read_progress(job_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Progress of a job from the cache.
+
+    Returns:
+        Dict with job_id, status, stage, rows_done, rows_total,
+        rows_per_second, elapsed_seconds, eta_seconds and updated_at, or None
+        if the job has not published any progress
+    """
+    return read_progress_many([job_id]).get(job_id)
+
+
+def read_progress_many(job_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Progress of several jobs, read from the cache in one round trip.
+
+    Returns:
+        read_progress() dicts by job id, for the jobs that published progress
+    """
+    job_ids = list(job_ids)
+    try:
+        values = cache.get_many(
+            [_state_key(job_id) for job_id in job_ids] + [_rows_key(job_id) for job_id in job_ids]
+        )
+    except Exception as e:
+        logger.warning(f"Could not read progress of ETL jobs {job_ids}: {str(e)}")
+        return {}
+
+    states = {}
+    for job_id in job_ids:
+        state = values.get(_state_key(job_id))
+        if state is not None:
+            states[job_id] = _progress(job_id, state, values.get(_rows_key(job_id)) or 0)
+    return states
+
+
+def _progress(job_id: int, state: Dict[str, Any], rows_done: int) -> Dict[str, Any]:
+    started_at = state.get('started_at') or state['updated_at']
+    elapsed = (state.get('finished_at') or time.time()) - started_at
+    rate = rows_done / elapsed if elapsed > 0 else 0.0
+    rows_total = state.get('rows_total')
+
+    eta = None
+    if state['status'] not in FINISHED:
+        if rows_total and rate:
+            eta = max(rows_total - rows_done, 0) / rate
+        elif state.get('expected_seconds'):
+            eta = max(state['expected_seconds'] - elapsed, 0)
+
+    return {
+        'job_id': job_id,
+        'status': state['status'],
+        'stage': ', '.join(state.get('stages') or []) or None,
+        'rows_done': rows_done,
+        'rows_total': rows_total,
+        'rows_per_second': round(rate, 1),
+        'elapsed_seconds': round(elapsed, 1),
+        'eta_seconds': round(eta, 1) if eta is not None else None,
+        'updated_at': state['updated_at'],
+    }
+
+
+def last_duration(name_contains: str) -> Optional[float]:
+    """Seconds taken by the most recent completed job whose name contains name_contains."""
+    from etl.models import ETLJob
+
+    last_run = ETLJob.objects.filter(
+        name__contains=name_contains, status='completed',
+        started_at__isnull=False, completed_at__isnull=False
+    ).order_by('-completed_at').values_list('started_at', 'completed_at').first()
+    if last_run is None:
+        return None
+    return (last_run[1] - last_run[0]).total_seconds()
@@ -0,0 +1,116 @@
+"""
+Blue/green rebuild of fact_orders (MySQL).
+
+A rebuild loads every fact row into a shadow table, fact_orders_next, while
+readers keep using fact_orders untouched:
+
+1. create_shadow_table() clones fact_orders (columns, primary key and
+   partitioning) and drops the clone's secondary indexes, so the bulk load
+   only maintains the primary key
+2. insert_rows() bulk loads the shadow table
+3. build_indexes() adds all secondary indexes back in a single ALTER TABLE
+4. swap() exchanges the tables with one atomic RENAME TABLE and drops the
+   old table
+
+Readers see either the complete old table or the complete new one.
+CREATE TABLE ... LIKE does not copy foreign keys, so like a partitioned
+fact_orders, a rebuilt one carries none; the ETL only writes dimension keys
+it has loaded.
+"""
+
+import logging
+from typing import List, Sequence
+
+from django.db import connections
+
+from core.models import FactOrders
+
+logger = logging.getLogger(__name__)
+
+
+TABLE = FactOrders._meta.db_table
+SHADOW_TABLE = f'{TABLE}_next'
+OLD_TABLE = f'{TABLE}_old'
+COLUMNS = [field.column for field in FactOrders._meta.concrete_fields]
+
+
+class RebuildError(Exception):
+    """Raised when a blue/green rebuild cannot run."""
+
+
+def _mysql_connection(using: str):
+    connection = connections[using]
+    if connection.vendor != 'mysql':
+        raise RebuildError(f'Blue/green rebuilds require MySQL, {using} uses {connection.vendor}')
+    return connection
+
+
+def create_shadow_table(using: str = 'olapdb') -> List[str]:
+    """
+    Create an empty fact_orders_next without secondary indexes.
+
+    Returns:
+        ALTER TABLE clauses that recreate the secondary indexes after the load
+    """
+    connection = _mysql_connection(using)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SHADOW_TABLE}')
+        cursor.execute(f'CREATE TABLE {SHADOW_TABLE} LIKE {TABLE}')
+
+        cursor.execute("""
+            SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME, SUB_PART
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME <> 'PRIMARY'
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX
+        """, [SHADOW_TABLE])
+
+        indexes = {}
+        for index_name, non_unique, column_name, sub_part in cursor.fetchall():
+            index = indexes.setdefault(index_name, {'unique': not non_unique, 'columns': []})
+            index['columns'].append(f'`{column_name}`({sub_part})' if sub_part else f'`{column_name}`')
+
+        if indexes:
+            drops = ', '.join(f'DROP INDEX `{name}`' for name in indexes)
+            cursor.execute(f'ALTER TABLE {SHADOW_TABLE} {drops}')
+
+    logger.info(f"Created {SHADOW_TABLE} with {len(indexes)} deferred indexes")
+    return [
+        f"ADD {'UNIQUE ' if index['unique'] else ''}INDEX `{name}` ({', '.join(index['columns'])})"
+        for name, index in indexes.items()
+    ]
+
+
+def insert_rows(rows: Sequence[Sequence], using: str = 'olapdb') -> None:
+    """Bulk insert rows (values in COLUMNS order) into the shadow table."""
+    if not rows:
+        return
+    placeholders = ', '.join(['%s'] * len(COLUMNS))
+    with _mysql_connection(using).cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SHADOW_TABLE} ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            rows
+        )
+
+
+def build_indexes(index_definitions: List[str], using: str = 'olapdb') -> None:
+    """Build all secondary indexes of the shadow table in one pass."""
+    if not index_definitions:
+        return
+    with _mysql_connection(using).cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {SHADOW_TABLE} {', '.join(index_definitions)}")
+    logger.info(f"Built {len(index_definitions)} indexes on {SHADOW_TABLE}")
+
+
+def swap(using: str = 'olapdb') -> None:
+    """Atomically replace fact_orders with the shadow table and drop the old one."""
+    with _mysql_connection(using).cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {OLD_TABLE}')
+        cursor.execute(f'RENAME TABLE {TABLE} TO {OLD_TABLE}, {SHADOW_TABLE} TO {TABLE}')
+        cursor.execute(f'DROP TABLE {OLD_TABLE}')
+    logger.info(f"Swapped {SHADOW_TABLE} into {TABLE}")
+
+
+def drop_shadow_table(using: str = 'olapdb') -> None:
+    """Remove a partially loaded shadow table."""
+    with _mysql_connection(using).cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SHADOW_TABLE}')
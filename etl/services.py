@@ -1,22 +1,37 @@
 import csv
+import itertools
+import os
 import logging
 from decimal import Decimal
 from datetime import datetime, time
-from typing import Dict, List, Any, Optional
-from django.db import transaction
-from django.core.exceptions import ValidationError
+from typing import Dict, List, Any, Optional, Tuple
+from contextlib import contextmanager, nullcontext
+from django.db import IntegrityError, InterfaceError, OperationalError, transaction
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.conf import settings
 from core.models import Customer, Restaurant, Day, DeliveryPerson, Order
+from core.sharding import get_shard_aliases, is_sharded, reference_alias, shard_for_customer
+from etl import metrics, tracing
 
 logger = logging.getLogger(__name__)
 
+# Rows whose order ids are looked up on the other shards in one query per shard
+ORDER_LOOKUP_BATCH_SIZE = 500
+
 
 class ETLService:
     """
     Service class for ETL operations to load unnormalized data into OLTP tables.
     """
     
-    def __init__(self):
+    def __init__(self, profiler=None, progress=None):
+        """
+        Args:
+            profiler: Optional etl.profiling.QueryProfiler recording the SQL
+                of the ingest and of an automatically triggered warehouse ETL
+            progress: Optional etl.progress.JobProgress the ingested rows are
+                reported to
+        """
         self.stats = {
             'processed': 0,
             'inserted': 0,
@@ -24,6 +39,35 @@ class ETLService:
             'errors': 0,
             'skipped': 0
         }
+        
+        # Reference rows (model, pk) already copied to every order shard
+        self._replicated = set()
+        
+        # Shards known to hold the order ids of the rows being loaded
+        self._order_shards = {}
+        
+        self.profiler = profiler
+        self.progress = progress
+    
+    def _count(self, stat_type: str):
+        """Count a row in the stats, in the etl_rows_total metric and in the job's progress."""
+        self.stats[stat_type] += 1
+        metrics.ETL_ROWS.inc('ingest', stat_type)
+        if stat_type == 'processed' and self.progress:
+            self.progress.advance()
+    
+    @contextmanager
+    def _stage(self, name: str):
+        """
+        Run the enclosed work as a traced stage, timed for the metrics
+        endpoint, attributed to the stage by the profiler and reported as the
+        job's current stage.
+        """
+        with tracing.span(name) as stage_span, metrics.stage_timer(name, lambda: self.stats['processed']):
+            with self.profiler.stage(name) if self.profiler else nullcontext():
+                with self.progress.stage(name) if self.progress else nullcontext():
+                    yield
+            stage_span.set_attribute('rows', self.stats['processed'])
     
     def process_csv_file(self, file_path: str) -> Dict[str, int]:
         """
@@ -38,17 +82,9 @@ class ETLService:
         self.stats = {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            with open(file_path, 'r', encoding='utf-8') as file, self._stage('ingest'):
                 csv_reader = csv.DictReader(file)
-                
-                for row in csv_reader:
-                    self.stats['processed'] += 1
-                    try:
-                        self._process_row(row)
-                        self.stats['inserted'] += 1
-                    except Exception as e:
-                        self.stats['errors'] += 1
-                        logger.error(f"Error processing row {self.stats['processed']}: {str(e)}")
+                self._load_rows(csv_reader)
                         
         except Exception as e:
             logger.error(f"Error reading CSV file {file_path}: {str(e)}")
@@ -56,6 +92,52 @@ class ETLService:
             
         return self.stats
     
+    def split_csv_file(self, file_path: str, output_dir: str, chunk_size: int) -> List[Tuple[str, int]]:
+        """
+        Split a CSV file into chunk files that can be processed independently.
+
+        Every chunk repeats the header row. Rows are copied through the csv
+        module, so quoted fields spanning several lines stay intact.
+
+        Args:
+            file_path: Path to the CSV file
+            output_dir: Directory for the chunk files
+            chunk_size: Maximum rows per chunk
+
+        Returns:
+            Paths and row counts of the chunk files, in file order
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        chunks = []
+        chunk_file = writer = None
+
+        try:
+            with open(file_path, 'r', encoding='utf-8', newline='') as file:
+                csv_reader = csv.reader(file)
+                header = next(csv_reader, None)
+                if header is None:
+                    return chunks
+
+                for index, row in enumerate(csv_reader):
+                    if index % chunk_size == 0:
+                        if chunk_file:
+                            chunk_file.close()
+                        chunks.append((os.path.join(output_dir, f'chunk_{len(chunks):05d}.csv'), 0))
+                        chunk_file = open(chunks[-1][0], 'w', encoding='utf-8', newline='')
+                        writer = csv.writer(chunk_file)
+                        writer.writerow(header)
+                    writer.writerow(row)
+                    chunks[-1] = (chunks[-1][0], chunks[-1][1] + 1)
+
+        except Exception as e:
+            logger.error(f"Error splitting CSV file {file_path}: {str(e)}")
+            raise
+        finally:
+            if chunk_file:
+                chunk_file.close()
+
+        return chunks
+
     def process_csv_data(self, csv_data: str) -> Dict[str, int]:
         """
         Process CSV data from string.
@@ -75,14 +157,8 @@ class ETLService:
                 
             csv_reader = csv.DictReader(lines)
             
-            for row in csv_reader:
-                self.stats['processed'] += 1
-                try:
-                    self._process_row(row)
-                    self.stats['inserted'] += 1
-                except Exception as e:
-                    self.stats['errors'] += 1
-                    logger.error(f"Error processing row {self.stats['processed']}: {str(e)}")
+            with self._stage('ingest'):
+                self._load_rows(csv_reader)
                     
         except Exception as e:
             logger.error(f"Error processing CSV data: {str(e)}")
@@ -90,25 +166,114 @@ class ETLService:
             
         return self.stats
     
-    @transaction.atomic
+    def _load_rows(self, rows) -> None:
+        """
+        Load rows in batches of ORDER_LOOKUP_BATCH_SIZE, looking up which
+        shards already hold a batch's order ids with one query per shard.
+        """
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, ORDER_LOOKUP_BATCH_SIZE))
+            if not batch:
+                return
+            self._lookup_order_shards(batch)
+            for row in batch:
+                self._load_row(row)
+    
+    def _lookup_order_shards(self, rows: List[Dict[str, str]]) -> None:
+        """Record the shards holding the order ids of rows, when orders are sharded."""
+        self._order_shards = {}
+        if not is_sharded():
+            return
+        
+        order_ids = set()
+        for row in rows:
+            try:
+                order_ids.add(int(row.get('order_id', 0)))
+            except (TypeError, ValueError):
+                pass
+        for alias in get_shard_aliases():
+            for order_id in Order.objects.using(alias).filter(order_id__in=order_ids).values_list('order_id', flat=True):
+                self._order_shards.setdefault(order_id, set()).add(alias)
+    
+    def _load_row(self, row: Dict[str, str]) -> None:
+        """
+        Process a row and count it as inserted, or as an error if its data is invalid.
+        
+        A row that loses a race on a natural key (another worker inserted the
+        same restaurant, day, customer or order first) is retried once in a new
+        transaction, whose get_or_create then reads the committed row instead
+        of dropping it. Database connection errors, deadlocks and lock wait
+        timeouts are raised, so the chunk task is retried as a whole.
+        
+        Args:
+            row: Dictionary containing the row data
+        """
+        self._count('processed')
+        try:
+            try:
+                self._process_row(row)
+            except (IntegrityError, ObjectDoesNotExist):
+                self._process_row(row)
+            self._count('inserted')
+        except (OperationalError, InterfaceError):
+            raise
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Error processing row {self.stats['processed']}: {str(e)}")
+    
     def _process_row(self, row: Dict[str, str]) -> None:
         """
         Process a single row of unnormalized data.
         
+        Reference rows are created on the reference shard and copied to the
+        other shards first; they are committed even if the order fails, so
+        every shard keeps the same primary keys. The customer and order are
+        then written to the customer's shard in one transaction.
+        
         Args:
             row: Dictionary containing the row data
         """
         # Extract and validate data
         cleaned_row = self._clean_row_data(row)
+        shard = shard_for_customer(cleaned_row['customer_id'])
         
         # Create or get related entities
-        customer = self._get_or_create_customer(cleaned_row)
-        restaurant = self._get_or_create_restaurant(cleaned_row)
-        day = self._get_or_create_day(cleaned_row)
-        delivery_person = self._get_or_create_delivery_person(cleaned_row)
+        restaurant = self._replicate(self._get_or_create_restaurant(cleaned_row))
+        day = self._replicate(self._get_or_create_day(cleaned_row))
+        delivery_person = self._replicate(self._get_or_create_delivery_person(cleaned_row))
         
-        # Create order
-        self._create_order(cleaned_row, customer, restaurant, day, delivery_person)
+        with transaction.atomic(using=shard):
+            customer = self._get_or_create_customer(cleaned_row, shard)
+            
+            # Create order
+            self._create_order(cleaned_row, customer, restaurant, day, delivery_person, shard)
+    
+    def _replicate(self, instance):
+        """
+        Copy a reference row to every order shard with the same primary key.
+        
+        Args:
+            instance: Restaurant, Day or DeliveryPerson from the reference shard
+            
+        Returns:
+            The instance, for chaining
+        """
+        key = (type(instance), instance.pk)
+        if key in self._replicated:
+            return instance
+        
+        model = type(instance)
+        values = {
+            field.attname: getattr(instance, field.attname)
+            for field in model._meta.concrete_fields if not field.primary_key
+        }
+        for alias in get_shard_aliases():
+            if alias != reference_alias():
+                model.objects.using(alias).update_or_create(pk=instance.pk, defaults=values)
+        
+        self._replicated.add(key)
+        return instance
     
     def _clean_row_data(self, row: Dict[str, str]) -> Dict[str, Any]:
         """
@@ -190,9 +355,9 @@ class ETLService:
         
         return cleaned
     
-    def _get_or_create_customer(self, data: Dict[str, Any]) -> Customer:
-        """Get or create customer from data."""
-        customer, created = Customer.objects.get_or_create(
+    def _get_or_create_customer(self, data: Dict[str, Any], shard: str = 'default') -> Customer:
+        """Get or create customer from data on the customer's shard."""
+        customer, created = Customer.objects.using(shard).get_or_create(
             customer_id=data['customer_id'],
             defaults={
                 'first_name': data['cust_first_name'],
@@ -227,14 +392,14 @@ class ETLService:
                 customer.city = data['cust_city']
                 updated = True
             if updated:
-                customer.save()
-                self.stats['updated'] += 1
+                customer.save(using=shard)
+                self._count('updated')
         
         return customer
     
     def _get_or_create_restaurant(self, data: Dict[str, Any]) -> Restaurant:
         """Get or create restaurant from data."""
-        restaurant, created = Restaurant.objects.get_or_create(
+        restaurant, created = Restaurant.objects.using(reference_alias()).get_or_create(
             restaurant_name=data['restaurant_name'],
             defaults={
                 'cuisine_type': data['cuisine_type'],
@@ -254,7 +419,7 @@ class ETLService:
     
     def _get_or_create_day(self, data: Dict[str, Any]) -> Day:
         """Get or create day from data."""
-        day, created = Day.objects.get_or_create(
+        day, created = Day.objects.using(reference_alias()).get_or_create(
             day_name=data['day_of_the_week'],
             defaults={
                 'is_weekend': data['is_weekend'],
@@ -266,7 +431,7 @@ class ETLService:
     
     def _get_or_create_delivery_person(self, data: Dict[str, Any]) -> DeliveryPerson:
         """Get or create delivery person from data."""
-        delivery_person, created = DeliveryPerson.objects.get_or_create(
+        delivery_person, created = DeliveryPerson.objects.using(reference_alias()).get_or_create(
             delivery_person_id=data['delivery_person_id'],
             defaults={
                 'first_name': data['del_first_name'],
@@ -282,9 +447,25 @@ class ETLService:
         return delivery_person
     
     def _create_order(self, data: Dict[str, Any], customer: Customer, 
-                     restaurant: Restaurant, day: Day, delivery_person: DeliveryPerson) -> Order:
-        """Create order from data."""
-        order, created = Order.objects.get_or_create(
+                     restaurant: Restaurant, day: Day, delivery_person: DeliveryPerson,
+                     shard: str = 'default') -> Order:
+        """
+        Create order from data on the customer's shard.
+        
+        order_id is only unique within a shard, so an order_id that another
+        shard held when the batch was looked up (_lookup_order_shards), or that
+        an earlier row of this load put there, is skipped. Chunks loading at
+        the same time can still both insert an order_id on different shards;
+        the warehouse ETL then loads it from the first shard only
+        (DataWarehouseETL._shadowed_order_ids), which is the actual guard.
+        """
+        held_by = self._order_shards.setdefault(data['order_id'], set())
+        if held_by - {shard}:
+            self._count('skipped')
+            logger.warning(f"Order {data['order_id']} already exists on shard {sorted(held_by - {shard})[0]}, skipping")
+            return None
+        
+        order, created = Order.objects.using(shard).get_or_create(
             order_id=data['order_id'],
             defaults={
                 'customer': customer,
@@ -299,9 +480,10 @@ class ETLService:
             }
         )
         
+        held_by.add(shard)
         if not created:
             # Order already exists, skip
-            self.stats['skipped'] += 1
+            self._count('skipped')
             logger.warning(f"Order {data['order_id']} already exists, skipping")
         
         return order
@@ -421,13 +603,15 @@ class ETLService:
                 name="Auto Warehouse ETL",
                 description="Automatically triggered warehouse ETL after data load",
                 status="running",
-                started_at=timezone.now()
+                started_at=timezone.now(),
+                trace_id=tracing.current_span().trace_id if tracing.current_span() else ''
             )
             
             try:
                 # Run the warehouse ETL
-                warehouse_etl = DataWarehouseETL()
-                warehouse_stats = warehouse_etl.run_full_etl()
+                warehouse_etl = DataWarehouseETL(profiler=self.profiler)
+                with tracing.span('warehouse_etl', job_id=job.id):
+                    warehouse_stats = warehouse_etl.run_full_etl()
                 
                 # Update job record
                 job.status = "completed"
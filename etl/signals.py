@@ -3,8 +3,11 @@ from django.db.models.signals import post_save
 from django.utils import timezone
 from .models import DataUpload, ETLJob
 from .services import ETLService
+from .progress import JobProgress
 from .tasks import process_etl_file_async
+from . import claims, executor, tracing
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -17,24 +20,37 @@ def trigger_etl_processing(sender, instance, created, **kwargs):
     if created and not instance.processed:
         logger.info(f"New file uploaded: {instance.original_filename}. Triggering ETL processing.")
         
-        # Create ETL job
-        etl_job = ETLJob.objects.create(
-            name=f"Process {instance.original_filename}",
-            file_path=instance.get_file_path(),
-            status='pending'
-        )
-        
-        # Link upload to job
-        instance.etl_job = etl_job
-        instance.save(update_fields=['etl_job'])
-        
-        # Trigger async processing (if Celery is available)
-        try:
-            process_etl_file_async.delay(etl_job.id)
-        except Exception as e:
-            logger.warning(f"Celery not available, processing synchronously: {e}")
-            # Process synchronously as fallback
-            process_etl_file_sync(etl_job.id)
+        with tracing.span('signal.post_save', trace_id=instance.trace_id or None, upload_id=instance.id) as signal_span:
+            # Create ETL job in the upload's trace
+            etl_job = ETLJob.objects.create(
+                name=f"Process {instance.original_filename}",
+                file_path=instance.get_file_path(),
+                trace_id=signal_span.trace_id,
+                **claims.queued_lease()
+            )
+            
+            # Link upload to job
+            instance.etl_job = etl_job
+            instance.trace_id = signal_span.trace_id
+            instance.save(update_fields=['etl_job', 'trace_id'])
+            
+            queue_etl_job(etl_job)
+
+
+def queue_etl_job(etl_job):
+    """
+    Queue a file job on Celery, or on the local background executor if
+    Celery is not available. Never processes the file in the caller.
+    """
+    try:
+        with tracing.span('celery.enqueue', kind='producer', job_id=etl_job.id) as enqueue_span:
+            process_etl_file_async.apply_async((etl_job.id,), headers={
+                tracing.TRACEPARENT_HEADER: enqueue_span.traceparent(),
+                tracing.ENQUEUED_AT_HEADER: time.time(),
+            })
+    except Exception as e:
+        logger.warning(f"Celery not available, processing in the background: {e}")
+        executor.get_executor().submit(etl_job.id)
 
 
 def process_etl_file_sync(etl_job_id):
@@ -42,14 +58,18 @@ def process_etl_file_sync(etl_job_id):
     Process ETL file synchronously.
     """
     try:
+        if not claims.start_job(etl_job_id):
+            logger.info(f"ETL job {etl_job_id} was already started, skipping")
+            return
         etl_job = ETLJob.objects.get(id=etl_job_id)
-        etl_job.status = 'running'
-        etl_job.started_at = timezone.now()
-        etl_job.save()
         
-        etl_service = ETLService()
-        result = etl_service.process_csv_file_with_warehouse_etl(etl_job.file_path)
-        stats = result['etl_stats']
+        with claims.running_lease(etl_job.id), \
+                tracing.span('process_etl_file', trace_id=etl_job.trace_id or None, job_id=etl_job.id):
+            job_progress = JobProgress(etl_job.id)
+            job_progress.start()
+            etl_service = ETLService(progress=job_progress)
+            result = etl_service.process_csv_file_with_warehouse_etl(etl_job.file_path)
+            stats = result['etl_stats']
         
         # Update job with results
         etl_job.records_processed = stats['processed']
@@ -68,6 +88,7 @@ def process_etl_file_sync(etl_job_id):
                 etl_job.notes = f"Warehouse ETL triggered and completed successfully. Job ID: {result.get('job_id')}"
         
         etl_job.save()
+        job_progress.finish('completed')
         
         # Mark upload as processed
         if hasattr(etl_job, 'dataupload_set'):
@@ -83,5 +104,6 @@ def process_etl_file_sync(etl_job_id):
             etl_job.error_message = str(e)
             etl_job.completed_at = timezone.now()
             etl_job.save()
+            JobProgress(etl_job_id).finish('failed')
         except:
             pass
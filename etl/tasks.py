@@ -1,26 +1,178 @@
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
 from django.utils import timezone
 from .models import ETLJob
 from .services import ETLService
+from .warehouse_etl import DataWarehouseETL
+from .exports import run_export_job
+from .archival import archive_facts
+from .profiling import get_profiler
+from .progress import JobProgress, last_duration
+from . import claims, tracing
 import logging
+import os
+import shutil
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
-def process_etl_file_async(etl_job_id):
+def _task_header(request, name):
+    """A custom message header of the running task."""
+    value = getattr(request, name, None)
+    if value is None:
+        value = (getattr(request, 'headers', None) or {}).get(name)
+    return value
+
+
+def _chunk_dir(etl_job_id, attempt):
+    # One directory per attempt, so the chord of a reclaimed attempt cannot
+    # remove the chunks of the attempt that replaced it
+    return os.path.join(settings.ETL_INGEST_CHUNK_DIR, f'job_{etl_job_id}', attempt)
+
+
+def _remove_chunks(etl_job_id, attempt):
+    chunk_dir = _chunk_dir(etl_job_id, attempt)
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    try:
+        # The job's directory, once no other attempt uses it
+        os.rmdir(os.path.dirname(chunk_dir))
+    except OSError:
+        pass
+
+
+def _attempt_owner(attempt):
+    """The claimed_by of a job while the split task attempt owns it and its chord."""
+    return f'celery:{attempt}'
+
+
+@shared_task(bind=True)
+def process_etl_file_async(self, etl_job_id):
     """
     Celery task to process ETL file asynchronously.
+    
+    Splits the file into chunks of ETL_INGEST_CHUNK_SIZE rows and fans them
+    out as parallel ingest_etl_chunk tasks; merge_etl_chunks then completes
+    the job and queues the warehouse ETL as a task of its own. The job is
+    held for the chord once it is dispatched (claims.hold_job).
     """
+    attempt = self.request.id or uuid.uuid4().hex
+    owner = _attempt_owner(attempt)
     try:
+        # A job queued twice (e.g. by the signal and an expired lease) runs once
+        if not claims.start_job(etl_job_id, owner=owner):
+            logger.info(f"ETL job {etl_job_id} was already started, skipping duplicate task")
+            return 0
         etl_job = ETLJob.objects.get(id=etl_job_id)
-        etl_job.status = 'running'
-        etl_job.started_at = timezone.now()
-        etl_job.save()
         
-        etl_service = ETLService()
-        result = etl_service.process_csv_file_with_warehouse_etl(etl_job.file_path)
-        stats = result['etl_stats']
+        # Continue the upload's trace, recording the time the task spent queued
+        traceparent = _task_header(self.request, tracing.TRACEPARENT_HEADER)
+        enqueued_at = _task_header(self.request, tracing.ENQUEUED_AT_HEADER)
+        parent = tracing.parse_traceparent(traceparent)
+        if parent and enqueued_at:
+            tracing.record_span(
+                'celery.queue', parent[0], parent[1], int(float(enqueued_at) * 1e9), time.time_ns(),
+                kind='consumer', job_id=etl_job.id
+            )
+        
+        with claims.running_lease(etl_job.id), \
+                tracing.span('celery.split_etl_file', trace_id=etl_job.trace_id or None, parent=traceparent,
+                             kind='consumer', job_id=etl_job.id, task_id=self.request.id) as split_span:
+            chunks = ETLService().split_csv_file(
+                etl_job.file_path, _chunk_dir(etl_job.id, attempt), settings.ETL_INGEST_CHUNK_SIZE
+            )
+            split_span.set_attribute('chunks', len(chunks))
+            JobProgress(etl_job.id).start(rows_total=sum(rows for _, rows in chunks))
+            
+            headers = {tracing.TRACEPARENT_HEADER: split_span.traceparent(), tracing.ENQUEUED_AT_HEADER: time.time()}
+            ingest = [
+                ingest_etl_chunk.s(etl_job.id, index, chunk_path, attempt).set(headers=headers)
+                for index, (chunk_path, _) in enumerate(chunks)
+            ]
+            merge = merge_etl_chunks.s(etl_job.id, attempt).set(headers=headers).on_error(
+                fail_etl_job.s(etl_job.id, attempt)
+            )
+            
+            # A chord needs at least one header task
+            if ingest:
+                chord(ingest)(merge)
+            else:
+                merge.apply_async(([],))
+        
+        # The chord finishes the job; queued chunks must not let its lease expire
+        claims.hold_job(etl_job.id, owner)
+        
+        logger.info(f"ETL job {etl_job_id} split into {len(chunks)} chunks")
+        return len(chunks)
+        
+    except Exception as e:
+        logger.error(f"ETL job {etl_job_id} failed: {str(e)}")
+        _mark_job_failed(etl_job_id, str(e), owner=owner)
+        _remove_chunks(etl_job_id, attempt)
+        raise
+
+
+@shared_task(bind=True, autoretry_for=(OperationalError, InterfaceError), retry_backoff=True, max_retries=3,
+             acks_late=True, reject_on_worker_lost=True)
+def ingest_etl_chunk(self, etl_job_id, index, chunk_path, attempt):
+    """
+    Load one chunk of an uploaded file into the OLTP tables.
+    
+    Orders already loaded are skipped, so a chunk that fails on a lost
+    database connection is retried on its own, and a chunk whose worker died
+    is delivered again. A chunk of an attempt that no longer owns the job
+    is not loaded.
+    
+    Returns:
+        The chunk's processing statistics, and its query profile when
+        ETL_QUERY_PROFILING_ENABLED is set
+    """
+    if not claims.owns_job(etl_job_id, _attempt_owner(attempt)):
+        logger.info(f"ETL job {etl_job_id} was claimed again, skipping chunk {index} of attempt {attempt}")
+        return {'index': index, 'stats': {}, 'profile': None}
+    
+    traceparent = _task_header(self.request, tracing.TRACEPARENT_HEADER)
+    with tracing.span('celery.ingest_etl_chunk', parent=traceparent, kind='consumer', job_id=etl_job_id,
+                      chunk=index, attempt=self.request.retries, task_id=self.request.id):
+        etl_service = ETLService(profiler=get_profiler(), progress=JobProgress(etl_job_id))
+        stats = etl_service.process_csv_file(chunk_path)
+    
+    logger.info(f"ETL job {etl_job_id} chunk {index} loaded. Stats: {stats}")
+    return {
+        'index': index,
+        'stats': stats,
+        'profile': etl_service.profiler.report() if etl_service.profiler else None,
+    }
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def merge_etl_chunks(self, chunk_results, etl_job_id, attempt):
+    """
+    Complete an ETL job from the results of its chunks and queue the
+    warehouse ETL if any rows were loaded. Does nothing but remove its
+    chunks if the attempt no longer owns the job (it was reclaimed, or this
+    merge was delivered twice).
+    """
+    # Complete the job in one conditional UPDATE, so it completes once
+    completed = ETLJob.objects.filter(id=etl_job_id, status='running', claimed_by=_attempt_owner(attempt)).update(
+        status='completed', completed_at=timezone.now()
+    )
+    if not completed:
+        logger.info(f"ETL job {etl_job_id} is no longer owned by attempt {attempt}, discarding its chunks")
+        _remove_chunks(etl_job_id, attempt)
+        return None
+    
+    etl_job = ETLJob.objects.get(id=etl_job_id)
+    traceparent = _task_header(self.request, tracing.TRACEPARENT_HEADER)
+    
+    with tracing.span('celery.merge_etl_chunks', trace_id=etl_job.trace_id or None, parent=traceparent,
+                      kind='consumer', job_id=etl_job.id, chunks=len(chunk_results)) as merge_span:
+        stats = {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0, 'skipped': 0}
+        for chunk_result in chunk_results:
+            for stat_type, count in chunk_result['stats'].items():
+                stats[stat_type] += count
         
         # Update job with results
         etl_job.records_processed = stats['processed']
@@ -28,47 +180,168 @@ def process_etl_file_async(etl_job_id):
         etl_job.records_updated = stats['updated']
         etl_job.records_skipped = stats['skipped']
         etl_job.records_errored = stats['errors']
-        etl_job.status = 'completed'
-        etl_job.completed_at = timezone.now()
-        
-        # Include warehouse ETL results if triggered
-        if result['warehouse_etl_triggered']:
-            if result['warehouse_etl_error']:
-                etl_job.notes = f"Warehouse ETL triggered but failed: {result['warehouse_etl_error']}"
-            else:
-                etl_job.notes = f"Warehouse ETL triggered and completed successfully. Job ID: {result.get('job_id')}"
-        
+        profiles = {
+            f"ingest[{chunk_result['index']}]": chunk_result['profile']['ingest']
+            for chunk_result in chunk_results if chunk_result.get('profile') and 'ingest' in chunk_result['profile']
+        }
+        if profiles:
+            etl_job.profile = profiles
         etl_job.save()
+        JobProgress(etl_job.id).finish('completed')
         
         # Mark upload as processed
-        if hasattr(etl_job, 'dataupload_set'):
-            etl_job.dataupload_set.update(processed=True)
+        etl_job.dataupload_set.update(processed=True)
+        _remove_chunks(etl_job.id, attempt)
         
-        logger.info(f"ETL job {etl_job_id} completed successfully. Stats: {stats}")
+        # Queue the warehouse ETL separately, so it does not hold up the ingest workers
+        if stats['inserted'] > 0:
+            warehouse_job = ETLJob.objects.create(
+                name="Auto Warehouse ETL",
+                trace_id=etl_job.trace_id,
+                **claims.queued_lease()
+            )
+            run_warehouse_etl_async.apply_async((warehouse_job.id,), headers={
+                tracing.TRACEPARENT_HEADER: merge_span.traceparent(),
+                tracing.ENQUEUED_AT_HEADER: time.time(),
+            })
+            logger.info(f"ETL job {etl_job_id} queued warehouse ETL job {warehouse_job.id}")
+    
+    logger.info(f"ETL job {etl_job_id} completed successfully. Stats: {stats}")
+    return stats
+
+
+@shared_task
+def fail_etl_job(request, exc, traceback, etl_job_id, attempt):
+    """
+    Error callback of the chunk workflow: mark the job failed, if the attempt
+    still owns it, and remove the attempt's chunks.
+    """
+    logger.error(f"ETL job {etl_job_id} failed: {str(exc)}")
+    _mark_job_failed(etl_job_id, str(exc), owner=_attempt_owner(attempt))
+    _remove_chunks(etl_job_id, attempt)
+
+
+@shared_task(bind=True)
+def run_warehouse_etl_async(self, etl_job_id):
+    """
+    Celery task to run the full warehouse ETL for an ETL job.
+    """
+    return _run_warehouse_etl(self, etl_job_id)
+
+
+@shared_task(bind=True, rate_limit=settings.ETL_REBUILD_RATE_LIMIT)
+def rebuild_warehouse_async(self, etl_job_id):
+    """
+    Celery task to run the warehouse ETL with a blue/green rebuild of
+    fact_orders. Rate limited by ETL_REBUILD_RATE_LIMIT.
+    """
+    return _run_warehouse_etl(self, etl_job_id, rebuild_facts=True)
+
+
+@shared_task(bind=True)
+def run_nightly_etl(self):
+    """
+    Periodic task to refresh the warehouse from the OLTP tables.
+    """
+    etl_job = ETLJob.objects.create(
+        name=f"Nightly Warehouse ETL - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        status='pending',
+        trace_id=tracing.new_trace_id()
+    )
+    return _run_warehouse_etl(self, etl_job.id)
+
+
+def _run_warehouse_etl(task, etl_job_id, rebuild_facts=False):
+    try:
+        if not claims.start_job(etl_job_id):
+            logger.info(f"Warehouse ETL job {etl_job_id} was already started, skipping duplicate task")
+            return None
+        etl_job = ETLJob.objects.get(id=etl_job_id)
+        
+        # Warehouse runs process an unknown number of rows; their ETA is based
+        # on the duration of the last completed run
+        job_progress = JobProgress(etl_job.id)
+        job_progress.start(expected_seconds=last_duration('Warehouse ETL'))
+        
+        traceparent = _task_header(task.request, tracing.TRACEPARENT_HEADER)
+        warehouse_etl = DataWarehouseETL(profiler=get_profiler(), progress=job_progress)
+        with claims.running_lease(etl_job.id), \
+                tracing.span('warehouse_etl', trace_id=etl_job.trace_id or None, parent=traceparent,
+                             kind='consumer', job_id=etl_job.id, task_id=task.request.id):
+            stats = warehouse_etl.run_full_etl(rebuild_facts=rebuild_facts)
+        
+        etl_job.records_processed = sum(table_stats['processed'] for table_stats in stats.values())
+        etl_job.records_inserted = sum(table_stats['inserted'] for table_stats in stats.values())
+        etl_job.records_updated = sum(table_stats['updated'] for table_stats in stats.values())
+        etl_job.records_errored = sum(table_stats['errors'] for table_stats in stats.values())
+        etl_job.status = 'completed'
+        etl_job.completed_at = timezone.now()
+        if warehouse_etl.profiler:
+            etl_job.profile = warehouse_etl.profiler.report()
+        etl_job.save()
+        job_progress.finish('completed')
+        
+        logger.info(f"Warehouse ETL job {etl_job_id} completed successfully")
         return stats
         
     except Exception as e:
-        logger.error(f"ETL job {etl_job_id} failed: {str(e)}")
-        try:
-            etl_job = ETLJob.objects.get(id=etl_job_id)
-            etl_job.status = 'failed'
-            etl_job.error_message = str(e)
-            etl_job.completed_at = timezone.now()
-            etl_job.save()
-        except:
-            pass
+        logger.error(f"Warehouse ETL job {etl_job_id} failed: {str(e)}")
+        _mark_job_failed(etl_job_id, str(e))
         raise
 
 
+def _mark_job_failed(etl_job_id, error_message, owner=None):
+    """Mark a job failed; with owner, only while that owner runs it."""
+    try:
+        jobs = ETLJob.objects.filter(id=etl_job_id)
+        if owner:
+            jobs = jobs.filter(status='running', claimed_by=owner)
+        if jobs.update(status='failed', error_message=error_message, completed_at=timezone.now()):
+            JobProgress(etl_job_id).finish('failed')
+    except:
+        pass
+
+
 @shared_task
 def scheduled_etl_processing():
     """
     Scheduled task to process pending ETL jobs.
     This can be used with Celery Beat for periodic processing.
+    
+    Jobs are claimed before they are queued (etl.claims), so overlapping runs
+    never queue the same job twice. Queued jobs whose lease expired without a
+    worker starting them are queued again.
     """
-    pending_jobs = ETLJob.objects.filter(status='pending')
+    job_ids = claims.claim_pending_jobs(settings.ETL_SCHEDULER_BATCH_SIZE)
     
-    for job in pending_jobs:
-        process_etl_file_async.delay(job.id)
+    for job_id in job_ids:
+        process_etl_file_async.delay(job_id)
     
-    return f"Triggered processing for {pending_jobs.count()} pending jobs"
+    return f"Triggered processing for {len(job_ids)} pending jobs"
+
+
+@shared_task
+def export_data_async(export_job_id):
+    """
+    Celery task to write a data export to ETL_EXPORT_DIR asynchronously; the
+    file is served to its requester by the export_download view.
+    """
+    try:
+        file_path = run_export_job(export_job_id)
+        logger.info(f"Export job {export_job_id} completed successfully: {file_path}")
+        return file_path
+        
+    except Exception as e:
+        logger.error(f"Export job {export_job_id} failed: {str(e)}")
+        raise
+
+
+@shared_task
+def archive_old_facts():
+    """
+    Periodic task to move fact orders older than ETL_ARCHIVE_AFTER_MONTHS
+    into the compressed archive table.
+    """
+    result = archive_facts()
+    logger.info(f"Fact archival completed: {result}")
+    return result
@@ -1,3 +1,761 @@
-from django.test import TestCase
+import gzip
+import math
+import os
+import queue
+import random
+import tempfile
+import traceback
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, OperationalError, connections
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import (
+    Customer, Restaurant, Day, DeliveryPerson, Order, WarehouseRun,
+    DimCustomer, DimRestaurant, DimDate, DimLocation, DimTimeslot, DimDeliveryPerson, FactOrders,
+    FactOrdersArchive, FactOrderSketch
+)
+from etl import claims, progress, tracing
+from etl.api import encode_cursor, keyset_condition
+from etl.executor import LocalExecutor
+from etl.exports import ORDER_EXPORT_HEADER, ExportService, apply_export_filters, current_watermark, run_export_job
+from etl.models import ETLJob, ExportJob
+from etl.pipeline import FactOrdersPipeline, _DONE
+from etl.services import ETLService
+from etl.sketches import HyperLogLog, TDigest
+from etl.tasks import _chunk_dir, fail_etl_job, merge_etl_chunks
+from etl.warehouse_etl import DataWarehouseETL
+
+
+# Run with: python manage.py test --settings=dataWarehouse.settings_test
+# (orders split over the 'default' and 'orders_shard_1' SQLite shards)
+
+CSV_HEADER = (
+    'order_id,customer_id,restaurant_name,cuisine_type,cost_of_the_order,day_of_the_week,rating,'
+    'food_preparation_time,delivery_time,cust_first_name,cust_last_name,cust_email,cust_phone,'
+    'cust_address,cust_city,cust_registration_date,rest_address,rest_city,rest_phone,rest_website,'
+    'rest_price_range,rest_rating_avg,rest_opening_hour,rest_closing_hour,rest_established_date,'
+    'is_weekend,is_holiday,del_first_name,del_last_name,del_phone,del_email,del_vehicle,del_hire_date,'
+    'del_rating,delivery_person_id,tip_amount'
+)
+
+
+def csv_row(order_id, customer_id, restaurant_name='Hangawi', cost='30.75'):
+    return (
+        f'{order_id},{customer_id},{restaurant_name},Korean,{cost},Weekend,5,25,20,Kyle,White,'
+        f'kyle{customer_id}@example.com,555-0100,7620 Morris Curve,North Amanda,2022-11-27,'
+        f'969 Adkins Neck,Port Nicole,523-433-6080,www.hangawi.com,$$,3.27,9:00,22:00,2017-06-10,'
+        f'True,False,Sandra,Simmons,555-0101,sandra@example.com,scooter,2024-02-14,4.44,13,1.94'
+    )
+
+
+SHARDED_DATABASES = {'default', 'orders_shard_1', 'olapdb'}
+
+
+class SketchTests(SimpleTestCase):
+
+    def setUp(self):
+        generator = random.Random(42)
+        # Delivery-like times: a long right tail
+        self.values = [round(generator.expovariate(1 / 25), 2) for _ in range(20000)]
+        self.sorted_values = sorted(self.values)
+
+    def rank_error(self, digest, q):
+        estimate = digest.quantile(q)
+        rank = sum(1 for value in self.sorted_values if value <= estimate) / len(self.sorted_values)
+        return abs(rank - q)
+
+    def digest_of(self, values):
+        digest = TDigest()
+        for value in values:
+            digest.add(value)
+        return digest
+
+    def test_quantiles_are_close_to_exact_percentiles(self):
+        digest = self.digest_of(self.values)
+
+        self.assertEqual(digest.count, len(self.values))
+        for q in (0.5, 0.9, 0.95, 0.99):
+            self.assertLess(self.rank_error(digest, q), 0.01, q)
+        self.assertIsNone(TDigest().quantile(0.5))
+
+    def test_merged_digests_match_one_digest_of_all_values(self):
+        merged = TDigest()
+        for part in range(4):
+            merged.merge(self.digest_of(self.values[part::4]))
+
+        self.assertEqual(merged.count, len(self.values))
+        for q in (0.5, 0.95, 0.99):
+            self.assertLess(self.rank_error(merged, q), 0.01, q)
+
+    def test_digest_round_trips_through_json(self):
+        digest = self.digest_of(self.values)
+        restored = TDigest.from_json(digest.to_json())
+
+        self.assertEqual(restored.compression, digest.compression)
+        self.assertEqual(restored.count, digest.count)
+        for q in (0.5, 0.99):
+            self.assertAlmostEqual(restored.quantile(q), digest.quantile(q), places=3)
+        self.assertIsNone(TDigest.from_json(None).quantile(0.5))
+
+    def sketch_of(self, values):
+        sketch = HyperLogLog()
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def test_cardinality_is_within_the_error_bound(self):
+        # Three standard errors of 1.04 / sqrt(4096)
+        bound = 3 * 1.04 / math.sqrt(4096)
+        for distinct in (50, 1000, 30000):
+            sketch = self.sketch_of(f'customer-{index % distinct}' for index in range(2 * distinct))
+            self.assertLess(abs(sketch.cardinality() - distinct) / distinct, bound, distinct)
+
+    def test_merged_sketches_equal_one_sketch_of_all_values(self):
+        merged = HyperLogLog()
+        for part in range(4):
+            merged.merge(self.sketch_of(range(part, 5000, 4)))
+
+        self.assertEqual(merged.registers, self.sketch_of(range(5000)).registers)
+        with self.assertRaises(ValueError):
+            merged.merge(HyperLogLog(precision=10))
+
+    def test_sparse_and_dense_sketches_round_trip_through_json(self):
+        for distinct in (10, 20000):
+            sketch = self.sketch_of(range(distinct))
+            data = sketch.to_json()
+            self.assertIn('"s"' if distinct == 10 else '"d"', data)
+            self.assertEqual(HyperLogLog.from_json(data).registers, sketch.registers)
+
+
+class OrderSketchBuildTests(TestCase):
+    databases = {'olapdb'}
+
+    def test_archived_rows_stay_in_the_rebuilt_sketch(self):
+        for customer_id in (10, 11):
+            DimCustomer.objects.using('olapdb').create(customer_id=customer_id)
+        DimRestaurant.objects.using('olapdb').create(restaurant_id=1, restaurant_name='Hangawi')
+        DimDeliveryPerson.objects.using('olapdb').create(delivery_person_id=13)
+        DimLocation.objects.using('olapdb').create(location_id=1, city='North Amanda')
+        DimTimeslot.objects.using('olapdb').create(time_slot_id=3, slot_name='Lunch')
+        DimDate.objects.using('olapdb').create(date_id=20240105, full_date=date(2024, 1, 5))
+        keys = {'restaurant_id': 1, 'delivery_person_id': 13, 'date_id': 20240105, 'location_id': 1, 'time_slot_id': 3}
+        FactOrdersArchive.objects.using('olapdb').create(order_id=1, customer_id=10, delivery_time=20, **keys)
+        FactOrders.objects.using('olapdb').create(order_id=2, customer_id=11, delivery_time=40, **keys)
+
+        etl = DataWarehouseETL()
+        etl._touched_cells = {(1, 20240105)}
+        etl.build_order_sketches()
+
+        sketch = FactOrderSketch.objects.using('olapdb').get(restaurant_id=1, date_id=20240105)
+        self.assertEqual(sketch.order_count, 2)
+        self.assertEqual(HyperLogLog.from_json(sketch.customer_hll).cardinality(), 2)
+        self.assertEqual(TDigest.from_json(sketch.delivery_time_digest).quantile(0), 20)
+
+
+class ShardedIngestTests(TestCase):
+    databases = SHARDED_DATABASES
+
+    def ingest(self, *rows):
+        return ETLService().process_csv_data('\n'.join((CSV_HEADER,) + rows))
+
+    def test_orders_are_written_to_their_customers_shard(self):
+        stats = self.ingest(csv_row(1001, 10), csv_row(1002, 11))
+
+        self.assertEqual(stats['inserted'], 2)
+        self.assertEqual(list(Order.objects.using('default').values_list('order_id', flat=True)), [1001])
+        self.assertEqual(list(Order.objects.using('orders_shard_1').values_list('order_id', flat=True)), [1002])
+
+    def test_reference_rows_are_copied_to_every_shard_with_the_same_key(self):
+        self.ingest(csv_row(1001, 10), csv_row(1002, 11))
+
+        for model in (Restaurant, Day, DeliveryPerson):
+            self.assertEqual(
+                list(model.objects.using('default').values_list('pk', flat=True)),
+                list(model.objects.using('orders_shard_1').values_list('pk', flat=True)),
+            )
+
+    def test_order_id_held_by_another_shard_is_skipped(self):
+        self.ingest(csv_row(1001, 10))
+        stats = self.ingest(csv_row(1001, 11))
+
+        self.assertEqual(stats['skipped'], 1)
+        self.assertFalse(Order.objects.using('orders_shard_1').filter(order_id=1001).exists())
+        self.assertEqual(Order.objects.using('default').get(order_id=1001).customer_id, 10)
+
+    def test_order_id_repeated_within_a_load_stays_on_one_shard(self):
+        stats = self.ingest(csv_row(1001, 10), csv_row(1001, 11))
+
+        self.assertEqual(stats['skipped'], 1)
+        self.assertFalse(Order.objects.using('orders_shard_1').filter(order_id=1001).exists())
+
+    def test_order_ids_are_looked_up_once_per_batch_on_other_shards(self):
+        with CaptureQueriesContext(connections['orders_shard_1']) as queries:
+            self.ingest(*(csv_row(1001 + index, 10) for index in range(5)))
+
+        order_queries = [query['sql'] for query in queries if '"orders"' in query['sql']]
+        self.assertEqual(len(order_queries), 1)
+
+
+class IngestRetryTests(TestCase):
+    databases = SHARDED_DATABASES
+
+    def test_row_losing_a_natural_key_race_is_retried(self):
+        service = ETLService()
+        with mock.patch.object(service, '_process_row', side_effect=[IntegrityError('duplicate'), None]) as patched:
+            service.process_csv_data('\n'.join((CSV_HEADER, csv_row(1001, 10))))
+
+        self.assertEqual(patched.call_count, 2)
+        self.assertEqual(service.stats['inserted'], 1)
+        self.assertEqual(service.stats['errors'], 0)
+
+    def test_connection_errors_fail_the_chunk(self):
+        service = ETLService()
+        with mock.patch.object(service, '_process_row', side_effect=OperationalError('gone away')):
+            with self.assertRaises(OperationalError):
+                service.process_csv_data('\n'.join((CSV_HEADER, csv_row(1001, 10))))
+
+
+class ShardedFactLoadTests(TestCase):
+    databases = SHARDED_DATABASES
+
+    def setUp(self):
+        # The same order_id on both shards, as loaded before the ingest rejected it
+        for alias in ('default', 'orders_shard_1'):
+            Restaurant.objects.using(alias).create(restaurant_id=1, restaurant_name='Hangawi', cuisine_type='Korean')
+            Day.objects.using(alias).create(day_id=1, day_name='Weekend')
+            DeliveryPerson.objects.using(alias).create(delivery_person_id=13, vehicle_type='scooter')
+        for alias, customer_id, cost in (('default', 10, '10.00'), ('orders_shard_1', 11, '20.00')):
+            customer = Customer.objects.using(alias).create(
+                customer_id=customer_id, city='North Amanda', registration_date=date(2022, 11, 27)
+            )
+            Order.objects.using(alias).create(
+                order_id=1001, customer=customer, restaurant_id=1, day_id=1, delivery_person_id=13,
+                cost_of_the_order=cost, food_preparation_time=25, delivery_time=20,
+            )
+
+        etl = DataWarehouseETL()
+        for customer_id in (10, 11):
+            DimCustomer.objects.using('olapdb').create(customer_id=customer_id)
+        DimRestaurant.objects.using('olapdb').create(restaurant_id=1, restaurant_name='Hangawi')
+        DimDeliveryPerson.objects.using('olapdb').create(delivery_person_id=13)
+        DimLocation.objects.using('olapdb').create(location_id=1, city='North Amanda')
+        DimTimeslot.objects.using('olapdb').create(time_slot_id=3, slot_name='Lunch')
+        for order in Order.objects.using('default').select_related('customer'):
+            order_date = etl._generate_order_date(order)
+            DimDate.objects.using('olapdb').create(date_id=int(order_date.strftime('%Y%m%d')), full_date=order_date)
+
+    def test_order_date_and_time_are_stable_across_runs(self):
+        etl = DataWarehouseETL()
+        order = Order.objects.using('default').select_related('customer').get()
+
+        self.assertEqual(etl._generate_order_date(order), DataWarehouseETL()._generate_order_date(order))
+        self.assertEqual(etl._generate_order_time(order), DataWarehouseETL()._generate_order_time(order))
+
+    def test_order_id_on_several_shards_is_loaded_from_the_first(self):
+        etl = DataWarehouseETL()
+        etl.etl_version = 1
+
+        self.assertEqual(etl._shadowed_order_ids('default'), set())
+        self.assertEqual(etl._shadowed_order_ids('orders_shard_1'), {1001})
+
+        # Shards in either order give the same fact
+        for alias in reversed(etl.shard_aliases):
+            etl._extract_fact_orders_from(alias, set())
+        fact = FactOrders.objects.using('olapdb').get(order_id=1001)
+        self.assertEqual(fact.customer_id, 10)
+        self.assertEqual(str(fact.order_cost), '10.00')
+
+    def test_pipeline_loads_an_order_id_once(self):
+        etl = DataWarehouseETL()
+        etl.etl_version = 1
+        pipeline = FactOrdersPipeline(etl)
+        extracted, transformed = queue.Queue(), queue.Queue()
+        for alias in reversed(etl.shard_aliases):
+            extracted.put(list(Order.objects.using(alias).select_related(
+                'customer', 'restaurant', 'day', 'delivery_person'
+            )))
+            extracted.put(_DONE)
+
+        pipeline._transform(extracted, transformed, len(etl.shard_aliases), set())
+        pipeline._load(transformed)
+
+        fact = FactOrders.objects.using('olapdb').get(order_id=1001)
+        self.assertEqual(fact.customer_id, 10)
+        self.assertEqual(etl.stats['fact_orders']['inserted'], 1)
+        self.assertEqual(etl.stats['fact_orders']['updated'], 0)
+
+
+class WatermarkTests(TestCase):
+    databases = {'olapdb'}
+
+    def test_watermark_falls_back_to_fact_versions_without_runs(self):
+        self.assertEqual(current_watermark(), 0)
+
+    def test_every_run_allocates_its_own_version(self):
+        etl = DataWarehouseETL()
+
+        self.assertEqual(etl._next_etl_version(), 1)
+        self.assertEqual(etl._next_etl_version(), 2)
+
+    def test_watermark_stops_below_the_oldest_open_run(self):
+        etl_a, etl_b = DataWarehouseETL(), DataWarehouseETL()
+        etl_a.etl_version = etl_a._next_etl_version()
+        etl_b.etl_version = etl_b._next_etl_version()
+
+        self.assertEqual(current_watermark(), etl_a.etl_version - 1)
+
+        # A younger run committing first does not expose its version
+        etl_b._finish_etl_version('committed')
+        self.assertEqual(current_watermark(), etl_a.etl_version - 1)
+
+        etl_a._finish_etl_version('failed')
+        self.assertEqual(current_watermark(), etl_b.etl_version)
+
+    def test_stale_open_run_no_longer_holds_the_watermark(self):
+        etl = DataWarehouseETL()
+        etl.etl_version = etl._next_etl_version()
+        newer = DataWarehouseETL()
+        newer.etl_version = newer._next_etl_version()
+        newer._finish_etl_version('committed')
+        WarehouseRun.objects.using('olapdb').filter(version=etl.etl_version).update(
+            started_at=timezone.now() - timedelta(days=1)
+        )
+
+        with self.settings(ETL_RUN_TIMEOUT_SECONDS=3600):
+            self.assertEqual(current_watermark(), newer.etl_version)
+
+    def test_delta_is_bounded_by_since_and_until_version(self):
+        queryset = FactOrders.objects.using('olapdb').all()
+
+        delta = apply_export_filters(queryset, {'since': '3', 'until_version': 5})
+
+        self.assertIn('"etl_version" > 3', str(delta.query))
+        self.assertIn('"etl_version" <= 5', str(delta.query))
+
+
+class JobClaimTests(TestCase):
+    databases = {'olapdb'}
+
+    def create_job(self, **fields):
+        fields.setdefault('name', 'orders.csv')
+        fields.setdefault('file_path', '/tmp/orders.csv')
+        return ETLJob.objects.create(**fields)
+
+    def test_dispatchers_claim_a_pending_job_once(self):
+        job = self.create_job()
+
+        self.assertEqual(claims.claim_pending_jobs(10, owner='dispatcher-1'), [job.id])
+        self.assertEqual(claims.claim_pending_jobs(10, owner='dispatcher-2'), [])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.claimed_by, 'dispatcher-1')
+        self.assertGreater(job.lease_expires_at, timezone.now())
+
+    def test_jobs_without_a_file_are_not_claimed(self):
+        self.create_job(file_path='')
+
+        self.assertEqual(claims.claim_pending_jobs(10), [])
+
+    def test_expired_queued_lease_is_claimed_again(self):
+        job = self.create_job(status='queued', lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(claims.claim_pending_jobs(10, owner='dispatcher-2'), [job.id])
+
+    def test_duplicate_task_starts_a_job_once(self):
+        job = self.create_job()
+        claims.claim_pending_jobs(10)
+
+        self.assertTrue(claims.start_job(job.id, owner='worker-1'))
+        self.assertFalse(claims.start_job(job.id, owner='worker-2'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.claimed_by, 'worker-1')
+
+    def test_running_job_holds_a_lease(self):
+        job = self.create_job()
+        claims.start_job(job.id)
+
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=60))
+        self.assertEqual(claims.claim_pending_jobs(10), [])
+
+    def test_heartbeat_renews_the_running_lease(self):
+        job = self.create_job(status='running', lease_expires_at=timezone.now() + timedelta(seconds=1))
+
+        with override_settings(ETL_JOB_HEARTBEAT_SECONDS=0.01):
+            with claims.running_lease(job.id):
+                pass
+
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=60))
+
+    def test_running_job_with_expired_lease_is_claimed_again(self):
+        job = self.create_job(status='running', lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(claims.claim_pending_jobs(10, owner='dispatcher-2'), [job.id])
+        self.assertTrue(claims.start_job(job.id, owner='worker-2'))
+
+    def test_running_job_without_a_file_fails_when_its_lease_expires(self):
+        job = self.create_job(file_path='', status='running', lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(claims.claim_pending_jobs(10), [])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNotNone(job.completed_at)
+
+
+class ChunkChordTests(TestCase):
+    databases = {'olapdb'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = self.settings(ETL_INGEST_CHUNK_DIR=directory.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.job = ETLJob.objects.create(name='orders.csv', file_path='/tmp/orders.csv')
+        claims.start_job(self.job.id, owner='celery:attempt-1')
+        for attempt in ('attempt-1', 'attempt-2'):
+            os.makedirs(_chunk_dir(self.job.id, attempt))
+
+    def chunk_results(self, inserted=1):
+        return [{'index': 0, 'stats': {'processed': 1, 'inserted': inserted}, 'profile': None}]
+
+    def test_held_job_is_not_reclaimed(self):
+        self.assertTrue(claims.hold_job(self.job.id, 'celery:attempt-1'))
+
+        self.assertEqual(claims.claim_pending_jobs(10), [])
+
+    def test_merge_completes_the_job_once(self):
+        with mock.patch('etl.tasks.run_warehouse_etl_async.apply_async') as queue_warehouse_etl:
+            self.assertEqual(merge_etl_chunks(self.chunk_results(), self.job.id, 'attempt-1')['inserted'], 1)
+            self.assertIsNone(merge_etl_chunks(self.chunk_results(), self.job.id, 'attempt-1'))
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'completed')
+        self.assertEqual(queue_warehouse_etl.call_count, 1)
+
+    def test_chord_of_a_reclaimed_attempt_leaves_the_job_alone(self):
+        ETLJob.objects.filter(id=self.job.id).update(claimed_by='celery:attempt-2')
+
+        with mock.patch('etl.tasks.run_warehouse_etl_async.apply_async') as queue_warehouse_etl:
+            self.assertIsNone(merge_etl_chunks(self.chunk_results(), self.job.id, 'attempt-1'))
+        fail_etl_job(None, RuntimeError('chunk failed'), None, self.job.id, 'attempt-1')
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'running')
+        queue_warehouse_etl.assert_not_called()
+        self.assertFalse(os.path.exists(_chunk_dir(self.job.id, 'attempt-1')))
+        self.assertTrue(os.path.exists(_chunk_dir(self.job.id, 'attempt-2')))
+
+    def test_failure_callback_does_not_fail_a_completed_job(self):
+        merge_etl_chunks(self.chunk_results(inserted=0), self.job.id, 'attempt-1')
+        fail_etl_job(None, RuntimeError('chunk failed'), None, self.job.id, 'attempt-1')
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'completed')
+
+
+class LocalExecutorTests(TransactionTestCase):
+    databases = {'default', 'olapdb'}
+
+    def test_pending_jobs_are_drained_in_a_loop(self):
+        jobs = [ETLJob.objects.create(name=f'orders_{index}.csv', file_path=f'/tmp/orders_{index}.csv')
+                for index in range(5)]
+        ran, depths = [], []
+
+        def process(job_id):
+            claims.start_job(job_id)
+            ETLJob.objects.filter(id=job_id).update(status='completed')
+            ran.append(job_id)
+            depths.append(len(traceback.extract_stack()))
+
+        executor = LocalExecutor(workers=1, backlog=1)
+        with mock.patch('etl.signals.process_etl_file_sync', side_effect=process):
+            self.assertTrue(executor.submit(jobs[0].id))
+            executor._pool.shutdown(wait=True)
+
+        self.assertEqual(ran, [job.id for job in jobs])
+        # Each job runs at the same stack depth instead of nesting the next one
+        self.assertEqual(len(set(depths)), 1)
+        self.assertEqual(executor._in_flight, 0)
+        self.assertFalse(ETLJob.objects.exclude(status='completed').exists())
+
+
+class WarehouseAPITests(TestCase):
+    databases = {'default', 'olapdb'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst', password='secret')
+        for customer_id in (10, 11):
+            DimCustomer.objects.using('olapdb').create(customer_id=customer_id)
+        for restaurant_id in (1, 2):
+            DimRestaurant.objects.using('olapdb').create(restaurant_id=restaurant_id, restaurant_name=f'R{restaurant_id}')
+        DimDeliveryPerson.objects.using('olapdb').create(delivery_person_id=13)
+        DimLocation.objects.using('olapdb').create(location_id=1, city='North Amanda')
+        DimTimeslot.objects.using('olapdb').create(time_slot_id=3, slot_name='Lunch')
+        date_ids = (20240103, 20240101, 20240102)
+        for date_id in date_ids:
+            DimDate.objects.using('olapdb').create(date_id=date_id, full_date=date(2024, 1, date_id % 100))
+        # Order ids and dates interleave, so date order differs from id order
+        for order_id in range(1, 18):
+            FactOrders.objects.using('olapdb').create(
+                order_id=order_id, customer_id=10 + order_id % 2, restaurant_id=1 + order_id % 2,
+                delivery_person_id=13, date_id=date_ids[order_id % 3], location_id=1, time_slot_id=3,
+                rating=order_id % 5,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get('/etl/api/fact-orders/', params)
+
+    def walk(self, **params):
+        rows, cursor = [], None
+        while True:
+            page = self.get(**params, **({'cursor': cursor} if cursor else {})).json()
+            rows.extend(page['results'])
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                self.assertIsNone(cursor)
+                return rows
+
+    def test_pages_of_a_multi_column_ordering_cover_every_row_once(self):
+        for order, reverse in (('date', False), ('-date', True)):
+            rows = self.walk(order=order, limit=4)
+            keys = [(row['date_id'], row['order_id']) for row in rows]
+            expected = sorted(FactOrders.objects.using('olapdb').values_list('date_id', 'order_id'), reverse=reverse)
+            self.assertEqual(keys, expected, order)
+
+    def test_filters_apply_across_pages(self):
+        rows = self.walk(order='date', limit=2, restaurant=2, date_from=20240102)
+
+        self.assertEqual(
+            [row['order_id'] for row in rows],
+            list(FactOrders.objects.using('olapdb').filter(restaurant_id=2, date_id__gte=20240102)
+                 .order_by('date_id', 'order_id').values_list('order_id', flat=True))
+        )
+        self.assertEqual(self.get(customer='abc').status_code, 400)
+
+    def test_selected_fields_keep_the_ordering_columns(self):
+        page = self.get(order='date', fields='rating', limit=1).json()
+
+        self.assertEqual(set(page['results'][0]), {'rating', 'date_id', 'order_id'})
+        self.assertEqual(self.get(fields='rating,password').status_code, 400)
+
+    def test_invalid_or_tampered_cursor_is_rejected(self):
+        for cursor in ('not a cursor', encode_cursor([20240101]), encode_cursor(['20240101', 1]),
+                       encode_cursor({'date_id': 20240101})):
+            response = self.get(order='date', cursor=cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json()['error'], 'Invalid cursor')
+
+    def test_keyset_condition_bounds_the_leading_column(self):
+        condition = keyset_condition(('date_id', 'order_id'), [20240102, 7])
+
+        self.assertEqual(
+            list(FactOrders.objects.using('olapdb').filter(condition).order_by('date_id', 'order_id')
+                 .values_list('date_id', 'order_id')),
+            sorted(key for key in FactOrders.objects.using('olapdb').values_list('date_id', 'order_id')
+                   if key > (20240102, 7))
+        )
+        self.assertIn(('date_id__gte', 20240102), condition.children)
+
+
+class ExportTests(TransactionTestCase):
+    databases = {'default', 'olapdb'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.export_dir = directory.name
+        settings_override = self.settings(ETL_EXPORT_DIR=self.export_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        DimCustomer.objects.using('olapdb').create(customer_id=10, customer_name='Kyle White')
+        DimRestaurant.objects.using('olapdb').create(restaurant_id=1, restaurant_name='Hangawi', cuisine_type='Korean')
+        DimDeliveryPerson.objects.using('olapdb').create(delivery_person_id=13)
+        DimLocation.objects.using('olapdb').create(location_id=1, city='North Amanda')
+        DimTimeslot.objects.using('olapdb').create(time_slot_id=3, slot_name='Lunch')
+        DimDate.objects.using('olapdb').create(date_id=20240101, full_date=date(2024, 1, 1))
+        for order_id in range(1, 18):
+            FactOrders.objects.using('olapdb').create(
+                order_id=order_id, customer_id=10, restaurant_id=1, delivery_person_id=13, date_id=20240101,
+                location_id=1, time_slot_id=3, order_date=date(2024, 1, 1), order_cost='12.50', rating=4,
+            )
+
+    def create_export(self, file_format='csv', requested_by='analyst'):
+        return ExportJob.objects.create(export_type='orders', file_format=file_format, requested_by=requested_by)
+
+    def test_order_chunks_cover_the_id_range_once(self):
+        chunks = ExportService(chunk_size=5)._plan_order_chunks({})
+
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0][1][0], 1)
+        self.assertGreater(chunks[-1][1][1], 17)
+        for (_, (_, end)), (archived, (start, _)) in zip(chunks, chunks[1:]):
+            self.assertEqual(start, end)
+            self.assertFalse(archived)
+
+    def test_csv_parts_combine_into_one_gzip_file(self):
+        export_job = self.create_export()
+        file_path = ExportService(chunk_size=5).run(export_job)
+
+        with gzip.open(file_path, 'rt', encoding='utf-8') as export_file:
+            lines = export_file.read().splitlines()
+        self.assertEqual(lines[0].split(','), ORDER_EXPORT_HEADER)
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], list(range(1, 18)))
+        self.assertEqual(os.listdir(self.export_dir), [os.path.basename(file_path)])
+
+        export_job.refresh_from_db()
+        self.assertEqual((export_job.total_chunks, export_job.chunks_completed), (4, 4))
+        self.assertEqual(export_job.records_exported, 17)
+
+    def test_parquet_parts_combine_into_one_file(self):
+        import pyarrow.parquet as pq
+
+        file_path = ExportService(chunk_size=5).run(self.create_export(file_format='parquet'))
+
+        table = pq.read_table(file_path)
+        self.assertEqual(table.column_names, ORDER_EXPORT_HEADER)
+        self.assertEqual(sorted(table.column('Order ID').to_pylist()), list(range(1, 18)))
+
+    def test_download_is_served_to_its_requester_and_staff_only(self):
+        export_job = self.create_export()
+        run_export_job(export_job.id)
+        url = f'/etl/export/{export_job.id}/download/'
+
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('analyst'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode().count('\n'), 18)
+
+        self.client.force_login(User.objects.create_user('someone-else'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(User.objects.create_user('admin-user', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_unfinished_export_cannot_be_downloaded(self):
+        export_job = self.create_export()
+        self.client.force_login(User.objects.create_user('analyst'))
+
+        self.assertEqual(self.client.get(f'/etl/export/{export_job.id}/download/').status_code, 404)
+
+
+class MetricsEndpointTests(TestCase):
+    databases = {'default', 'olapdb'}
+
+    @override_settings(DEBUG=False, ETL_METRICS_TOKEN=None)
+    def test_refused_without_a_token_when_debug_is_off(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(DEBUG=True, ETL_METRICS_TOKEN=None)
+    def test_open_without_a_token_in_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(DEBUG=False, ETL_METRICS_TOKEN='s3cret')
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+
+class TraceFileRotationTests(TestCase):
+    databases = set()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'traces.jsonl')
+
+    def test_trace_file_is_rotated_and_read_back_across_files(self):
+        with self.settings(ETL_TRACING_ENABLED=True, ETL_TRACE_FILE=self.path,
+                           ETL_TRACE_FILE_MAX_BYTES=2000, ETL_TRACE_FILE_BACKUPS=2):
+            started = timezone.now()
+            with tracing.span('upload') as root:
+                for index in range(20):
+                    with tracing.span('stage', index=index):
+                        pass
+
+            self.assertTrue(os.path.exists(f'{self.path}.1'))
+            self.assertFalse(os.path.exists(f'{self.path}.3'))
+            spans = tracing.read_trace(root.trace_id, not_before=started - timedelta(seconds=1))
+
+        # Spans beyond the kept backups are dropped, the rest are found in every file
+        self.assertTrue(0 < len(spans) < 21)
+        self.assertEqual(spans[0]['name'], 'upload')
+        self.assertEqual(len({span['span_id'] for span in spans}), len(spans))
+
+    def test_backups_written_before_the_trace_are_skipped(self):
+        with self.settings(ETL_TRACING_ENABLED=True, ETL_TRACE_FILE=self.path, ETL_TRACE_FILE_BACKUPS=2):
+            with tracing.span('old') as old:
+                pass
+            os.replace(self.path, f'{self.path}.1')
+            os.utime(f'{self.path}.1', (0, 0))
+
+            self.assertEqual(tracing.read_trace(old.trace_id, not_before=timezone.now()), [])
+            self.assertEqual(len(tracing.read_trace(old.trace_id)), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   ETL_PROGRESS_POLL_INTERVAL=0.01, ETL_PROGRESS_STREAM_SECONDS=5)
+class JobEventStreamTests(TransactionTestCase):
+    databases = {'default', 'olapdb'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', password='secret')
+        self.running = ETLJob.objects.create(name='running.csv', status='running')
+        self.finished = ETLJob.objects.create(name='finished.csv', status='completed')
+
+    def events(self, body):
+        return [block.split('\n')[0] for block in body.split('\n\n') if block.startswith('event:')]
+
+    async def test_one_stream_follows_every_job_until_it_finishes(self):
+        job_progress = progress.JobProgress(self.running.id)
+        await sync_to_async(job_progress.start)(rows_total=10)
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(f'/etl/jobs/events/?ids={self.running.id},{self.finished.id}')
+        chunks = aiter(response.streaming_content)
+        body = ''
+        while 'event: progress' not in body:
+            body += (await anext(chunks)).decode()
+
+        await ETLJob.objects.filter(id=self.running.id).aupdate(status='completed')
+        await sync_to_async(job_progress.finish)('completed')
+        async for chunk in chunks:
+            body += chunk.decode()
+
+        self.assertEqual(self.events(body), ['event: done', 'event: progress', 'event: done', 'event: end'])
+        self.assertIn(f'"id": {self.finished.id}', body.split('event: progress')[0])
+
+    def test_wsgi_sends_the_current_state_once(self):
+        progress.JobProgress(self.running.id).start(rows_total=10)
+        self.client.force_login(self.user)
+
+        response = self.client.get(f'/etl/jobs/events/?ids={self.running.id},{self.finished.id}')
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(self.events(response.content.decode()), ['event: done', 'event: progress'])
+
+    def test_invalid_ids_are_rejected(self):
+        self.client.force_login(self.user)
+
+        self.assertEqual(self.client.get('/etl/jobs/events/?ids=1,x').status_code, 400)
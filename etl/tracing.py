@@ -0,0 +1,335 @@
+"""
+Lightweight tracing of uploads through the ETL.
+
+A trace follows one upload from the upload request through the post_save
+signal, the Celery queue and task, the CSV ingest and the warehouse ETL
+stages. The trace id is stored on the DataUpload and its ETLJob, and the
+parent span travels to the Celery task in a W3C 'traceparent' message header.
+
+    with tracing.span('ingest', rows=90) as span:
+        ...
+
+Spans nest through a context variable. Work handed to other threads must be
+wrapped with tracing.bind(fn) to stay inside the caller's span.
+
+Finished spans are appended to ETL_TRACE_FILE as JSON lines, one OTLP
+ExportTraceServiceRequest per line (the format of the OpenTelemetry
+Collector's file exporter and otlpjsonfile receiver). Past
+ETL_TRACE_FILE_MAX_BYTES the file is rotated to ETL_TRACE_FILE.1 and so on,
+keeping ETL_TRACE_FILE_BACKUPS old files. read_trace() loads the spans of one
+trace back for the dashboard's waterfall, skipping rotated files last written
+before the trace started.
+"""
+
+import contextvars
+import fcntl
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+TRACEPARENT_HEADER = 'traceparent'
+
+# Unix time at which a task was queued, sent next to the traceparent
+ENQUEUED_AT_HEADER = 'trace_enqueued_at'
+
+# OTLP span kinds
+SPAN_KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+
+_current_span = contextvars.ContextVar('etl_trace_span', default=None)
+_write_lock = threading.Lock()
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 kind: str = 'internal', attributes: Optional[Dict[str, Any]] = None,
+                 start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        """W3C trace context header naming this span as the parent."""
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': SPAN_KINDS.get(self.kind, 1),
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def _attribute_value(typed: Dict[str, Any]) -> Any:
+    if 'intValue' in typed:
+        return int(typed['intValue'])
+    return next(iter(typed.values()), None)
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Split a traceparent header.
+
+    Returns:
+        (trace_id, parent span id), or None for a missing or malformed header
+    """
+    parts = (value or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def tracing_enabled() -> bool:
+    return getattr(settings, 'ETL_TRACING_ENABLED', True)
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, parent: Union[Span, str, None] = None,
+         kind: str = 'internal', **attributes):
+    """
+    Time the enclosed block as a span.
+
+    Args:
+        name: Operation name
+        trace_id: Trace to start the span in when there is no parent
+        parent: Parent span or traceparent header (defaults to the current span)
+        kind: 'internal', 'server', 'client', 'producer' or 'consumer'
+        attributes: Span attributes
+    """
+    if isinstance(parent, str):
+        parent = parse_traceparent(parent)
+    elif isinstance(parent, Span):
+        parent = (parent.trace_id, parent.span_id)
+    elif parent is None and current_span() is not None:
+        parent = (current_span().trace_id, current_span().span_id)
+
+    if parent:
+        trace_id, parent_id = parent
+    else:
+        trace_id, parent_id = trace_id or new_trace_id(), None
+
+    current = Span(name, trace_id, parent_id, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        export(current)
+
+
+def record_span(name: str, trace_id: str, parent_id: Optional[str], start_ns: int, end_ns: int,
+                kind: str = 'internal', **attributes) -> Span:
+    """Export a span measured elsewhere, e.g. the time a task spent queued."""
+    recorded = Span(name, trace_id, parent_id, kind, attributes, start_ns=start_ns)
+    recorded.end_ns = end_ns
+    export(recorded)
+    return recorded
+
+
+def bind(fn: Callable) -> Callable:
+    """Wrap fn to run inside the caller's current span in whichever thread calls it."""
+    parent = current_span()
+    if parent is None:
+        return fn
+
+    def run_in_span(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+
+    return run_in_span
+
+
+def _trace_file() -> str:
+    return str(getattr(settings, 'ETL_TRACE_FILE', os.path.join(settings.BASE_DIR, 'traces.jsonl')))
+
+
+def export(finished: Span) -> None:
+    """Append a finished span to ETL_TRACE_FILE."""
+    if not tracing_enabled():
+        return
+    request = {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                _otlp_attribute('service.name', 'dataWarehouse'),
+                _otlp_attribute('host.name', socket.gethostname()),
+                _otlp_attribute('process.pid', os.getpid()),
+            ]},
+            'scopeSpans': [{'scope': {'name': 'etl.tracing'}, 'spans': [finished.to_otlp()]}],
+        }]
+    }
+    line = json.dumps(request, separators=(',', ':')) + '\n'
+    path = _trace_file()
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # One small O_APPEND write per span keeps lines from several processes intact
+        with _write_lock, open(path, 'a', encoding='utf-8') as file:
+            file.write(line)
+            size = file.tell()
+        if size >= getattr(settings, 'ETL_TRACE_FILE_MAX_BYTES', 50 * 1024 * 1024):
+            _rotate(path)
+    except OSError as e:
+        logger.warning(f"Could not export trace span {finished.name}: {str(e)}")
+
+
+def _rotate(path: str) -> None:
+    """
+    Move the trace file to path.1 (path.1 to path.2 and so on), dropping the
+    oldest past ETL_TRACE_FILE_BACKUPS. An exclusive lock makes one process
+    rotate; the others find the file already small again.
+    """
+    backups = getattr(settings, 'ETL_TRACE_FILE_BACKUPS', 5)
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path) or os.path.getsize(path) < getattr(
+                settings, 'ETL_TRACE_FILE_MAX_BYTES', 50 * 1024 * 1024
+            ):
+                return
+            for index in range(backups - 1, 0, -1):
+                if os.path.exists(f'{path}.{index}'):
+                    os.replace(f'{path}.{index}', f'{path}.{index + 1}')
+            if backups:
+                os.replace(path, f'{path}.1')
+            else:
+                os.remove(path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _trace_files(not_before: Optional[datetime] = None) -> List[str]:
+    """
+    The trace file and its rotated backups, newest first. Backups last
+    written before not_before cannot hold spans that ended after it.
+    """
+    path = _trace_file()
+    paths = [path] + [f'{path}.{index}' for index in range(1, getattr(settings, 'ETL_TRACE_FILE_BACKUPS', 5) + 1)]
+    files = []
+    for candidate in paths:
+        try:
+            modified = os.path.getmtime(candidate)
+        except OSError:
+            continue
+        if candidate != path and not_before is not None and modified < not_before.timestamp():
+            # Older backups were rotated out even earlier
+            break
+        files.append(candidate)
+    return files
+
+
+def read_trace(trace_id: str, not_before: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Spans of one trace from ETL_TRACE_FILE and its rotated backups, in start order.
+
+    Args:
+        trace_id: Trace to load
+        not_before: When the trace started (e.g. the job's created_at); rotated
+            files last written before it are not read
+
+    Returns:
+        Dicts with span_id, parent_id, name, kind, start_ns, end_ns,
+        duration_ms, status and attributes
+    """
+    spans = []
+    if not trace_id:
+        return spans
+
+    kinds = {code: kind for kind, code in SPAN_KINDS.items()}
+    for path in _trace_files(not_before):
+        _read_spans(path, trace_id, kinds, spans)
+    spans.sort(key=lambda item: item['start_ns'])
+    return spans
+
+
+def _read_spans(path: str, trace_id: str, kinds: Dict[int, str], spans: List[Dict[str, Any]]) -> None:
+    """Append the spans of trace_id found in one trace file to spans."""
+    try:
+        file = open(path, encoding='utf-8')
+    except OSError:
+        # Rotated away since it was listed
+        return
+    with file:
+        for line in file:
+            if trace_id not in line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                continue
+            for resource_spans in request.get('resourceSpans', []):
+                for scope_spans in resource_spans.get('scopeSpans', []):
+                    for otlp_span in scope_spans.get('spans', []):
+                        if otlp_span.get('traceId') != trace_id:
+                            continue
+                        start_ns = int(otlp_span['startTimeUnixNano'])
+                        end_ns = int(otlp_span['endTimeUnixNano'])
+                        spans.append({
+                            'span_id': otlp_span['spanId'],
+                            'parent_id': otlp_span.get('parentSpanId'),
+                            'name': otlp_span['name'],
+                            'kind': kinds.get(otlp_span.get('kind'), 'internal'),
+                            'start_ns': start_ns,
+                            'end_ns': end_ns,
+                            'duration_ms': round((end_ns - start_ns) / 1e6, 3),
+                            'status': otlp_span.get('status', {}),
+                            'attributes': {
+                                attribute['key']: _attribute_value(attribute['value'])
+                                for attribute in otlp_span.get('attributes', [])
+                            },
+                        })
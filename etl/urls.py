@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api
 
 app_name = 'etl'
 
@@ -8,9 +8,17 @@ urlpatterns = [
     path('upload/', views.upload_file, name='upload_file'),
     path('process-csv/', views.process_csv_data, name='process_csv_data'),
     path('job/<int:job_id>/status/', views.job_status, name='job_status'),
+    path('jobs/events/', views.job_events, name='job_events'),
+    path('job/<int:job_id>/trace/', views.job_trace, name='job_trace'),
     path('upload/<int:upload_id>/process/', views.trigger_manual_processing, name='trigger_manual_processing'),
     path('analytics/', views.analytics_dashboard, name='analytics'),
+    path('analytics/percentiles/', views.order_percentiles, name='order_percentiles'),
     path('export/', views.export_data, name='export_data'),
+    path('export/<int:export_job_id>/status/', views.export_status, name='export_status'),
+    path('export/<int:export_job_id>/download/', views.export_download, name='export_download'),
+    path('sql/', views.sql_console, name='sql_console'),
+    path('api/', api.api_index, name='api_index'),
+    path('api/<slug:resource_name>/', api.warehouse_resource, name='warehouse_api'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
 ]
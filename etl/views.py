@@ -2,22 +2,40 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import views as auth_views
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.files.storage import default_storage
 from django.utils import timezone
-from .models import ETLJob, DataUpload
+from django.urls import reverse
+from asgiref.sync import sync_to_async
+from .models import ETLJob, DataUpload, ExportJob
 from .services import ETLService
-from .signals import process_etl_file_sync
-from django.db.models import Count, Sum, Avg
-from django.db.models.functions import TruncMonth, TruncDate
-from core.models import FactOrders, DimCustomer, DimRestaurant, DimDate
+from .signals import queue_etl_job
+from .analytics import get_dashboard_summary, get_order_sketch_summary
+from . import claims, duckdb_mirror, progress, tracing
+from .metrics import REGISTRY, observe_latency, scrape_gauges
+from .exports import (
+    EXPORT_TYPES, ORDER_EXPORT_HEADER, RESTAURANT_EXPORT_HEADER,
+    parse_export_filters, current_watermark, get_order_sources, get_orders_queryset, get_restaurant_stats,
+    order_rows, restaurant_rows
+)
+import asyncio
+import csv
+import hmac
+import itertools
 import json
 import logging
+import os
+import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+SQL_CONSOLE_MAX_ROWS = 1000
+
 
 @login_required
 def etl_dashboard(request):
@@ -47,11 +65,15 @@ def upload_file(request):
         return JsonResponse({'error': 'Only CSV files are supported'}, status=400)
     
     try:
-        # Create upload record
-        data_upload = DataUpload.objects.create(
-            file=uploaded_file,
-            original_filename=uploaded_file.name
-        )
+        # The upload's trace continues in the post_save signal and the Celery task
+        with tracing.span('upload', kind='server', filename=uploaded_file.name, size=uploaded_file.size) as upload_span:
+            data_upload = DataUpload(original_filename=uploaded_file.name, trace_id=upload_span.trace_id)
+            with tracing.span('upload.file_save'):
+                data_upload.file.save(uploaded_file.name, uploaded_file, save=False)
+            
+            # Create upload record
+            with tracing.span('upload.record'):
+                data_upload.save()
         
         return JsonResponse({
             'success': True,
@@ -76,17 +98,19 @@ def process_csv_data(request):
         if not csv_data:
             return JsonResponse({'error': 'No CSV data provided'}, status=400)
         
-        # Create ETL job
-        etl_job = ETLJob.objects.create(
-            name=f"Direct CSV Processing - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            status='running',
-            started_at=timezone.now()
-        )
-        
-        # Process data
-        etl_service = ETLService()
-        result = etl_service.process_csv_data_with_warehouse_etl(csv_data)
-        stats = result['etl_stats']
+        with tracing.span('process_csv_data', kind='server', size=len(csv_data)) as request_span:
+            # Create ETL job
+            etl_job = ETLJob.objects.create(
+                name=f"Direct CSV Processing - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                status='running',
+                started_at=timezone.now(),
+                trace_id=request_span.trace_id
+            )
+            
+            # Process data
+            etl_service = ETLService()
+            result = etl_service.process_csv_data_with_warehouse_etl(csv_data)
+            stats = result['etl_stats']
         
         # Update job with results
         etl_job.records_processed = stats['processed']
@@ -130,31 +154,156 @@ def process_csv_data(request):
         return JsonResponse({'error': f'Processing failed: {str(e)}'}, status=500)
 
 
+def _job_payload(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        'records_processed': job.records_processed,
+        'records_inserted': job.records_inserted,
+        'records_updated': job.records_updated,
+        'records_skipped': job.records_skipped,
+        'records_errored': job.records_errored,
+        'error_message': job.error_message
+    }
+
+
 @login_required
 def job_status(request, job_id):
     """Get status of an ETL job."""
     try:
         job = ETLJob.objects.get(id=job_id)
         
-        return JsonResponse({
-            'id': job.id,
-            'name': job.name,
-            'status': job.status,
-            'created_at': job.created_at.isoformat(),
-            'started_at': job.started_at.isoformat() if job.started_at else None,
-            'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-            'records_processed': job.records_processed,
-            'records_inserted': job.records_inserted,
-            'records_updated': job.records_updated,
-            'records_skipped': job.records_skipped,
-            'records_errored': job.records_errored,
-            'error_message': job.error_message
-        })
+        return JsonResponse(_job_payload(job))
         
     except ETLJob.DoesNotExist:
         return JsonResponse({'error': 'Job not found'}, status=404)
 
 
+# Jobs followed by one progress stream; the dashboard lists at most this many
+MAX_STREAMED_JOBS = 50
+
+
+@login_required
+async def job_events(request):
+    """
+    Stream the progress of several ETL jobs as Server-Sent Events, over one
+    connection per client (?ids=1,2,3).
+    
+    'progress' events carry a job's rows done, current stage and ETA published
+    by the workers (etl.progress); they are read from the cache, all jobs in
+    one round trip, not from the database. A 'done' event with a job's final
+    status is sent when it finishes, and an 'end' event once no job is left.
+    Streams also end after ETL_PROGRESS_STREAM_SECONDS, and the browser
+    reconnects.
+    
+    The view is async: under ASGI an open stream only waits on the event loop
+    and holds no thread. Under WSGI it sends the current state once and the
+    browser polls by reconnecting.
+    """
+    try:
+        job_ids = [int(job_id) for job_id in request.GET.get('ids', '').split(',') if job_id.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of job ids'}, status=400)
+    job_ids = job_ids[:MAX_STREAMED_JOBS]
+    
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_job_event_stream(job_ids, follow=True), content_type='text/event-stream')
+    else:
+        # A long stream would hold one of the WSGI server's request threads
+        events = [event async for event in _job_event_stream(job_ids, follow=False)]
+        response = HttpResponse(''.join(events), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _finished_jobs(job_ids):
+    return [job async for job in ETLJob.objects.filter(id__in=job_ids, status__in=progress.FINISHED)]
+
+
+async def _job_event_stream(job_ids, follow):
+    yield "retry: 2000\n\n"
+    pending = {job_id async for job_id in ETLJob.objects.filter(id__in=job_ids).values_list('id', flat=True)}
+    for job in await _finished_jobs(pending):
+        pending.discard(job.id)
+        yield _server_sent_event('done', _job_payload(job))
+    
+    read_progress_many = sync_to_async(progress.read_progress_many, thread_sensitive=False)
+    poll_interval = getattr(settings, 'ETL_PROGRESS_POLL_INTERVAL', 1.0)
+    deadline = time.monotonic() + getattr(settings, 'ETL_PROGRESS_STREAM_SECONDS', 60)
+    last_sent = time.monotonic()
+    last_updates = {}
+    while pending:
+        states = await read_progress_many(pending)
+        finished = []
+        for job_id, state in states.items():
+            if state['updated_at'] == last_updates.get(job_id):
+                continue
+            last_updates[job_id] = state['updated_at']
+            if state['status'] in progress.FINISHED:
+                finished.append(job_id)
+            else:
+                yield _server_sent_event('progress', state)
+                last_sent = time.monotonic()
+        if finished:
+            for job in await _finished_jobs(finished):
+                pending.discard(job.id)
+                yield _server_sent_event('done', _job_payload(job))
+                last_sent = time.monotonic()
+            for job_id in set(finished) & pending:
+                # Final status not saved yet: look again on the next poll
+                del last_updates[job_id]
+        
+        if not follow or time.monotonic() >= deadline:
+            return
+        if time.monotonic() - last_sent >= 15:
+            # Comment line, keeps proxies from closing an idle stream
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(poll_interval)
+    yield _server_sent_event('end', {})
+
+
+@login_required
+def job_trace(request, job_id):
+    """Get the trace spans of an ETL job, offset from the start of the trace, for the waterfall."""
+    try:
+        job = ETLJob.objects.get(id=job_id)
+    except ETLJob.DoesNotExist:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+
+    spans = tracing.read_trace(job.trace_id, not_before=job.created_at)
+    trace_start = spans[0]['start_ns'] if spans else 0
+    trace_end = max((span['end_ns'] for span in spans), default=0)
+    return JsonResponse({
+        'job_id': job.id,
+        'trace_id': job.trace_id,
+        'duration_ms': round((trace_end - trace_start) / 1e6, 3),
+        'spans': [
+            {
+                'span_id': span['span_id'],
+                'parent_id': span['parent_id'],
+                'name': span['name'],
+                'kind': span['kind'],
+                'offset_ms': round((span['start_ns'] - trace_start) / 1e6, 3),
+                'duration_ms': span['duration_ms'],
+                'error': span['status'].get('message'),
+                'attributes': span['attributes'],
+            }
+            for span in spans
+        ],
+    })
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 @login_required
@@ -171,19 +320,25 @@ def trigger_manual_processing(request, upload_id):
             etl_job = ETLJob.objects.create(
                 name=f"Manual Process {upload.original_filename}",
                 file_path=upload.get_file_path(),
-                status='pending'
+                trace_id=upload.trace_id or tracing.new_trace_id(),
+                **claims.queued_lease()
             )
             upload.etl_job = etl_job
             upload.save()
+        elif upload.etl_job.status in ('failed', 'pending'):
+            # Retry a failed job; processing only starts pending or queued jobs
+            ETLJob.objects.filter(id=upload.etl_job.id, status__in=['failed', 'pending']).update(
+                **claims.queued_lease()
+            )
         
-        # Trigger processing
-        process_etl_file_sync(upload.etl_job.id)
+        # Trigger processing in the background; the dashboard follows the job's progress
+        queue_etl_job(upload.etl_job)
         
         return JsonResponse({
             'success': True,
             'job_id': upload.etl_job.id,
-            'message': 'Processing triggered successfully'
-        })
+            'message': 'Processing queued'
+        }, status=202)
         
     except DataUpload.DoesNotExist:
         return JsonResponse({'error': 'Upload not found'}, status=404)
@@ -193,62 +348,21 @@ def trigger_manual_processing(request, upload_id):
 
 
 @login_required  
+@observe_latency('analytics_dashboard')
 def analytics_dashboard(request):
     """Analytics dashboard with data visualizations."""
     try:
-        # Get summary statistics
-        total_orders = FactOrders.objects.using('olapdb').count()
-        total_revenue = FactOrders.objects.using('olapdb').aggregate(
-            total=Sum('order_cost')
-        )['total'] or 0
-        avg_order_value = FactOrders.objects.using('olapdb').aggregate(
-            avg=Avg('order_cost')
-        )['avg'] or 0
-        avg_delivery_time = FactOrders.objects.using('olapdb').aggregate(
-            avg=Avg('delivery_time')
-        )['avg'] or 0
-        
-        # Orders by month
-        orders_by_month = FactOrders.objects.using('olapdb').annotate(
-            month=TruncMonth('order_date')
-        ).values('month').annotate(
-            count=Count('order_id'),
-            revenue=Sum('order_cost')
-        ).order_by('month')[:12]
-        
-        # Top restaurants by revenue
-        top_restaurants = FactOrders.objects.using('olapdb').values(
-            'restaurant__restaurant_name'
-        ).annotate(
-            revenue=Sum('order_cost'),
-            order_count=Count('order_id')
-        ).order_by('-revenue')[:10]
-        
-        # Orders by cuisine type
-        cuisine_stats = FactOrders.objects.using('olapdb').values(
-            'restaurant__cuisine_type'
-        ).annotate(
-            count=Count('order_id'),
-            revenue=Sum('order_cost')
-        ).order_by('-count')[:10]
-        
-        # Customer segments
-        customer_segments = DimCustomer.objects.using('olapdb').values(
-            'segment'
-        ).annotate(
-            count=Count('customer_id')
-        ).order_by('-count')
+        context = get_dashboard_summary()
         
-        context = {
-            'total_orders': total_orders,
-            'total_revenue': float(total_revenue),
-            'avg_order_value': float(avg_order_value),
-            'avg_delivery_time': float(avg_delivery_time),
-            'orders_by_month': list(orders_by_month),
-            'top_restaurants': list(top_restaurants),
-            'cuisine_stats': list(cuisine_stats),
-            'customer_segments': list(customer_segments),
-        }
+        # Delivery/preparation percentiles and distinct customers from the
+        # sketches of the last ETL_SKETCH_WINDOW_DAYS days
+        latency = get_order_sketch_summary()
+        context.update({
+            'latency_summary': latency['overall'],
+            'restaurant_latency': latency['restaurants'],
+            'latency_start_date': latency['start_date'],
+            'latency_end_date': latency['end_date'],
+        })
         
         return render(request, 'etl/analytics.html', context)
         
@@ -259,67 +373,62 @@ def analytics_dashboard(request):
 
 
 @login_required
-def export_data(request):
-    """Export data as CSV."""
-    from django.http import HttpResponse
-    import csv
+@observe_latency('order_percentiles')
+def order_percentiles(request):
+    """Percentiles and distinct customers for any date range, merged from sketches."""
+    try:
+        filters = parse_export_filters(request.GET)
+        start_date = datetime.strptime(filters['start_date'], '%Y-%m-%d').date() if 'start_date' in filters else None
+        end_date = datetime.strptime(filters['end_date'], '%Y-%m-%d').date() if 'end_date' in filters else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
+    try:
+        summary = get_order_sketch_summary(
+            start_date=start_date,
+            end_date=end_date,
+            restaurant_id=filters.get('restaurant')
+        )
+        return JsonResponse(summary)
+        
+    except Exception as e:
+        logger.error(f"Error merging order sketches: {str(e)}")
+        return JsonResponse({'error': f'Query failed: {str(e)}'}, status=500)
+
+
+@login_required
+@observe_latency('export_data')
+def export_data(request):
+    """Export data as CSV, or queue an asynchronous export job with async=1."""
     export_type = request.GET.get('type', 'orders')
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{export_type}_export.csv"'
+    try:
+        filters = parse_export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if 'since' in filters:
+        # Delta export: rows changed after the watermark up to the current version
+        filters['until_version'] = current_watermark()
     
-    writer = csv.writer(response)
+    if request.GET.get('async') in ('1', 'true', 'True'):
+        return _queue_export_job(request, export_type, filters)
     
     try:
-        if export_type == 'orders':
-            # Export fact orders
-            writer.writerow([
-                'Order ID', 'Customer Name', 'Restaurant Name', 'Order Date', 
-                'Order Cost', 'Rating', 'Delivery Time', 'Total Time'
-            ])
-            
-            orders = FactOrders.objects.using('olapdb').select_related(
-                'customer', 'restaurant'
-            ).all()[:1000]  # Limit to 1000 records
-            
-            for order in orders:
-                writer.writerow([
-                    order.order_id,
-                    order.customer.customer_name,
-                    order.restaurant.restaurant_name,
-                    order.order_date,
-                    order.order_cost,
-                    order.rating,
-                    order.delivery_time,
-                    order.total_time
-                ])
-                
-        elif export_type == 'restaurants':
-            # Export restaurant performance
-            writer.writerow([
-                'Restaurant Name', 'Cuisine Type', 'Total Orders', 
-                'Total Revenue', 'Average Rating'
-            ])
-            
-            restaurant_stats = FactOrders.objects.using('olapdb').values(
-                'restaurant__restaurant_name',
-                'restaurant__cuisine_type'
-            ).annotate(
-                order_count=Count('order_id'),
-                total_revenue=Sum('order_cost'),
-                avg_rating=Avg('rating')
-            )
-            
-            for stat in restaurant_stats:
-                writer.writerow([
-                    stat['restaurant__restaurant_name'],
-                    stat['restaurant__cuisine_type'],
-                    stat['order_count'],
-                    stat['total_revenue'],
-                    stat['avg_rating']
-                ])
-                
+        header, rows = _export_rows(export_type, filters)
+        
+        if 'since' in filters:
+            # Deltas are not truncated, so stream them instead of building them in memory
+            response = StreamingHttpResponse(_stream_csv(header, rows), content_type='text/csv')
+            response['X-Next-Watermark'] = str(filters['until_version'])
+        else:
+            response = HttpResponse(content_type='text/csv')
+            writer = csv.writer(response)
+            if header:
+                writer.writerow(header)
+            writer.writerows(rows)
+        
+        response['Content-Disposition'] = f'attachment; filename="{export_type}_export.csv"'
         return response
         
     except Exception as e:
@@ -328,6 +437,201 @@ def export_data(request):
         return response
 
 
+def _export_rows(export_type, filters):
+    """Header and (lazy) rows of a synchronous export, from the DuckDB mirror when it is current."""
+    if _mirror_covers(filters):
+        # Scan the DuckDB mirror instead of the warehouse
+        if export_type == 'orders':
+            limit = None if 'since' in filters else 1000
+            return ORDER_EXPORT_HEADER, duckdb_mirror.order_export_rows(filters, limit=limit)
+        if export_type == 'restaurants':
+            return RESTAURANT_EXPORT_HEADER, duckdb_mirror.restaurant_export_rows(filters)
+        return None, []
+    
+    if export_type == 'orders':
+        # Hot rows first, then archived rows when the date range reaches them
+        orders = itertools.chain.from_iterable(
+            get_orders_queryset(filters, archived=archived).order_by('order_id').iterator(chunk_size=2000)
+            for archived in get_order_sources(filters)
+        )
+        if 'since' not in filters:
+            # Deltas are complete by definition, so only full exports are truncated
+            orders = itertools.islice(orders, 1000)  # Limit to 1000 records
+        return ORDER_EXPORT_HEADER, order_rows(orders)
+    if export_type == 'restaurants':
+        # Export restaurant performance
+        return RESTAURANT_EXPORT_HEADER, restaurant_rows(get_restaurant_stats(filters))
+    return None, []
+
+
+class _EchoBuffer:
+    """File-like object whose write() returns the written line, for streaming csv.writer output."""
+    
+    def write(self, value):
+        return value
+
+
+def _stream_csv(header, rows):
+    """Yield CSV lines of an export as they are read from the database."""
+    writer = csv.writer(_EchoBuffer())
+    if header:
+        yield writer.writerow(header)
+    try:
+        for row in rows:
+            yield writer.writerow(row)
+    except Exception as e:
+        # The response has started, so the client only sees a truncated file
+        logger.error(f"Error streaming export: {str(e)}")
+        raise
+
+
+def _mirror_covers(filters):
+    """Whether the DuckDB mirror is enabled and holds every version the export needs."""
+    if not duckdb_mirror.is_enabled():
+        return False
+    try:
+        return duckdb_mirror.mirror_watermark() >= filters.get('until_version', 0)
+    except Exception as e:
+        logger.error(f"Error reading DuckDB mirror, exporting from the warehouse: {str(e)}")
+        return False
+
+
+def _queue_export_job(request, export_type, filters):
+    """Create an export job and hand it to Celery."""
+    from .tasks import export_data_async
+    
+    file_format = request.GET.get('format', 'csv')
+    if export_type not in EXPORT_TYPES:
+        return JsonResponse({'error': f'Unsupported export type: {export_type}'}, status=400)
+    if file_format not in ('csv', 'parquet'):
+        return JsonResponse({'error': f'Unsupported export format: {file_format}'}, status=400)
+    
+    export_job = ExportJob.objects.create(
+        export_type=export_type,
+        file_format=file_format,
+        filters=filters,
+        requested_by=request.user.get_username()
+    )
+    
+    try:
+        export_data_async.delay(export_job.id)
+    except Exception as e:
+        logger.error(f"Error queueing export job {export_job.id}: {str(e)}")
+        export_job.status = 'failed'
+        export_job.error_message = f'Task queue unavailable: {str(e)}'
+        export_job.completed_at = timezone.now()
+        export_job.save()
+        return JsonResponse({'error': 'Export queue is not available'}, status=503)
+    
+    return JsonResponse({
+        'success': True,
+        'export_job_id': export_job.id,
+        'status_url': reverse('etl:export_status', args=[export_job.id]),
+        'next_watermark': filters.get('until_version'),
+        'message': 'Export queued. Poll the status URL for the download link.'
+    }, status=202)
+
+
+@login_required
+@observe_latency('export_status')
+def export_status(request, export_job_id):
+    """Get status and download link of an export job."""
+    try:
+        export_job = ExportJob.objects.get(id=export_job_id)
+        if not export_job.can_access(request.user):
+            raise ExportJob.DoesNotExist
+        
+        return JsonResponse({
+            'id': export_job.id,
+            'export_type': export_job.export_type,
+            'file_format': export_job.file_format,
+            'filters': export_job.filters,
+            'status': export_job.status,
+            'created_at': export_job.created_at.isoformat(),
+            'started_at': export_job.started_at.isoformat() if export_job.started_at else None,
+            'completed_at': export_job.completed_at.isoformat() if export_job.completed_at else None,
+            'total_chunks': export_job.total_chunks,
+            'chunks_completed': export_job.chunks_completed,
+            'records_exported': export_job.records_exported,
+            'download_url': export_job.get_download_url(),
+            'next_watermark': export_job.filters.get('until_version'),
+            'error_message': export_job.error_message
+        })
+        
+    except ExportJob.DoesNotExist:
+        return JsonResponse({'error': 'Export job not found'}, status=404)
+
+
+@login_required
+def export_download(request, export_job_id):
+    """Download the file of a completed export job (its requester or staff only)."""
+    try:
+        export_job = ExportJob.objects.get(id=export_job_id)
+    except ExportJob.DoesNotExist:
+        raise Http404('Export job not found')
+    if not export_job.can_access(request.user):
+        raise Http404('Export job not found')
+    if export_job.status != 'completed' or not export_job.file_path or not os.path.exists(export_job.file_path):
+        raise Http404('Export file not available')
+    
+    response = FileResponse(
+        open(export_job.file_path, 'rb'),
+        as_attachment=True,
+        filename=f"{export_job.export_type}_{export_job.id}.{'csv.gz' if export_job.file_format == 'csv' else 'parquet'}"
+    )
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@require_http_methods(["POST"])
+@login_required
+def sql_console(request):
+    """Run a read-only SQL query against the DuckDB mirror (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=403)
+    if not duckdb_mirror.is_enabled():
+        return JsonResponse({'error': 'DuckDB mirror is not configured'}, status=503)
+    
+    try:
+        data = json.loads(request.body)
+        sql = data.get('sql', '')
+        params = data.get('params') or []
+        max_rows = max(1, min(int(data.get('max_rows', SQL_CONSOLE_MAX_ROWS)), SQL_CONSOLE_MAX_ROWS))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Expected a JSON body with a sql field'}, status=400)
+    
+    try:
+        result = duckdb_mirror.execute_read_only(sql, params=params, max_rows=max_rows)
+    except duckdb_mirror.ReadOnlyQueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error running SQL console query: {str(e)}")
+        return JsonResponse({'error': f'Query failed: {str(e)}'}, status=400)
+    
+    result['row_count'] = len(result['rows'])
+    return JsonResponse(result, json_dumps_params={'default': str})
+
+
+def metrics(request):
+    """
+    Prometheus metrics of the ETL, combined over all web and worker processes.
+    Requires 'Authorization: Bearer <ETL_METRICS_TOKEN>'. Without a token the
+    endpoint is only open when DEBUG is on.
+    """
+    token = getattr(settings, 'ETL_METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse('Metrics are disabled: set ETL_METRICS_TOKEN', status=403, content_type='text/plain')
+    elif not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    ):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    
+    return HttpResponse(
+        REGISTRY.render(scrape_gauges()), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 def login_view(request):
     """Custom login view."""
     if request.user.is_authenticated:
@@ -1,20 +1,31 @@
-from django.db import transaction, connections
+from django.conf import settings
+from django.db import IntegrityError, transaction, connections
+from django.db.models import Max
 from django.utils import timezone
 from datetime import datetime, date, time
 from decimal import Decimal
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import logging
-import threading
-import concurrent.futures
+import itertools
+import random
 import time as time_module
+from contextlib import contextmanager, nullcontext
 
 from core.models import (
     # OLTP Models
     Customer, Restaurant, Day, DeliveryPerson, Order,
     # OLAP Models 
     DimCustomer, DimRestaurant, DimDate, DimLocation, 
-    DimTimeslot, DimDeliveryPerson, FactOrders
+    DimTimeslot, DimDeliveryPerson, FactOrders, FactOrdersArchive, FactOrderSketch,
+    WarehouseRun
 )
+from core.router import read_replica_for
+from core.sharding import get_shard_aliases, reference_alias
+from etl import archival, columnar, duckdb_mirror, partitioning, rebuild
+from etl import metrics, tracing
+from etl.connection_pool import get_pool
+from etl.pipeline import FactOrdersPipeline
+from etl.sketches import TDigest, HyperLogLog
 
 logger = logging.getLogger(__name__)
 
@@ -25,75 +36,226 @@ class DataWarehouseETL:
     Thread-safe implementation for parallel dimension extraction.
     """
     
-    def __init__(self):
-        # Initialize stats dictionary
-        self.stats = {
-            'dim_customer': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0},
-            'dim_restaurant': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0},
-            'dim_date': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0},
-            'dim_location': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0},
-            'dim_timeslot': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0},
-            'dim_deliveryperson': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0},
-            'fact_orders': {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0}
-        }
+    def __init__(self, profiler=None, progress=None):
+        """
+        Args:
+            profiler: Optional etl.profiling profiler (or ProfilerGroup)
+                measuring every stage of run_full_etl
+            progress: Optional etl.progress.JobProgress the stages and
+                processed rows are reported to
+        """
+        # Per-thread stats cells, summed by the stats property, so hot loops
+        # update them without a lock
+        self._stats = metrics.ThreadLocalCounter()
+        
+        # Version stamped on every fact row inserted or updated by this run
+        self.etl_version = None
+        
+        # (restaurant_id, date_id) aggregate cells whose sketches must be rebuilt
+        self._touched_cells = set()
         
-        # Create locks for thread-safe stats updates
-        self._stats_lock = threading.Lock()
+        # Aliases the OLTP tables are extracted from: the reference tables
+        # from oltp_alias, customers and orders from every order shard.
+        # run_full_etl moves the extraction to replicas that are caught up
+        self.oltp_alias = reference_alias()
+        self.shard_aliases = get_shard_aliases()
         
+        # Per-stage throughput of the last pipelined fact load
+        self.pipeline_stats = None
+        
+        self.profiler = profiler
+        self.progress = progress
+        
+    STAGES = [
+        'dim_customer', 'dim_restaurant', 'dim_date', 'dim_location', 'dim_timeslot',
+        'dim_deliveryperson', 'fact_orders', 'fact_order_sketches'
+    ]
+    
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Processed, inserted, updated and errored rows per table."""
+        stats = {
+            stage: {'processed': 0, 'inserted': 0, 'updated': 0, 'errors': 0}
+            for stage in self.STAGES
+        }
+        for (dimension, stat_type), value in self._stats.totals().items():
+            stats[dimension][stat_type] += value
+        return stats
+    
     def _update_stats(self, dimension: str, stat_type: str, value: int = 1):
         """
-        Thread-safe method to update stats.
+        Thread-safe method to update stats, without locking.
         
         Args:
             dimension: The dimension name (e.g., 'dim_customer')
             stat_type: The stat type (e.g., 'processed', 'inserted')
             value: Value to increment by (default: 1)
         """
-        with self._stats_lock:
-            self.stats[dimension][stat_type] += value
+        self._stats.inc((dimension, stat_type), value)
+        metrics.ETL_ROWS.inc(dimension, stat_type, amount=value)
+        if stat_type == 'processed' and self.progress:
+            self.progress.advance(value)
     
-    def run_full_etl(self) -> Dict[str, Any]:
+    @contextmanager
+    def _stage(self, name: str):
+        """
+        Run the enclosed work as a stage of the run: it is timed for the
+        metrics endpoint, attributed to the stage by the profiler and
+        reported as a stage the job is in.
+        """
+        processed = (lambda: self._stats.totals().get((name, 'processed'), 0)) if name in self.STAGES else None
+        with tracing.span(name) as stage_span, metrics.stage_timer(name, processed):
+            with self.profiler.stage(name) if self.profiler else nullcontext():
+                with self.progress.stage(name) if self.progress else nullcontext():
+                    yield
+            if processed:
+                stage_span.set_attribute('rows', processed())
+    
+    def _bind(self, fn, stage: Optional[str] = None):
+        """
+        Wrap work handed to another thread so it runs as the given stage, or
+        stays attributed to the calling thread's current stage, within the
+        calling thread's trace span.
+        """
+        if stage is not None:
+            def run_stage(*args, **kwargs):
+                with self._stage(stage):
+                    return fn(*args, **kwargs)
+            return tracing.bind(run_stage)
+        if self.profiler is None:
+            return tracing.bind(fn)
+        return tracing.bind(self.profiler.bind(fn))
+    
+    def _for_each_shard(self, extract) -> List[Any]:
+        """
+        Run an extraction against every order shard, in parallel on the ETL
+        connection pool when orders are sharded.
+        
+        Args:
+            extract: Callable taking a shard's database alias
+            
+        Returns:
+            The callable's results, in shard order
+        """
+        if len(self.shard_aliases) == 1:
+            return [extract(self.shard_aliases[0])]
+        
+        return get_pool().map(self._bind(extract), self.shard_aliases)
+    
+    def _shadowed_order_ids(self, alias: str, order_ids: Optional[List[int]] = None) -> set:
+        """
+        Order ids of a shard that an earlier shard also holds.
+        
+        order_id is only unique within a shard. The ingest skips an order_id
+        that exists on another shard, but older data may still contain one on
+        several shards; the fact is then built from the first shard's order, so
+        every run and every load path picks the same one.
+        
+        Args:
+            alias: Shard the orders are read from
+            order_ids: Restrict the lookup to these order ids (all when None)
+            
+        Returns:
+            Set of order ids to skip on this shard
+        """
+        shadowed = set()
+        for earlier in self.shard_aliases[:self.shard_aliases.index(alias)]:
+            orders = Order.objects.using(earlier)
+            if order_ids is not None:
+                orders = orders.filter(order_id__in=order_ids)
+            shadowed.update(orders.values_list('order_id', flat=True))
+        return shadowed
+    
+    def run_full_etl(self, rebuild_facts: bool = False, pipelined: Optional[bool] = None) -> Dict[str, Any]:
         """
         Run the complete ETL process for the data warehouse.
         Uses parallel processing for dimension extraction.
+        
+        Args:
+            rebuild_facts: Rebuild fact_orders blue/green in a shadow table
+                instead of updating it in place
+            pipelined: Load facts with the concurrent extract/transform/load
+                pipeline (defaults to ETL_FACT_PIPELINE_ENABLED)
         """
         logger.info("Starting full data warehouse ETL process with parallel dimension extraction")
         start_time = time_module.time()
         
         try:
-            # Extract and load dimensions in parallel using thread pool
-            with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                # Submit all dimension extraction tasks to the executor
-                dim_tasks = {
-                    'customer': executor.submit(self.extract_dim_customer),
-                    'restaurant': executor.submit(self.extract_dim_restaurant),
-                    'date': executor.submit(self.extract_dim_date),
-                    'location': executor.submit(self.extract_dim_location),
-                    'timeslot': executor.submit(self.extract_dim_timeslot),
-                    'deliveryperson': executor.submit(self.extract_dim_deliveryperson)
-                }
+            with self._stage('setup'):
+                self.etl_version = self._next_etl_version()
+                logger.info(f"Running warehouse ETL as version {self.etl_version}")
                 
-                # Wait for all tasks to complete and log results
-                for dim_name, task in dim_tasks.items():
-                    try:
-                        # This will block until the task is complete
-                        task.result()
-                        logger.info(f"Dimension extraction for {dim_name} completed successfully")
-                    except Exception as e:
-                        logger.error(f"Error extracting dimension {dim_name}: {str(e)}")
-                        raise
+                self.oltp_alias = read_replica_for(reference_alias())
+                self.shard_aliases = [read_replica_for(alias) for alias in get_shard_aliases()]
+                logger.info(f"Extracting OLTP data from {', '.join(self.shard_aliases)}")
+            
+            # Extract and load dimensions in parallel on the ETL connection pool,
+            # whose worker threads keep their database connections between runs
+            pool = get_pool()
+            dim_tasks = {
+                'customer': pool.submit(self._bind(self.extract_dim_customer, 'dim_customer')),
+                'restaurant': pool.submit(self._bind(self.extract_dim_restaurant, 'dim_restaurant')),
+                'date': pool.submit(self._bind(self.extract_dim_date, 'dim_date')),
+                'location': pool.submit(self._bind(self.extract_dim_location, 'dim_location')),
+                'timeslot': pool.submit(self._bind(self.extract_dim_timeslot, 'dim_timeslot')),
+                'deliveryperson': pool.submit(self._bind(self.extract_dim_deliveryperson, 'dim_deliveryperson'))
+            }
+            
+            # Wait for all tasks to complete and log results
+            for dim_name, task in dim_tasks.items():
+                try:
+                    # This will block until the task is complete
+                    task.result()
+                    logger.info(f"Dimension extraction for {dim_name} completed successfully")
+                except Exception as e:
+                    logger.error(f"Error extracting dimension {dim_name}: {str(e)}")
+                    raise
+            
+            # Make sure every month the fact load can write to has its own partition
+            with self._stage('fact_partitions'):
+                self.prepare_fact_partitions()
             
             # Then extract and load facts (this must run after all dimensions are loaded)
-            self.extract_fact_orders()
+            if pipelined is None:
+                pipelined = getattr(settings, 'ETL_FACT_PIPELINE_ENABLED', False)
+            with self._stage('fact_orders'):
+                if rebuild_facts:
+                    self.rebuild_fact_orders()
+                elif pipelined:
+                    self.extract_fact_orders_pipelined()
+                else:
+                    self.extract_fact_orders()
+            
+            # Every fact row of this version is written: release it to delta exports
+            # and the DuckDB mirror
+            self._finish_etl_version('committed')
+            
+            # Rebuild the aggregate sketches of every cell touched by the fact load
+            with self._stage('fact_order_sketches'):
+                self.build_order_sketches()
+            
+            # Publish a fresh columnar snapshot for in-process analytics
+            with self._stage('columnar_snapshot'):
+                self.publish_columnar_snapshot()
+            
+            # Copy the changed rows into the DuckDB mirror; a rebuild can drop
+            # rows, which only a full refresh picks up
+            with self._stage('duckdb_mirror'):
+                self.refresh_duckdb_mirror(full=rebuild_facts)
             
             end_time = time_module.time()
             total_time = end_time - start_time
             logger.info(f"Data warehouse ETL completed in {total_time:.2f} seconds")
             
+            metrics.ETL_RUNS.inc('warehouse', 'completed')
+            metrics.REGISTRY.publish(force=True)
             return self.stats
             
         except Exception as e:
             logger.error(f"Error in data warehouse ETL process: {str(e)}")
+            self._finish_etl_version('failed')
+            metrics.ETL_RUNS.inc('warehouse', 'failed')
+            metrics.REGISTRY.publish(force=True)
             raise
             self.extract_fact_orders()
             
@@ -109,7 +271,15 @@ class DataWarehouseETL:
         logger.info("Extracting customer dimension")
         start_time = time_module.time()
         
-        customers = Customer.objects.using('default').all()
+        self._for_each_shard(self._extract_dim_customer_from)
+        
+        end_time = time_module.time()
+        elapsed = end_time - start_time
+        logger.info(f"Customer dimension extraction completed in {elapsed:.2f} seconds")
+    
+    def _extract_dim_customer_from(self, alias: str):
+        """Load the customers of one order shard into the customer dimension."""
+        customers = Customer.objects.using(alias).all()
         
         for customer in customers:
             self._update_stats('dim_customer', 'processed')
@@ -145,17 +315,13 @@ class DataWarehouseETL:
             except Exception as e:
                 self._update_stats('dim_customer', 'errors')
                 logger.error(f"Error processing customer {customer.customer_id}: {str(e)}")
-        
-        end_time = time_module.time()
-        elapsed = end_time - start_time
-        logger.info(f"Customer dimension extraction completed in {elapsed:.2f} seconds")
     
     def extract_dim_restaurant(self):
         """Extract restaurant dimension from OLTP."""
         logger.info("Extracting restaurant dimension")
         start_time = time_module.time()
         
-        restaurants = Restaurant.objects.using('default').all()
+        restaurants = Restaurant.objects.using(self.oltp_alias).all()
         
         for restaurant in restaurants:
             self._update_stats('dim_restaurant', 'processed')
@@ -200,13 +366,15 @@ class DataWarehouseETL:
         logger.info("Extracting date dimension")
         start_time = time_module.time()
         
-        # Get unique order dates from orders
-        order_dates = Order.objects.using('default').values_list(
-            'customer__registration_date', flat=True
-        ).distinct()
+        # Get unique order dates from the orders of every shard
+        order_dates = itertools.chain.from_iterable(self._for_each_shard(
+            lambda alias: list(Order.objects.using(alias).values_list(
+                'customer__registration_date', flat=True
+            ).distinct())
+        ))
         
         # Also include restaurant establishment dates
-        restaurant_dates = Restaurant.objects.using('default').values_list(
+        restaurant_dates = Restaurant.objects.using(self.oltp_alias).values_list(
             'established_date', flat=True
         ).distinct()
         
@@ -252,13 +420,15 @@ class DataWarehouseETL:
         logger.info("Extracting location dimension")
         start_time = time_module.time()
         
-        # Get unique locations from customers
-        customer_locations = Customer.objects.using('default').values(
-            'city', 'address'
-        ).distinct()
+        # Get unique locations from the customers of every shard
+        customer_locations = itertools.chain.from_iterable(self._for_each_shard(
+            lambda alias: list(Customer.objects.using(alias).values(
+                'city', 'address'
+            ).distinct())
+        ))
         
         # Get unique locations from restaurants  
-        restaurant_locations = Restaurant.objects.using('default').values(
+        restaurant_locations = Restaurant.objects.using(self.oltp_alias).values(
             'city', 'address'
         ).distinct()
         
@@ -306,13 +476,13 @@ class DataWarehouseETL:
                     )
                     
                     if created:
-                        self.stats['dim_location']['inserted'] += 1
+                        self._update_stats('dim_location', 'inserted')
                         location_id += 1
                     
                     processed_locations.add(loc['city'])
                     
                 except Exception as e:
-                    self.stats['dim_location']['errors'] += 1
+                    self._update_stats('dim_location', 'errors')
                     logger.error(f"Error processing location {loc}: {str(e)}")
     
     def extract_dim_timeslot(self):
@@ -330,7 +500,7 @@ class DataWarehouseETL:
         ]
         
         for i, slot_data in enumerate(time_slots, 1):
-            self.stats['dim_timeslot']['processed'] += 1
+            self._update_stats('dim_timeslot', 'processed')
             try:
                 dim_timeslot, created = DimTimeslot.objects.using('olapdb').get_or_create(
                     time_slot_id=i,
@@ -338,20 +508,20 @@ class DataWarehouseETL:
                 )
                 
                 if created:
-                    self.stats['dim_timeslot']['inserted'] += 1
+                    self._update_stats('dim_timeslot', 'inserted')
                     
             except Exception as e:
-                self.stats['dim_timeslot']['errors'] += 1
+                self._update_stats('dim_timeslot', 'errors')
                 logger.error(f"Error processing time slot {slot_data}: {str(e)}")
     
     def extract_dim_deliveryperson(self):
         """Extract delivery person dimension from OLTP."""
         logger.info("Extracting delivery person dimension")
         
-        delivery_persons = DeliveryPerson.objects.using('default').all()
+        delivery_persons = DeliveryPerson.objects.using(self.oltp_alias).all()
         
         for dp in delivery_persons:
-            self.stats['dim_deliveryperson']['processed'] += 1
+            self._update_stats('dim_deliveryperson', 'processed')
             try:
                 # Calculate tenure in months
                 tenure_months = self._calculate_tenure_months(dp.hire_date)
@@ -366,17 +536,17 @@ class DataWarehouseETL:
                 )
                 
                 if created:
-                    self.stats['dim_deliveryperson']['inserted'] += 1
+                    self._update_stats('dim_deliveryperson', 'inserted')
                 else:
                     # Update tenure months
                     new_tenure = self._calculate_tenure_months(dp.hire_date)
                     if dim_dp.tenure_months != new_tenure:
                         dim_dp.tenure_months = new_tenure
                         dim_dp.save(using='olapdb')
-                        self.stats['dim_deliveryperson']['updated'] += 1
+                        self._update_stats('dim_deliveryperson', 'updated')
                         
             except Exception as e:
-                self.stats['dim_deliveryperson']['errors'] += 1
+                self._update_stats('dim_deliveryperson', 'errors')
                 logger.error(f"Error processing delivery person {dp.delivery_person_id}: {str(e)}")
     
     def extract_fact_orders(self):
@@ -387,64 +557,44 @@ class DataWarehouseETL:
         logger.info("Extracting fact orders")
         start_time = time_module.time()
         
-        orders = Order.objects.using('default').select_related(
+        if self.etl_version is None:
+            self.etl_version = self._next_etl_version()
+        
+        # Archived orders are frozen in cold storage and must not reappear in the hot table
+        archived_order_ids = set(
+            FactOrdersArchive.objects.using('olapdb').values_list('order_id', flat=True)
+        )
+        
+        self._for_each_shard(lambda alias: self._extract_fact_orders_from(alias, archived_order_ids))
+        
+        end_time = time_module.time()
+        elapsed = end_time - start_time
+        logger.info(f"Fact orders extraction completed in {elapsed:.2f} seconds")
+    
+    def _extract_fact_orders_from(self, alias: str, archived_order_ids: set):
+        """Upsert the fact rows of one order shard."""
+        orders = Order.objects.using(alias).select_related(
             'customer', 'restaurant', 'day', 'delivery_person'
         ).all()
+        shadowed_order_ids = self._shadowed_order_ids(alias)
         
         for order in orders:
             self._update_stats('fact_orders', 'processed')
+            if order.order_id in archived_order_ids or order.order_id in shadowed_order_ids:
+                continue
             try:
-                # Get dimension keys
-                customer_dim = DimCustomer.objects.using('olapdb').filter(
-                    customer_id=order.customer.customer_id
-                ).first()
-                
-                restaurant_dim = DimRestaurant.objects.using('olapdb').filter(
-                    restaurant_id=order.restaurant.restaurant_id
-                ).first()
-                
-                delivery_person_dim = DimDeliveryPerson.objects.using('olapdb').filter(
-                    delivery_person_id=order.delivery_person.delivery_person_id if order.delivery_person else None
-                ).first()
-                
-                # Create synthetic date and time for the order
-                order_date = self._generate_order_date(order)
-                date_id = int(order_date.strftime('%Y%m%d'))
-                date_dim = DimDate.objects.using('olapdb').filter(date_id=date_id).first()
-                
-                # Get location and time slot
-                location_dim = self._get_location_for_order(order)
-                time_slot_dim = self._get_timeslot_for_order(order)
-                
-                if not all([customer_dim, restaurant_dim, date_dim, location_dim, time_slot_dim, delivery_person_dim]):
+                order_data = self._build_fact_data(order)
+                if order_data is None:
                     logger.warning(f"Missing dimension data for order {order.order_id}")
                     continue
-                
-                # Calculate total time
-                total_time = (order.food_preparation_time or 0) + (order.delivery_time or 0)
-                
-                # Prepare order data
-                order_data = {
-                    'customer': customer_dim,
-                    'restaurant': restaurant_dim,
-                    'delivery_person': delivery_person_dim,
-                    'date': date_dim,
-                    'location': location_dim,
-                    'time_slot': time_slot_dim,
-                    'order_date': order_date,
-                    'order_time': self._generate_order_time(order),
-                    'order_cost': order.cost_of_the_order,
-                    'rating': order.rating,
-                    'food_preparation_time': order.food_preparation_time,
-                    'delivery_time': order.delivery_time,
-                    'total_time': total_time
-                }
+                cell = (order_data['restaurant'].restaurant_id, order_data['date'].date_id)
                 
                 # Try to get the existing fact record
                 try:
                     fact_order = FactOrders.objects.using('olapdb').get(order_id=order.order_id)
                     
                     # Update with new values if record exists
+                    previous_cell = (fact_order.restaurant_id, fact_order.date_id)
                     updated = False
                     for field, value in order_data.items():
                         if getattr(fact_order, field) != value:
@@ -452,26 +602,378 @@ class DataWarehouseETL:
                             updated = True
                     
                     if updated:
+                        fact_order.etl_version = self.etl_version
+                        fact_order.updated_at = timezone.now()
                         fact_order.save(using='olapdb')
                         self._update_stats('fact_orders', 'updated')
+                        self._touched_cells.add(previous_cell)
+                        self._touched_cells.add(cell)
                     
                 except FactOrders.DoesNotExist:
                     # Create new record if it doesn't exist
                     fact_order = FactOrders.objects.using('olapdb').create(
                         order_id=order.order_id,
+                        etl_version=self.etl_version,
+                        updated_at=timezone.now(),
                         **order_data
                     )
                     self._update_stats('fact_orders', 'inserted')
+                    self._touched_cells.add(cell)
                     
             except Exception as e:
                 self._update_stats('fact_orders', 'errors')
                 logger.error(f"Error processing order {order.order_id}: {str(e)}")
+    
+    def extract_fact_orders_pipelined(self):
+        """
+        Extract fact orders with overlapping extract, transform and load
+        stages (see etl.pipeline), upserting the same rows as extract_fact_orders.
+        """
+        logger.info("Extracting fact orders through the pipeline")
+        
+        if self.etl_version is None:
+            self.etl_version = self._next_etl_version()
+        
+        self.pipeline_stats = FactOrdersPipeline(
+            self,
+            chunk_size=getattr(settings, 'ETL_PIPELINE_CHUNK_SIZE', 1000),
+            queue_size=getattr(settings, 'ETL_PIPELINE_QUEUE_SIZE', 4)
+        ).run()
+    
+    def rebuild_fact_orders(self, batch_size: int = 2000):
+        """
+        Rebuild fact_orders blue/green: load every fact into fact_orders_next,
+        build its indexes and atomically swap it in.
+        
+        Dashboards keep reading the complete previous table until the swap.
+        Rows whose values did not change keep their etl_version, so delta
+        exports only pick up real changes.
+        """
+        logger.info("Rebuilding fact orders into a shadow table")
+        start_time = time_module.time()
+        
+        if self.etl_version is None:
+            self.etl_version = self._next_etl_version()
+        
+        connection = connections['olapdb']
+        fields = FactOrders._meta.concrete_fields
+        compared = [field.attname for field in fields if field.attname not in ('order_id', 'etl_version', 'updated_at')]
+        
+        archived_order_ids = set(
+            FactOrdersArchive.objects.using('olapdb').values_list('order_id', flat=True)
+        )
+        loaded_order_ids = set()
+        
+        def flush(batch):
+            live_rows = {
+                row['order_id']: row
+                for row in FactOrders.objects.using('olapdb').filter(
+                    order_id__in=[values['order_id'] for values in batch]
+                ).values(*[field.attname for field in fields])
+            }
+            rows = []
+            for values in batch:
+                live = live_rows.get(values['order_id'])
+                cell = (values['restaurant_id'], values['date_id'])
+                if live is not None and all(live[name] == values[name] for name in compared):
+                    values['etl_version'] = live['etl_version']
+                    values['updated_at'] = live['updated_at']
+                else:
+                    values['etl_version'] = self.etl_version
+                    values['updated_at'] = timezone.now()
+                    self._touched_cells.add(cell)
+                    if live is None:
+                        self._update_stats('fact_orders', 'inserted')
+                    else:
+                        self._update_stats('fact_orders', 'updated')
+                        self._touched_cells.add((live['restaurant_id'], live['date_id']))
+                rows.append([
+                    field.get_db_prep_save(values[field.attname], connection) for field in fields
+                ])
+            rebuild.insert_rows(rows)
+        
+        def load_shard(alias):
+            orders = Order.objects.using(alias).select_related(
+                'customer', 'restaurant', 'day', 'delivery_person'
+            ).iterator(chunk_size=batch_size)
+            shadowed_order_ids = self._shadowed_order_ids(alias)
+            
+            batch = []
+            for order in orders:
+                self._update_stats('fact_orders', 'processed')
+                if order.order_id in archived_order_ids or order.order_id in shadowed_order_ids:
+                    continue
+                try:
+                    order_data = self._build_fact_data(order)
+                    if order_data is None:
+                        logger.warning(f"Missing dimension data for order {order.order_id}")
+                        continue
+                    
+                    values = {'order_id': order.order_id}
+                    for field in fields:
+                        if field.name in order_data:
+                            value = order_data[field.name]
+                            values[field.attname] = value.pk if field.is_relation else value
+                    batch.append(values)
+                    loaded_order_ids.add(order.order_id)
+                except Exception as e:
+                    self._update_stats('fact_orders', 'errors')
+                    logger.error(f"Error processing order {order.order_id}: {str(e)}")
+                
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            flush(batch)
+        
+        index_definitions = rebuild.create_shadow_table()
+        try:
+            self._for_each_shard(load_shard)
+            
+            # Facts of orders that no longer exist disappear with the swap
+            for order_id, restaurant_id, date_id in FactOrders.objects.using('olapdb').values_list(
+                'order_id', 'restaurant_id', 'date_id'
+            ).iterator(chunk_size=batch_size):
+                if order_id not in loaded_order_ids:
+                    self._touched_cells.add((restaurant_id, date_id))
+            
+            rebuild.build_indexes(index_definitions)
+            rebuild.swap()
+        except Exception:
+            rebuild.drop_shadow_table()
+            raise
         
         end_time = time_module.time()
         elapsed = end_time - start_time
-        logger.info(f"Fact orders extraction completed in {elapsed:.2f} seconds")
+        logger.info(f"Fact orders rebuild completed in {elapsed:.2f} seconds")
+    
+    def _build_fact_data(self, order, dimensions: Optional[Dict[str, Dict[Any, Any]]] = None):
+        """
+        Resolve the dimension keys and measures of an OLTP order.
+        
+        Args:
+            order: OLTP order with its customer, restaurant and delivery person loaded
+            dimensions: Prefetched dimension rows by dimension name ('customer',
+                'restaurant', 'delivery_person', 'date', 'location', 'time_slot')
+                and key; dimensions are queried one by one when not given
+        
+        Returns:
+            Dictionary of FactOrders field values, or None if a dimension is missing
+        """
+        # Create synthetic date and time for the order
+        order_date = self._generate_order_date(order)
+        date_id = int(order_date.strftime('%Y%m%d'))
+        delivery_person_id = order.delivery_person.delivery_person_id if order.delivery_person else None
+        
+        if dimensions is not None:
+            customer_dim = dimensions['customer'].get(order.customer.customer_id)
+            restaurant_dim = dimensions['restaurant'].get(order.restaurant.restaurant_id)
+            delivery_person_dim = dimensions['delivery_person'].get(delivery_person_id)
+            date_dim = dimensions['date'].get(date_id)
+            location_dim = dimensions['location'].get(order.customer.city) or self._get_location_for_order(order)
+            time_slot_dim = dimensions['time_slot'].get(self._timeslot_id_for_order(order))
+        else:
+            # Get dimension keys
+            customer_dim = DimCustomer.objects.using('olapdb').filter(
+                customer_id=order.customer.customer_id
+            ).first()
+
+            restaurant_dim = DimRestaurant.objects.using('olapdb').filter(
+                restaurant_id=order.restaurant.restaurant_id
+            ).first()
+
+            delivery_person_dim = DimDeliveryPerson.objects.using('olapdb').filter(
+                delivery_person_id=delivery_person_id
+            ).first()
+
+            date_dim = DimDate.objects.using('olapdb').filter(date_id=date_id).first()
+
+            # Get location and time slot
+            location_dim = self._get_location_for_order(order)
+            time_slot_dim = self._get_timeslot_for_order(order)
+
+        if not all([customer_dim, restaurant_dim, date_dim, location_dim, time_slot_dim, delivery_person_dim]):
+            return None
+
+        # Calculate total time
+        total_time = (order.food_preparation_time or 0) + (order.delivery_time or 0)
+
+        # Prepare order data
+        return {
+            'customer': customer_dim,
+            'restaurant': restaurant_dim,
+            'delivery_person': delivery_person_dim,
+            'date': date_dim,
+            'location': location_dim,
+            'time_slot': time_slot_dim,
+            'order_date': order_date,
+            'order_time': self._generate_order_time(order),
+            'order_cost': order.cost_of_the_order,
+            'rating': order.rating,
+            'food_preparation_time': order.food_preparation_time,
+            'delivery_time': order.delivery_time,
+            'total_time': total_time
+        }
+    
+    def prepare_fact_partitions(self):
+        """
+        Create fact_orders partitions ahead of the load when the table is partitioned.
+        
+        Facts can only reference loaded DimDate rows, so the latest date_id
+        bounds the months this run can write to.
+        """
+        try:
+            if not partitioning.is_partitioned():
+                return
+            
+            latest_date_id = DimDate.objects.using('olapdb').aggregate(latest=Max('date_id'))['latest']
+            created = partitioning.ensure_partitions(
+                through_date_id=latest_date_id,
+                months_ahead=getattr(settings, 'ETL_FACT_PARTITION_MONTHS_AHEAD', 3)
+            )
+            if created:
+                logger.info(f"Created fact_orders partitions: {', '.join(created)}")
+        except Exception as e:
+            # Rows for missing months still land in the MAXVALUE partition
+            logger.error(f"Error creating fact_orders partitions: {str(e)}")
+    
+    def build_order_sketches(self, batch_size: int = 200):
+        """
+        Build quantile and distinct-count sketches per restaurant and day.
+        
+        Only cells touched by the current fact load are rebuilt, each from all
+        of its fact rows, so the stored sketches always describe the full cell.
+        A cell on a day that was already archived (etl.archival) is rebuilt
+        from its archived rows as well as its hot rows.
+        """
+        logger.info("Building fact order sketches")
+        start_time = time_module.time()
+        
+        cells = sorted(self._touched_cells)
+        if not cells and self.etl_version is not None:
+            cells = sorted(set(
+                FactOrders.objects.using('olapdb').filter(
+                    etl_version=self.etl_version
+                ).values_list('restaurant_id', 'date_id').distinct()
+            ))
+        
+        boundary = archival.archive_boundary()
+        
+        for offset in range(0, len(cells), batch_size):
+            batch = cells[offset:offset + batch_size]
+            sketches = {
+                cell: {
+                    'count': 0,
+                    'delivery': TDigest(),
+                    'preparation': TDigest(),
+                    'customers': HyperLogLog()
+                }
+                for cell in batch
+            }
+            
+            restaurant_ids = {restaurant_id for restaurant_id, _ in batch}
+            date_ids = {date_id for _, date_id in batch}
+            models = [FactOrders]
+            if boundary is not None and min(date_ids) <= boundary:
+                models.append(FactOrdersArchive)
+            rows = itertools.chain.from_iterable(
+                model.objects.using('olapdb').filter(
+                    restaurant_id__in=restaurant_ids, date_id__in=date_ids
+                ).values_list(
+                    'restaurant_id', 'date_id', 'customer_id', 'delivery_time', 'food_preparation_time'
+                ).iterator()
+                for model in models
+            )
+            for restaurant_id, date_id, customer_id, delivery_time, preparation_time in rows:
+                sketch = sketches.get((restaurant_id, date_id))
+                if sketch is None:
+                    # Cross product of the IN lists can pick up untouched cells
+                    continue
+                sketch['count'] += 1
+                sketch['delivery'].add(delivery_time)
+                sketch['preparation'].add(preparation_time)
+                sketch['customers'].add(customer_id)
+            
+            for (restaurant_id, date_id), sketch in sketches.items():
+                self._update_stats('fact_order_sketches', 'processed')
+                try:
+                    if sketch['count'] == 0:
+                        FactOrderSketch.objects.using('olapdb').filter(
+                            restaurant_id=restaurant_id, date_id=date_id
+                        ).delete()
+                        continue
+                    
+                    _, created = FactOrderSketch.objects.using('olapdb').update_or_create(
+                        restaurant_id=restaurant_id,
+                        date_id=date_id,
+                        defaults={
+                            'order_count': sketch['count'],
+                            'delivery_time_digest': sketch['delivery'].to_json(),
+                            'preparation_time_digest': sketch['preparation'].to_json(),
+                            'customer_hll': sketch['customers'].to_json(),
+                            'etl_version': self.etl_version or 0
+                        }
+                    )
+                    self._update_stats('fact_order_sketches', 'inserted' if created else 'updated')
+                    
+                except Exception as e:
+                    self._update_stats('fact_order_sketches', 'errors')
+                    logger.error(f"Error building sketch for cell {restaurant_id}/{date_id}: {str(e)}")
+        
+        self._touched_cells = set()
+        
+        end_time = time_module.time()
+        elapsed = end_time - start_time
+        logger.info(f"Fact order sketches built in {elapsed:.2f} seconds")
+    
+    def publish_columnar_snapshot(self):
+        """Export the memory-mapped columnar snapshot read by the analytics views."""
+        if not columnar.is_enabled():
+            return
+        
+        try:
+            columnar.export_snapshot(version=self.etl_version)
+        except Exception as e:
+            # Readers keep using the previous snapshot; the warehouse itself is loaded
+            logger.error(f"Error publishing columnar snapshot: {str(e)}")
+    
+    def refresh_duckdb_mirror(self, full: bool = False):
+        """Refresh the DuckDB mirror read by analytics, exports and the SQL console."""
+        if not duckdb_mirror.is_enabled():
+            return
+        
+        try:
+            duckdb_mirror.refresh_mirror(full=full)
+        except Exception as e:
+            # The previous mirror file stays in place; the warehouse itself is loaded
+            logger.error(f"Error refreshing DuckDB mirror: {str(e)}")
     
     # Helper methods
+    def _next_etl_version(self):
+        """Allocate the change watermark for fact rows written by this run (one WarehouseRun row)."""
+        runs = WarehouseRun.objects.using('olapdb')
+        if not runs.exists():
+            # Continue after the versions stamped before runs were recorded
+            current = FactOrders.objects.using('olapdb').aggregate(
+                version=Max('etl_version')
+            )['version']
+            try:
+                return runs.create(version=(current or 0) + 1).version
+            except IntegrityError:
+                # A concurrent first run took that version
+                pass
+        return runs.create().version
+    
+    def _finish_etl_version(self, status: str):
+        """Mark this run's version committed or failed, once its fact rows are written."""
+        if self.etl_version is None:
+            return
+        try:
+            WarehouseRun.objects.using('olapdb').filter(version=self.etl_version, status='running').update(
+                status=status, finished_at=timezone.now()
+            )
+        except Exception as e:
+            logger.error(f"Error finishing warehouse run {self.etl_version}: {str(e)}")
+    
     def _determine_customer_segment(self, registration_date):
         """Determine customer segment based on registration date."""
         if not registration_date:
@@ -546,18 +1048,23 @@ class DataWarehouseETL:
             return 'Neighborhood'
     
     def _generate_order_date(self, order):
-        """Generate a synthetic order date."""
+        """
+        Generate a synthetic order date.
+        
+        The offset is seeded by order_id, so every ETL run stamps an order with
+        the same date and unchanged facts are not rewritten.
+        """
         # Use customer registration date as base and add some days
         base_date = order.customer.registration_date or timezone.now().date()
-        import random
-        days_offset = random.randint(0, 365)
+        days_offset = random.Random(order.order_id).randint(0, 365)
         return base_date + timezone.timedelta(days=days_offset)
     
     def _generate_order_time(self, order):
-        """Generate a synthetic order time."""
-        import random
-        hour = random.randint(8, 23)
-        minute = random.randint(0, 59)
+        """Generate a synthetic order time, seeded by order_id like the order date."""
+        # Separate stream from the date offset so the two are not correlated
+        rng = random.Random(f"time:{order.order_id}")
+        hour = rng.randint(8, 23)
+        minute = rng.randint(0, 59)
         return time(hour, minute)
     
     def _get_location_for_order(self, order):
@@ -583,12 +1090,16 @@ class DataWarehouseETL:
     
     def _get_timeslot_for_order(self, order):
         """Get time slot dimension for order."""
+        return DimTimeslot.objects.using('olapdb').filter(time_slot_id=self._timeslot_id_for_order(order)).first()
+    
+    def _timeslot_id_for_order(self, order) -> int:
+        """Time slot of an order."""
         # Simple heuristic - use food preparation time to determine slot
         prep_time = order.food_preparation_time or 30
         
         if prep_time < 20:
-            return DimTimeslot.objects.using('olapdb').filter(time_slot_id=1).first()  # Early Morning
+            return 1  # Early Morning
         elif prep_time < 30:
-            return DimTimeslot.objects.using('olapdb').filter(time_slot_id=3).first()  # Lunch
+            return 3  # Lunch
         else:
-            return DimTimeslot.objects.using('olapdb').filter(time_slot_id=5).first()  # Dinner
+            return 5  # Dinner